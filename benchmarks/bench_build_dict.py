@@ -0,0 +1,100 @@
+"""
+Benchmarks the grouping engine behind fund_report.build_dict against the original DataFrame.iterrows
+implementation and checks that both produce identical dictionaries.
+
+To Run:
+python -m benchmarks.bench_build_dict --sizes 10000 1000000 10000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from reporter.services.fund_report import build_dict
+
+
+def legacy_build_dict(data):
+    """original row by row implementation of build_dict, kept as the reference for the benchmark"""
+    payment_data = {}
+    for index, row in data['payments'].iterrows():
+        pledge = row['usergiftid_pledge']
+        fund = row['fund']
+        if pledge not in payment_data.keys():
+            payment_data.update({pledge: []})
+        if fund not in payment_data[pledge]:
+            payment_data[pledge].append(fund)
+
+    pledge_data = {}
+    for index, row in data['pledge_data'].iterrows():
+        giftid = row['gift_id']
+        fund = row['fund_id']
+        if giftid not in pledge_data.keys():
+            pledge_data.update({giftid: []})
+        if fund not in pledge_data[giftid]:
+            pledge_data[giftid].append(fund)
+
+    return {'payment_dict': payment_data,
+            'pledge_dict': pledge_data,
+            'dfs': data}
+
+
+def make_data(rows, funds=50, seed=0):
+    """
+    Builds cleaned payment and pledge frames shaped like the output of fund_report.clean_data.
+    :param rows: number of payment rows
+    :param funds: number of distinct funds
+    :param seed: random seed
+    :return: dict of payments and pledge_data dataframes
+    """
+    rng = np.random.RandomState(seed)
+    gifts = max(rows // 10, 1)
+    fund_names = np.array(['fund {}'.format(i) for i in range(funds)], dtype=object)
+    gift_ids = np.array(['ug{}'.format(i) for i in range(gifts)], dtype=object)
+
+    payments = pd.DataFrame({'usergiftid_pledge': gift_ids[rng.randint(0, gifts, rows)],
+                             'paymentid': ['p{}'.format(i) for i in rng.randint(0, rows, rows)],
+                             'fund': fund_names[rng.randint(0, funds, rows)]})
+    pledge_rows = max(rows // 5, 1)
+    pledge = pd.DataFrame({'gift_id': gift_ids[rng.randint(0, gifts, pledge_rows)],
+                           'fund_id': fund_names[rng.randint(0, funds, pledge_rows)]})
+
+    return {'payments': payments, 'pledge_data': pledge}
+
+
+def timed(func, data):
+    start = time.perf_counter()
+    result = func(data)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='build_dict benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 1000000, 10000000],
+                        help='payment row counts to benchmark'),
+    parser.add_argument('--funds', type=int, default=50,
+                        help='number of distinct funds'),
+    parser.add_argument('--legacy-limit', type=int, default=1000000,
+                        help='skip the iterrows implementation above this many rows'),
+    args = parser.parse_args()
+
+    print('{:>12} {:>12} {:>12} {:>10}'.format('rows', 'legacy (s)', 'grouped (s)', 'speedup'))
+    for size in args.sizes:
+        data = make_data(size, args.funds)
+        grouped_time, grouped = timed(build_dict.run, data)
+
+        if size > args.legacy_limit:
+            print('{:>12} {:>12} {:>12.3f} {:>10}'.format(size, 'skipped', grouped_time, '-'))
+            continue
+
+        legacy_time, legacy = timed(legacy_build_dict, data)
+        vocabulary = grouped['vocabulary']
+        for key, groups in (('payment_dict', 'payment_groups'), ('pledge_dict', 'pledge_groups')):
+            decoded = grouped[groups].to_dict(vocabulary['gifts'], vocabulary['funds'])
+            if legacy[key] != decoded or list(legacy[key]) != list(decoded):
+                raise AssertionError('{} differs from the legacy implementation at {} rows'.format(key, size))
+
+        print('{:>12} {:>12.3f} {:>12.3f} {:>9.1f}x'.format(size, legacy_time, grouped_time,
+                                                            legacy_time / grouped_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmarks the fund set comparison behind the first pass of fund_report against the original implementation, which
+looked every fund up in python lists and deduplicated the flagged usergiftids with a quadratic loop, and checks that
+both flag the same usergiftids in the same order. Up to 64 funds the fund sets are compared as bitmasks, above that as
+sorted pair codes, --funds picks the path.
+
+To Run:
+python -m benchmarks.bench_first_pass --sizes 10000 1000000 --funds 50
+python -m benchmarks.bench_first_pass --sizes 10000 1000000 --funds 200
+"""
+import argparse
+import time
+from benchmarks.bench_build_dict import make_data
+from reporter.services import fund_report
+from reporter.services.fund_report import build_dict
+
+
+def legacy_first_pass(pledge_data, payment_data):
+    """original first pass over the fund dictionaries, kept as the reference for the benchmark"""
+    not_exist = []
+    pledge_results = []
+    for ugi, fund in pledge_data.items():
+        if len(fund) > 1:
+            try:
+                payment_funds = payment_data[ugi]
+                for i in fund:
+                    if i not in payment_funds:
+                        pledge_results.append(ugi)
+            except KeyError:
+                not_exist.append(ugi)
+
+    not_exist_ = []
+    payment_results = []
+    payment_results_u = []
+    for ugi, fund in payment_data.items():
+        if len(fund) > 1:
+            try:
+                pledge_funds = pledge_data[ugi]
+                for i in fund:
+                    if i not in pledge_funds:
+                        payment_results.append(ugi)
+            except KeyError:
+                not_exist_.append(ugi)
+
+    for x in payment_results:
+        if x not in payment_results_u:
+            payment_results_u.append(x)
+
+    return {'pledge_results': pledge_results, 'not_exist': not_exist,
+            'payment_results': payment_results_u, 'not_exist_': not_exist_}
+
+
+def first_pass(build):
+    # both directions come out of one pass, renamed to the keys of the original implementation
+    results = fund_report.first_pass.run(build)
+    return {'pledge_results': results['pledge_unmatched'], 'not_exist': results['pledge_not_exist'],
+            'payment_results': results['unmatched'], 'not_exist_': results['not_exist']}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='first pass benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 1000000],
+                        help='payment row counts to benchmark'),
+    parser.add_argument('--funds', type=int, default=50,
+                        help='number of distinct funds, bitmasks are used up to 64'),
+    parser.add_argument('--legacy-limit', type=int, default=1000000,
+                        help='skip the list based implementation above this many rows'),
+    args = parser.parse_args()
+
+    print('{:>12} {:>12} {:>12} {:>10}'.format('rows', 'legacy (s)', 'kernel (s)', 'speedup'))
+    for size in args.sizes:
+        build = build_dict.run(make_data(size, args.funds))
+        kernel_time, kernel = timed(first_pass, build)
+
+        if size > args.legacy_limit:
+            print('{:>12} {:>12} {:>12.3f} {:>10}'.format(size, 'skipped', kernel_time, '-'))
+            continue
+
+        gifts, funds = build['vocabulary']['gifts'], build['vocabulary']['funds']
+        legacy_time, legacy = timed(legacy_first_pass, build['pledge_groups'].to_dict(gifts, funds),
+                                    build['payment_groups'].to_dict(gifts, funds))
+        for key, codes in kernel.items():
+            if legacy[key] != gifts.decode(codes).tolist():
+                raise AssertionError('{} differs from the legacy implementation at {} rows'.format(key, size))
+
+        print('{:>12} {:>12.3f} {:>12.3f} {:>9.1f}x'.format(size, legacy_time, kernel_time,
+                                                            legacy_time / kernel_time))
+
+
+if __name__ == '__main__':
+    main()
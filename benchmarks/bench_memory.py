@@ -0,0 +1,142 @@
+"""
+Checks the memory of the large file modes of both reports against the in-memory mode. Every run happens in a fresh
+subprocess, which measures how much its peak RSS grows over the RSS it has once the modules are imported:
+- chunked (--chunksize): the raw exports are never held whole, only the cleaned columns of every row. This takes the
+standard comparison well under its in-memory peak, but still grows with the number of rows, and does not help the fund
+analysis, which only loads its key columns to begin with.
+- sharded (--shards, one shard per --shard-rows rows, one worker): only a chunk, the key index and one shard are held at
+a time, so the peak stays under the ceiling whatever the size of the exports.
+Fails if a mode reports differently from the in-memory mode or if a sharded peak is above the ceiling.
+
+To Run:
+python -m benchmarks.bench_memory --rows 2000000 --chunksize 100000 --ceiling-mb 200
+"""
+import argparse
+import glob
+import hashlib
+import json
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+from benchmarks.synthetic import write_fund_exports, write_compare_exports
+
+# rows per shard of the sharded runs, the shard count grows with the exports so a shard stays the same size
+SHARD_ROWS = 50000
+
+
+def rss_mb(key):
+    """
+    :param key: VmRSS for the current RSS or VmHWM for the peak RSS
+    :return: megabytes, from /proc/self/status where there is one, otherwise the peak RSS from getrusage
+    """
+    try:
+        with open('/proc/self/status') as f:
+            return int(re.search(r'{}:\s+(\d+) kB'.format(key), f.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        # kilobytes on linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2)
+
+
+def reset_peak():
+    """
+    Resets the peak RSS of the process to its current RSS, so the peak measures the run only and not the imports or
+    the RSS inherited from the parent process.
+    :return: True when the peak could be reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def child(report, files, chunksize, shards):
+    """runs one report in this process and prints the growth of its peak RSS and a digest of its reports"""
+    from reporter.services import fund_report, data_compare
+
+    reset_peak()
+    base = rss_mb('VmRSS')
+    with tempfile.TemporaryDirectory() as directory:
+        service = fund_report if report == 'fund_analysis' else data_compare
+        service.run({'file1': str(files[0]), 'file2': str(files[1]), 'output': directory + '/', 'now': 'bench',
+                     'chunksize': chunksize, 'shards': shards, 'workers': 1, 'no_cache': True})
+        peak = rss_mb('VmHWM')
+
+        digest = hashlib.md5()
+        for path in sorted(glob.glob(directory + '/*_report_*')):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+    print(json.dumps({'peak_mb': peak - base, 'digest': digest.hexdigest()}))
+
+
+def measure(report, files, chunksize=None, shards=None):
+    """
+    Runs one report in a subprocess.
+    :param report: fund_analysis or standard_comparison
+    :param files: paths of the 2 exports
+    :param chunksize: rows per chunk of a chunked run
+    :param shards: number of shards of a sharded run
+    :return: dict with the growth of the peak RSS of the run in megabytes and the md5 digest of its reports
+    """
+    command = [sys.executable, '-m', 'benchmarks.bench_memory', '--child', report, '--files'] + [str(f) for f in files]
+    command += ['--chunksize', str(chunksize or 0), '--shards', str(shards or 0)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def write_exports(directory, report, rows):
+    """
+    :return: paths of wide synthetic exports of a report, most of their columns are skipped at parse time
+    """
+    if report == 'fund_analysis':
+        return write_fund_exports(directory, rows, extra_columns=30)
+
+    return write_compare_exports(directory, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='large file modes memory check')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='rows in the generated payment and project files'),
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help='chunk size used by the chunked and sharded modes'),
+    parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS,
+                        help='rows per shard of the sharded mode'),
+    parser.add_argument('--ceiling-mb', type=float, default=200,
+                        help='maximum growth of the peak RSS allowed for the sharded mode'),
+    parser.add_argument('--child', required=False, help=argparse.SUPPRESS),
+    parser.add_argument('--files', nargs=2, required=False, help=argparse.SUPPRESS),
+    parser.add_argument('--shards', type=int, default=0, required=False, help=argparse.SUPPRESS),
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.files, args.chunksize or None, args.shards or None)
+
+    failures = []
+    shards = max(args.rows // args.shard_rows, 2)
+    for report in ('fund_analysis', 'standard_comparison'):
+        with tempfile.TemporaryDirectory() as directory:
+            files = write_exports(directory, report, args.rows)
+            runs = {'in-memory': measure(report, files),
+                    'chunked': measure(report, files, args.chunksize),
+                    'sharded': measure(report, files, args.chunksize, shards)}
+        print('{:<20} {}'.format(report, '   '.join('{} {:>6.0f} MB'.format(mode, run['peak_mb'])
+                                                    for mode, run in runs.items())))
+
+        for mode, run in runs.items():
+            if run['digest'] != runs['in-memory']['digest']:
+                failures.append('{}: {} output differs from in-memory output'.format(report, mode))
+        if runs['sharded']['peak_mb'] > args.ceiling_mb:
+            failures.append('{}: sharded peak {:.0f} MB is above the {:.0f} MB ceiling'.format(
+                report, runs['sharded']['peak_mb'], args.ceiling_mb))
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
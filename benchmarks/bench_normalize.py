@@ -0,0 +1,130 @@
+"""
+Benchmarks the project ID and amount normalization of data_compare against the original chain of
+Series.apply(lambda ...) passes and checks that both produce the same values. Amounts are parsed into int64 cents,
+they are compared to the legacy floats once turned back into currency.
+Fails if the vectorized normalization is not faster than the legacy one by at least --min-speedup.
+
+To Run:
+python -m benchmarks.bench_normalize --sizes 10000 1000000 --min-speedup 1.5
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from reporter.money import to_currency
+from reporter.services.data_compare import normalize_project_ids, normalize_amounts
+
+
+def legacy_normalize(df):
+    """original per value implementation of the project ID and amount cleaning, kept as the reference"""
+    df['project_id_new'] = df['project_id'].apply(lambda x: x.strip() if isinstance(x, str) else x)
+    df['project_id_new'] = df['project_id_new'].apply(
+        lambda x: x.replace(' - ', '-').lower() if isinstance(x, str) and '-' in x else x)
+    df['project_id_new'] = df['project_id_new'].apply(
+        lambda x: x.replace('- ', '-').lower() if isinstance(x, str) and '-' in x else x)
+    df['project_id_new'] = df['project_id_new'].apply(
+        lambda x: x.replace(' -', '-').lower() if isinstance(x, str) and '-' in x else x)
+    df['project_id_new'] = df['project_id_new'].apply(
+        lambda x: x.replace('-', '_').lower() if isinstance(x, str) and '-' in x else x)
+    df['project_id_new'] = df['project_id_new'].apply(
+        lambda x: x.replace(' ', '_').lower() if isinstance(x, str) and ' ' in x else x)
+    df['project_id_new'] = df['project_id_new'].apply(lambda x: x.lower() if isinstance(x, str) else x)
+
+    df['sum_of_amount_new'] = df['sum_of_amount.5'].apply(lambda x: x.strip() if isinstance(x, str) else x)
+    df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
+        lambda x: x.replace('USD', '').lower() if isinstance(x, str) and 'USD' in x else x)
+    df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
+        lambda x: x.replace('$', '').lower() if isinstance(x, str) and '$' in x else x)
+    df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
+        lambda x: x.replace(',', '').lower() if isinstance(x, str) and ',' in x else x)
+    df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
+        lambda x: float("{0:.2f}".format(float(x))) if isinstance(x, str) else x)
+
+    return df
+
+
+def normalize(df):
+    df['project_id_new'] = normalize_project_ids(df['project_id'])
+    df['sum_of_amount_new'] = normalize_amounts(df['sum_of_amount.5'])
+
+    return df
+
+
+def make_data(rows, distinct, seed=0):
+    """
+    Builds raw project IDs and amounts in the formats found in the RE and SF exports.
+    :param rows: number of rows
+    :param distinct: number of distinct project IDs
+    :param seed: random seed
+    :return: dataframe
+    """
+    rng = np.random.RandomState(seed)
+    formats = np.array(['PRJ - {}', ' prj-{} ', 'Prj -{}', 'PRJ- {} A', 'prj {}'], dtype=object)
+    numbers = rng.randint(0, distinct, rows)
+    ids = [fmt.format(n) for fmt, n in zip(formats[numbers % len(formats)], numbers)]
+
+    cents = rng.randint(-10000000, 100000000, rows)
+    amounts = ['${:,.2f} USD'.format(c / 100) if c % 2 else ' {:.2f} '.format(c / 100) for c in cents]
+    ids[0], amounts[0] = np.nan, np.nan
+
+    return pd.DataFrame({'project_id': ids, 'sum_of_amount.5': amounts})
+
+
+def timed(func, df):
+    start = time.perf_counter()
+    result = func(df.copy())
+    return time.perf_counter() - start, result
+
+
+def compare(size, distinct, repeat=1):
+    """
+    Times both normalizations on the same data and checks they produce the same values.
+    :param size: number of rows
+    :param distinct: number of distinct project IDs
+    :param repeat: number of runs, the fastest one of each implementation is kept
+    :return: legacy and vectorized times in seconds
+    """
+    df = make_data(size, distinct)
+    legacy_time = vector_time = float('inf')
+    for _ in range(repeat):
+        elapsed, legacy = timed(legacy_normalize, df)
+        legacy_time = min(legacy_time, elapsed)
+        elapsed, vector = timed(normalize, df)
+        vector_time = min(vector_time, elapsed)
+
+    vector['sum_of_amount_new'] = to_currency(vector['sum_of_amount_new'].values)
+    for col in ('project_id_new', 'sum_of_amount_new'):
+        if not legacy[col].equals(vector[col]):
+            raise AssertionError('{} differs from the legacy implementation at {} rows'.format(col, size))
+
+    return legacy_time, vector_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='normalization benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 1000000],
+                        help='row counts to benchmark'),
+    parser.add_argument('--distinct', type=float, default=0.2,
+                        help='distinct project IDs as a share of the rows'),
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of each implementation, the fastest one is reported'),
+    parser.add_argument('--min-speedup', type=float, default=1.0,
+                        help='least ratio of the legacy time to the vectorized time, fails below it'),
+    args = parser.parse_args()
+
+    failures = []
+    print('{:>12} {:>12} {:>12} {:>10}'.format('rows', 'legacy (s)', 'vector (s)', 'speedup'))
+    for size in args.sizes:
+        legacy_time, vector_time = compare(size, max(int(size * args.distinct), 1), args.repeat)
+        speedup = legacy_time / vector_time
+        print('{:>12} {:>12.3f} {:>12.3f} {:>9.1f}x'.format(size, legacy_time, vector_time, speedup))
+        if speedup < args.min_speedup:
+            failures.append('{} rows: vectorized normalization is {:.2f}x the legacy speed, below {:.2f}x'.format(
+                size, speedup, args.min_speedup))
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
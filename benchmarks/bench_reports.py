@@ -0,0 +1,190 @@
+"""
+Benchmarks fund_report.run and data_compare.run end to end on synthetic exports and stores the wall time, peak RSS and
+per task times of every case under the current git commit, so runs of different commits can be compared. Every case
+runs in a fresh subprocess so peak RSS is measured per case, and the fastest of the repeats is kept.
+
+Results are appended to a json lines file (benchmarks/results.jsonl by default). Passing --baseline compares this run
+with the latest results stored for another commit and fails when a case got slower or bigger than the tolerance.
+
+To Run:
+python -m benchmarks.bench_reports --sizes 100000 1000000 --repeat 3
+python -m benchmarks.bench_reports --sizes 100000 1000000 --baseline {commit} --tolerance 0.1
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from benchmarks.synthetic import write_fund_exports, write_compare_exports
+
+REPORTS = ['fund_analysis', 'standard_comparison']
+DEFAULT_RESULTS = Path(__file__).parent / 'results.jsonl'
+
+
+def git_revision():
+    """
+    :return: short hash of the checked out commit, suffixed with -dirty when the tree has uncommitted changes
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], check=True,
+                               stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return commit + '-dirty' if dirty else commit
+
+
+def child(report, files, output):
+    """runs one report in this process and prints its wall time, peak RSS and task times"""
+    if report == 'fund_analysis':
+        from reporter.services.fund_report import run
+    else:
+        from reporter.services.data_compare import run
+
+    args = {'file1': str(files[0]), 'file2': str(files[1]), 'output': str(output) + os.sep, 'no_cache': True}
+    start = time.perf_counter()
+    state = run(args)
+    wall = time.perf_counter() - start
+
+    profile = pd.read_csv(next(Path(output).glob('run_profile_*.csv')))
+    stages = profile.groupby('task', sort=False)['wall_seconds'].sum().round(4).to_dict()
+    print(json.dumps({'wall_seconds': wall,
+                      'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                      'state': type(state).__name__,
+                      'stages': stages}))
+
+
+def measure(report, files):
+    """runs one case in a fresh subprocess"""
+    with tempfile.TemporaryDirectory() as output:
+        command = [sys.executable, '-m', 'benchmarks.bench_reports', '--child', report,
+                   '--files', str(files[0]), str(files[1]), '--output', output]
+        stdout = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout
+
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def case_key(record):
+    return record['report'], record['rows'], record['funds'], record['mismatch_rate']
+
+
+def load_results(path, commit):
+    """
+    :param path: results file
+    :param commit: commit whose results are loaded
+    :return: dict of case -> latest record of the commit
+    """
+    results = {}
+    if not Path(path).exists():
+        return results
+
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['commit'] == commit:
+                results[case_key(record)] = record
+
+    return results
+
+
+def compare(records, baseline, tolerance):
+    """
+    Prints the change of every case against the baseline.
+    :return: list of regressions
+    """
+    regressions = []
+    print('\n{:<20} {:>10} {:>12} {:>12} {:>10} {:>10}'.format('report', 'rows', 'wall', 'baseline', 'peak', 'baseline'))
+    for record in records:
+        base = baseline.get(case_key(record))
+        if base is None:
+            continue
+
+        print('{:<20} {:>10} {:>11.2f}s {:>11.2f}s {:>8.0f}MB {:>8.0f}MB'.format(
+            record['report'], record['rows'], record['wall_seconds'], base['wall_seconds'], record['peak_mb'],
+            base['peak_mb']))
+        for measure_ in ('wall_seconds', 'peak_mb'):
+            if record[measure_] > base[measure_] * (1 + tolerance):
+                regressions.append('{} {} rows: {} went from {:.2f} to {:.2f}'.format(
+                    record['report'], record['rows'], measure_, base[measure_], record[measure_]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end to end report benchmarks')
+    parser.add_argument('--reports', nargs='+', choices=REPORTS, default=REPORTS,
+                        help='reports to benchmark'),
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='payment rows (fund analysis) or projects (standard comparison) per case'),
+    parser.add_argument('--funds', type=int, default=40,
+                        help='number of distinct funds in the fund analysis exports'),
+    parser.add_argument('--mismatch-rate', type=float, default=0.05,
+                        help='share of mismatched rows in the exports'),
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case, the fastest is kept'),
+    parser.add_argument('--results', default=str(DEFAULT_RESULTS),
+                        help='json lines file the results are appended to'),
+    parser.add_argument('--baseline', default=None,
+                        help='commit to compare this run with'),
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative increase of wall time or peak RSS reported as a regression'),
+    parser.add_argument('--child', required=False, help=argparse.SUPPRESS),
+    parser.add_argument('--files', nargs=2, required=False, help=argparse.SUPPRESS),
+    parser.add_argument('--output', required=False, help=argparse.SUPPRESS),
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.files, args.output)
+
+    commit = git_revision()
+    baseline = load_results(args.results, args.baseline) if args.baseline else None
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            for report in args.reports:
+                case_dir = Path(directory) / '{}_{}'.format(report, rows)
+                case_dir.mkdir()
+                if report == 'fund_analysis':
+                    files = write_fund_exports(case_dir, rows, args.funds, args.mismatch_rate)
+                else:
+                    files = write_compare_exports(case_dir, rows, args.mismatch_rate)
+
+                runs = [measure(report, files) for _ in range(args.repeat)]
+                best = min(runs, key=lambda x: x['wall_seconds'])
+                record = {'commit': commit,
+                          'timestamp': datetime.datetime.now().isoformat(),
+                          'python': sys.version.split()[0],
+                          'pandas': pd.__version__,
+                          'report': report,
+                          'rows': rows,
+                          'funds': args.funds,
+                          'mismatch_rate': args.mismatch_rate,
+                          'wall_seconds': best['wall_seconds'],
+                          'peak_mb': max(x['peak_mb'] for x in runs),
+                          'state': best['state'],
+                          'stages': best['stages']}
+                records.append(record)
+                print('{:<20} {:>10} rows {:>8.2f}s {:>8.0f}MB  {}'.format(
+                    report, rows, record['wall_seconds'], record['peak_mb'], record['state']))
+
+    with open(args.results, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+    if baseline is not None:
+        regressions = compare(records, baseline, args.tolerance)
+        if regressions:
+            raise SystemExit('\n'.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmarks the startup of the report manager CLI. Every case runs in a fresh interpreter under `python -X importtime`,
+the wall time of the command is measured and the import log is parsed for the total import time and the heaviest top
+level imports, so regressions such as an eager import of the report services show up with the module responsible.
+
+Cases:
+- help: `report_manager --help`, should not import pandas, prefect or the report services.
+- usage_error: `report_manager` called without files, same as help.
+- fund_analysis, standard_comparison: imports of the report service of each type, the floor of a real run.
+
+To Run:
+python -m benchmarks.bench_startup --repeat 5
+python -m benchmarks.bench_startup --repeat 5 --max-cli-seconds 0.5
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+CASES = {
+    'help': ['-m', 'reporter.report_manager', '--help'],
+    'usage_error': ['-m', 'reporter.report_manager', '-t', 'fund_analysis'],
+    'fund_analysis': ['-c', 'import reporter.services.fund_report'],
+    'standard_comparison': ['-c', 'import reporter.services.data_compare'],
+}
+
+# cases that must stay free of the heavy dependencies
+CLI_CASES = ['help', 'usage_error']
+HEAVY_MODULES = ['pandas', 'prefect', 'dask', 'distributed', 'pyarrow']
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(log):
+    """
+    Parses the import log written to stderr by -X importtime.
+    :param log: stderr of the interpreter
+    :return: list of (module, nesting level, cumulative import time in seconds), nested imports are indented by two
+    spaces per level below the top level imports
+    """
+    modules = []
+    for line in log.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules.append((match.group(4), (len(match.group(3)) - 1) // 2, int(match.group(2)) / 1e6))
+
+    return modules
+
+
+def heaviest_packages(modules, top):
+    """
+    :param modules: parsed import log
+    :param top: number of packages returned
+    :return: list of (package, cumulative import time) of the heaviest third party and standard library packages, the
+    modules of this repo excluded
+    """
+    packages = [(name, seconds) for name, level, seconds in modules
+                if '.' not in name and name not in ('reporter', 'benchmarks')]
+
+    return sorted(packages, key=lambda x: -x[1])[:top]
+
+
+def measure(arguments):
+    """
+    Runs a case in a fresh interpreter.
+    :param arguments: interpreter arguments of the case
+    :return: wall time in seconds and parsed import log
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+
+    return wall, parse_importtime(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='report manager startup benchmark')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES),
+                        help='cases to benchmark'),
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per case, the fastest is kept'),
+    parser.add_argument('--top', type=int, default=5,
+                        help='heaviest top level imports listed per case'),
+    parser.add_argument('--max-cli-seconds', type=float, default=None,
+                        help='fail when --help or a usage error takes longer than this'),
+    args = parser.parse_args()
+
+    failures = []
+    print('{:<20} {:>10} {:>10}  {}'.format('case', 'wall', 'imports', 'heaviest imports'))
+    for case in args.cases:
+        wall, modules = min((measure(CASES[case]) for _ in range(args.repeat)), key=lambda x: x[0])
+        total = sum(seconds for name, level, seconds in modules if level == 0)
+        print('{:<20} {:>9.3f}s {:>9.3f}s  {}'.format(
+            case, wall, total, ', '.join('{} {:.3f}s'.format(*x) for x in heaviest_packages(modules, args.top))))
+
+        if case in CLI_CASES:
+            eager = [name for name, level, seconds in modules if name in HEAVY_MODULES]
+            if eager:
+                failures.append('{} imports {}'.format(case, ', '.join(eager)))
+            if args.max_cli_seconds is not None and wall > args.max_cli_seconds:
+                failures.append('{} took {:.3f}s, above {:.3f}s'.format(case, wall, args.max_cli_seconds))
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
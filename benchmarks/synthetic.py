@@ -0,0 +1,193 @@
+"""
+Generates synthetic RE and SF exports with the column layouts the report cleaners expect, for benchmarks and load tests.
+
+Fund analysis exports:
+- payments: `UserGiftID Pledge`, `PaymentID`, `Fund` plus the payment amount and date. Payments are allocated to the
+funds of their pledge, a payment split across funds spans several rows sharing its PaymentID, and a share of the rows
+set by the mismatch rate is allocated to a fund outside of the pledge.
+- pledges: `Gift ID`, `Fund ID` plus the pledge amount and date, one row per fund of the pledge (1 to 3 funds).
+
+Standard comparison exports:
+- SF: `Project ID` followed by six `Sum of Amount`/`Record Count` blocks, the last block (`sum_of_amount.5` once
+loaded) holds the project total formatted as '$1,234.50 USD'. Project IDs are formatted as 'PRJ - 12'.
+- RE: `Fund ID`, `Gift Count`, `Total`, with project IDs formatted as 'prj-12' and the rows shuffled. A share of the
+totals set by the mismatch rate differs from SF and a share of the projects set by the missing rate only exists on
+one side.
+
+To Run:
+python -m benchmarks.synthetic --report fund_analysis --rows 1000000 --funds 40 --mismatch-rate 0.05 -o {directory}
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+def format_ids(prefix, values, width=8):
+    """formats integers as zero padded IDs, e.g. UG00000012"""
+    return prefix + pd.Series(values).astype(str).str.zfill(width)
+
+
+def format_currency(cents):
+    """formats integer cents as SF currency strings, e.g. '$1,234.50 USD'"""
+    return ['${:,.2f} USD'.format(x / 100) for x in cents]
+
+
+def format_amounts(cents):
+    """formats integer cents as plain amounts, e.g. '1234.50'"""
+    return ['{:.2f}'.format(x / 100) for x in cents]
+
+
+def random_dates(rng, rows):
+    """random dates of 2019 formatted as RE exports them"""
+    return (pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.randint(0, 365, rows), unit='D')).strftime('%m/%d/%Y')
+
+
+def fund_exports(rows, funds=40, mismatch_rate=0.05, seed=0, extra_columns=0):
+    """
+    Builds the payment and pledge exports of the fund analysis.
+    :param rows: number of payment rows
+    :param funds: number of distinct funds
+    :param mismatch_rate: share of payment rows allocated to a fund outside of their pledge
+    :param seed: random seed
+    :param extra_columns: number of filler columns added to both exports, to mimic wide exports
+    :return: payments and pledges dataframes
+    """
+    rng = np.random.RandomState(seed)
+    gifts = max(rows // 4, 1)
+    fund_names = np.array(['Fund {}'.format(i) for i in range(funds)], dtype=object)
+
+    # every pledge is allocated to 1 to 3 funds
+    per_gift = rng.randint(1, 4, gifts)
+    offsets = np.concatenate([[0], np.cumsum(per_gift)[:-1]])
+    pledge_gift = np.repeat(np.arange(gifts), per_gift)
+    pledge_fund = rng.randint(0, funds, len(pledge_gift))
+
+    # about one row in ten continues the payment of the previous row, allocating it to another fund of the pledge
+    split = rng.random_sample(rows) < 0.1
+    split[0] = False
+    payment = np.cumsum(~split) - 1
+    payment_gift = rng.randint(0, gifts, payment[-1] + 1)[payment]
+    payment_fund = pledge_fund[offsets[payment_gift] + rng.randint(0, 1 << 30, rows) % per_gift[payment_gift]]
+
+    mismatch = rng.random_sample(rows) < mismatch_rate
+    payment_fund[mismatch] = rng.randint(0, funds, int(mismatch.sum()))
+
+    payments = pd.DataFrame({'UserGiftID Pledge': format_ids('UG', payment_gift),
+                             'PaymentID': format_ids('PAY', payment),
+                             'Fund': fund_names[payment_fund],
+                             'Amount': format_amounts(rng.randint(100, 500000, rows)),
+                             'Payment Date': random_dates(rng, rows)})
+    pledges = pd.DataFrame({'Gift ID': format_ids('UG', pledge_gift),
+                            'Fund ID': pd.Series(fund_names[pledge_fund]).str.lower(),
+                            'Amount': format_amounts(rng.randint(100, 5000000, len(pledge_gift))),
+                            'Close Date': random_dates(rng, len(pledge_gift))})
+
+    for i in range(extra_columns):
+        payments['Filler {}'.format(i)] = 'filler value'
+        pledges['Filler {}'.format(i)] = 'filler value'
+
+    return payments, pledges
+
+
+def compare_exports(rows, mismatch_rate=0.01, missing_rate=0.01, seed=0):
+    """
+    Builds the SF and RE exports of the standard comparison.
+    :param rows: number of projects
+    :param mismatch_rate: share of projects whose RE total differs from SF
+    :param missing_rate: share of projects only found in one of the exports, split evenly between both
+    :param seed: random seed
+    :return: SF and RE dataframes
+    """
+    rng = np.random.RandomState(seed)
+    projects = np.arange(rows)
+    cents = rng.randint(100, 100000000, rows)
+    counts = rng.randint(1, 50, rows)
+
+    re_cents = cents.copy()
+    mismatch = rng.random_sample(rows) < mismatch_rate
+    re_cents[mismatch] += rng.randint(1, 100000, int(mismatch.sum()))
+
+    missing = rng.random_sample(rows)
+    in_sf = missing >= missing_rate / 2
+    in_re = (missing < missing_rate / 2) | (missing >= missing_rate)
+
+    sf = pd.DataFrame({'Project ID': ('PRJ - ' + pd.Series(projects).astype(str))[in_sf].values})
+    columns = ['Project ID']
+    for block in range(6):
+        last = block == 5
+        sf['Sum of Amount.{}'.format(block)] = format_currency(cents[in_sf]) if last else '$0.00 USD'
+        sf['Record Count.{}'.format(block)] = counts[in_sf] if last else 0
+        columns += ['Sum of Amount', 'Record Count']
+
+    order = rng.permutation(np.flatnonzero(in_re))
+    re_ = pd.DataFrame({'Fund ID': ('prj-' + pd.Series(projects[order]).astype(str)).values,
+                        'Gift Count': counts[order],
+                        'Total': format_amounts(re_cents[order])})
+
+    # SF repeats the block headers, pandas suffixes them with .1, .2, ... when the export is loaded
+    sf.columns = columns
+
+    return sf, re_
+
+
+def write_fund_exports(directory, rows, funds=40, mismatch_rate=0.05, seed=0, extra_columns=0):
+    """
+    Writes the payment and pledge exports of the fund analysis as payments.csv and pledges.csv.
+    :return: paths of the payments and pledges exports
+    """
+    payments, pledges = fund_exports(rows, funds, mismatch_rate, seed, extra_columns)
+    paths = Path(directory) / 'payments.csv', Path(directory) / 'pledges.csv'
+    payments.to_csv(paths[0], index=False)
+    pledges.to_csv(paths[1], index=False)
+
+    return paths
+
+
+def write_compare_exports(directory, rows, mismatch_rate=0.01, missing_rate=0.01, seed=0):
+    """
+    Writes the SF and RE exports of the standard comparison as sf.csv and re.csv.
+    :return: paths of the SF and RE exports
+    """
+    sf, re_ = compare_exports(rows, mismatch_rate, missing_rate, seed)
+    paths = Path(directory) / 'sf.csv', Path(directory) / 're.csv'
+    sf.to_csv(paths[0], index=False)
+    re_.to_csv(paths[1], index=False)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='synthetic RE/SF export generator')
+    parser.add_argument('--report', required=True, choices=['standard_comparison', 'fund_analysis'],
+                        help='report the exports are generated for'),
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='payment rows (fund analysis) or projects (standard comparison)'),
+    parser.add_argument('--funds', type=int, default=40,
+                        help='number of distinct funds (fund analysis)'),
+    parser.add_argument('--mismatch-rate', type=float, default=None,
+                        help='share of mismatched rows (default 0.05 for the fund analysis, 0.01 otherwise)'),
+    parser.add_argument('--missing-rate', type=float, default=0.01,
+                        help='share of projects only found in one export (standard comparison)'),
+    parser.add_argument('--extra-columns', type=int, default=0,
+                        help='filler columns added to the exports (fund analysis)'),
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed'),
+    parser.add_argument('-o', '--output', required=True,
+                        help='directory the exports are written to'),
+    args = parser.parse_args()
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    if args.report == 'fund_analysis':
+        mismatch_rate = 0.05 if args.mismatch_rate is None else args.mismatch_rate
+        paths = write_fund_exports(args.output, args.rows, args.funds, mismatch_rate, args.seed, args.extra_columns)
+    else:
+        mismatch_rate = 0.01 if args.mismatch_rate is None else args.mismatch_rate
+        paths = write_compare_exports(args.output, args.rows, mismatch_rate, args.missing_rate, args.seed)
+
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Command line arguments shared by the report manager and the report services. Each entry point builds its own parser
+with these as parents, argparse.ArgumentParser(parents=[run_parser()]), and only adds the arguments it alone takes, so
+every shared flag has a single definition and help text.
+
+The module is imported to parse the arguments before any report runs, so it only imports modules free of pandas,
+prefect and dask. The choices of the output formats and csv readers are repeated here for that reason and are checked
+against reporter/output.py and reporter/ingest.py by the tests.
+"""
+import argparse
+from .engine import ENGINES, EXECUTORS
+
+OUTPUT_FORMATS = ['csv', 'gzip', 'zstd', 'parquet', 'jsonl']
+READERS = ['pandas', 'pyarrow']
+HANDOFFS = ['memory', 'mmap']
+
+
+def run_parser():
+    """
+    :return: parser of the arguments of how a report runs: output format, engine, executor, shards, state, task
+    handoff, profile and cache of cleaned files
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv', required=False,
+                        help='format of the reports: csv (default), gzip or zstd compressed csv, parquet or json '
+                             'lines, a manifest with the row counts and totals is written next to them')
+    parser.add_argument('--chunksize', type=int, default=None, required=False,
+                        help='stream the files in chunks of this many rows, only the cleaned columns of every row '
+                             'are kept, memory still grows with the rows (see --shards)')
+    parser.add_argument('--engine', choices=ENGINES, default='pandas', required=False,
+                        help='run the load, clean and reduce stages in process with pandas, or partitioned with dask '
+                             'collecting only the rows of the findings')
+    parser.add_argument('--reader', choices=READERS, default='pandas', required=False,
+                        help='csv reader: the pandas parser (default) or the multithreaded pyarrow reader, streamed '
+                             'reads (--chunksize) always use the pandas parser')
+    parser.add_argument('--scheduler', default=None, required=False,
+                        help='dask scheduler: threads (default), processes, synchronous, local-cluster or the address '
+                             'of a running scheduler')
+    parser.add_argument('--executor', choices=EXECUTORS, default='local', required=False,
+                        help='prefect executor: local (default) runs tasks one after another, local-dask runs '
+                             'independent tasks on threads and dask on a local or remote dask cluster')
+    parser.add_argument('--executor-address', default=None, required=False,
+                        help='address of the dask scheduler used by the dask executor, a local cluster of --workers '
+                             'processes is started when not provided')
+    parser.add_argument('--shards', type=int, default=None, required=False,
+                        help='split a single large pair into this many shards by join key, reconciled --workers at a '
+                             'time in parallel, see reporter/shard.py')
+    parser.add_argument('--shard-dir', default=None, required=False,
+                        help='parent directory of the shard files (default: the temp directory), must be shared with '
+                             'the workers of a remote dask executor')
+    parser.add_argument('-w', '--workers', type=int, default=None, required=False,
+                        help='number of shards with --shards, or of file pairs in the directory mode of the report '
+                             'manager, processed at once (default: cpu count)')
+    parser.add_argument('--state-dir', default=None, required=False,
+                        help='state directory of the reconciliation, only the rows changed since its last run are '
+                             'analyzed (a sub directory per pair in directory mode)')
+    parser.add_argument('--handoff', choices=HANDOFFS, default='memory', required=False,
+                        help='hand task results over in memory (default), or written once to memory-mapped Arrow and '
+                             'NumPy files that tasks pass as handles')
+    parser.add_argument('--handoff-dir', default=None, required=False,
+                        help='parent directory of the memory-mapped task results (default: the temp directory), must '
+                             'be shared with the workers of a remote dask executor')
+    parser.add_argument('--profile', action='store_true',
+                        help='run every task under cProfile and save its stats next to the run profile')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the cache of cleaned files')
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='ignore cached files and clean the files again')
+    parser.add_argument('--cache-dir', default=None, required=False,
+                        help='directory of the cache of cleaned files (default ~/.cache/reporter)')
+    parser.add_argument('--cache-size', type=int, default=None, required=False,
+                        help='size cap of the cache in megabytes (default 2048)')
+
+    return parser
+
+
+def comparison_parser():
+    """
+    :return: parser of the keys, measures and tolerances of the standard comparison, see reporter/comparison.py
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-c', '--compare_column', nargs='+', default=None, required=False,
+                        help='standard comparison measures compared between the files: amount (default), count or '
+                             'standardized column names, column:amount or column:number sets the type of a column')
+    parser.add_argument('--key', nargs='+', default=None, required=False,
+                        help='standardized key columns the rows of the standard comparison are matched on '
+                             '(default: project_id)')
+    parser.add_argument('--tolerance', nargs='+', default=None, required=False,
+                        help='largest difference of a measure that is not reported, a number for every measure or '
+                             'measure=number pairs (default: 0)')
+
+    return parser
@@ -0,0 +1,130 @@
+"""
+Directory mode of the report manager. Finds the RE/SF export pairs in a directory, runs the requested report on every
+pair in parallel across a process pool and writes a merged summary of the batch. A pair that fails is recorded in the
+summary without stopping the rest of the batch.
+
+Pairs are found two ways:
+- every sub directory holding exactly two csv files is a pair named after the sub directory.
+- csv files directly in the directory are paired by name once their side token (re, sf, payments, pledge, ...) is
+removed, e.g. 2019_10_RE.csv and 2019_10_SF.csv make the pair 2019_10.
+"""
+import datetime
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+
+SIDE_TOKENS = {'re', 'sf', 'payment', 'payments', 'pledge', 'pledges'}
+
+
+def pair_name(path):
+    """
+    Strips the side token out of a file name.
+    :param path: csv file path
+    :return: name shared by both files of a pair, or None when the file name has no side token
+    """
+    tokens = [x for x in re.split(r'[_\-. ]+', Path(path).stem) if x]
+    remaining = [x for x in tokens if x.lower() not in SIDE_TOKENS]
+    if len(remaining) == len(tokens):
+        return None
+
+    return '_'.join(remaining) or 'pair'
+
+
+def find_pairs(directory):
+    """
+    Finds the file pairs to reconcile in a directory.
+    :param directory: directory path
+    :return: ordered dict of pair name -> list of csv files, lists that do not hold exactly two files are unpaired
+    """
+    directory = Path(directory)
+    pairs = OrderedDict()
+
+    for sub in sorted(x for x in directory.iterdir() if x.is_dir()):
+        files = sorted(str(x) for x in sub.glob('*.csv'))
+        if files:
+            pairs[sub.name] = files
+
+    for file in sorted(directory.glob('*.csv')):
+        pairs.setdefault(pair_name(file) or file.stem, []).append(str(file))
+
+    return pairs
+
+
+def run_pair(report_type, name, files, args):
+    """
+    Runs a report on a single pair. Executed inside the worker processes.
+    :param report_type: fund_analysis or standard_comparison
+    :param name: pair name
+    :param files: the two csv files of the pair
+    :param args: arguments of the batch
+    :return: summary row of the pair
+    """
+    summary = OrderedDict([('pair', name), ('type', report_type), ('file1', files[0]), ('file2', files[1]),
+                           ('status', 'failed'), ('error', '')])
+
+    destination = Path(args.get('output') or Path.cwd()) / name
+    destination.mkdir(parents=True, exist_ok=True)
+    pair_args = dict(args, file1=files[0], file2=files[1], output=str(destination) + os.sep, dir=None)
+    if args.get('state_dir'):
+        # every pair is its own reconciliation with its own incremental state
+        pair_args['state_dir'] = str(Path(args['state_dir']) / name)
+
+    if report_type == 'fund_analysis':
+        from .services.fund_report import run
+    else:
+        from .services.data_compare import run
+
+    state = run(pair_args)
+    for task, task_state in state.result.items():
+        if task.name == 'Report Findings' and task_state.is_successful():
+            summary.update(task_state.result)
+        elif task_state.is_failed() and not summary['error']:
+            summary['error'] = '{}: {}'.format(task.name, task_state.message)
+
+    if state.is_successful():
+        summary['status'] = 'success'
+
+    return summary
+
+
+def run_batch(args):
+    """
+    Runs the requested report on every pair found in the directory of the arguments.
+    :param args: arguments dict with type, dir, output and workers keys
+    :return: summary dataframe of the batch
+    """
+    report_type = args['type']
+    pairs = find_pairs(args['dir'])
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=args.get('workers') or os.cpu_count()) as executor:
+        futures = {}
+        for name, files in pairs.items():
+            if len(files) != 2:
+                rows.append(OrderedDict([('pair', name), ('type', report_type), ('file1', ';'.join(files)),
+                                         ('file2', ''), ('status', 'failed'),
+                                         ('error', 'expected 2 csv files, found {}'.format(len(files)))]))
+                continue
+            futures[executor.submit(run_pair, report_type, name, files, args)] = (name, files)
+
+        for future in as_completed(futures):
+            name, files = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as exc:
+                rows.append(OrderedDict([('pair', name), ('type', report_type), ('file1', files[0]),
+                                         ('file2', files[1]), ('status', 'failed'), ('error', repr(exc))]))
+
+    summary = pd.DataFrame(rows)
+    if len(summary):
+        summary = summary.sort_values('pair').reset_index(drop=True)
+
+    destination = Path(args.get('output') or Path.cwd())
+    destination.mkdir(parents=True, exist_ok=True)
+    now = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+    summary.to_csv(destination / 'batch_summary_{}.csv'.format(now), index=False)
+
+    return summary
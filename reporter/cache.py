@@ -0,0 +1,269 @@
+"""
+On-disk cache of cleaned dataframes. Entries are stored as Feather files keyed by the content hash of the source csv,
+the cleaning version of the report and the ingestion schema, so a warm run skips csv parsing and cleaning entirely.
+The cache is capped in size and evicts the least recently used entries first.
+
+The resident report server keeps an in-memory cache in front of it. Its entries are keyed by the path, size and
+modification time of the source csv instead of its content hash, so a warm request does not read the file at all.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import pandas as pd
+from .ingest import init_arrow
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'reporter'
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_MEMORY_SIZE = 1024
+
+# in-memory cache of the resident report server, used by open_cache in place of the on-disk cache once set
+resident_cache = None
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Hashes the contents of a file.
+    :param path: file path
+    :param block_size: bytes read per block
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cache_key(path, version, schema, options=None):
+    """
+    Builds the cache key of a cleaned file.
+    :param path: source csv path
+    :param version: cleaning version of the report, bumped whenever the cleaning output changes
+    :param schema: ingestion schema the file is read with
+    :param options: any other settings that change the cleaned output
+    :return: hex key
+    """
+    payload = {'content': file_digest(path),
+               'version': version,
+               'schema': {column: str(dtype) for column, dtype in schema.items()},
+               'options': options or {}}
+
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode(), digest_size=20).hexdigest()
+
+
+class FrameCache:
+    """
+    Directory of Feather files with a json metadata sidecar per entry. The modification time of the Feather file is
+    refreshed on every hit and used as the recency for LRU eviction.
+    """
+    backing = None
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE, refresh=False):
+        """
+        :param directory: cache directory
+        :param max_size: cache size cap in megabytes
+        :param refresh: ignore existing entries and overwrite them
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_size * 1024 * 1024
+        self.refresh = refresh
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(path, version, schema, options=None):
+        return cache_key(path, version, schema, options)
+
+    def paths(self, key):
+        return self.directory / '{}.feather'.format(key), self.directory / '{}.json'.format(key)
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: dataframe and metadata, or None when the entry does not exist
+        """
+        data_path, meta_path = self.paths(key)
+        if self.refresh or not data_path.exists() or not meta_path.exists():
+            return None
+
+        os.utime(str(data_path))
+        init_arrow()
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        return pd.read_feather(str(data_path)), meta
+
+    def put(self, key, df, meta):
+        """
+        Stores a dataframe, then evicts entries until the cache fits under its size cap.
+        :param key: cache key
+        :param df: dataframe
+        :param meta: json serializable metadata stored with the dataframe
+        """
+        data_path, meta_path = self.paths(key)
+        init_arrow()
+        # the workers of directory mode may store the same file at once, every write gets a temp file of its own
+        tmp_path = self.temp_path()
+        df.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, str(data_path))
+        tmp_path = self.temp_path()
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, str(meta_path))
+
+        self.evict()
+
+    def temp_path(self):
+        """
+        :return: path of a new uniquely named temp file in the cache directory, renamed into place once written
+        """
+        with tempfile.NamedTemporaryFile(dir=str(self.directory), suffix='.tmp', delete=False) as f:
+            return f.name
+
+    def evict(self):
+        """removes the least recently used entries until the cache fits under its size cap"""
+        # files are cleaned concurrently, entries may be evicted by another thread while the cache is walked
+        entries = []
+        for entry in self.directory.glob('*.feather'):
+            try:
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            for path in (entry, entry.with_suffix('.json')):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+class MemoryCache:
+    """
+    In-memory LRU of cleaned dataframes, capped by the memory used by the dataframes. Misses fall back to the backing
+    on-disk cache when there is one. Entries are copied on the way out so a report never changes the cached frames.
+    """
+    def __init__(self, max_size=DEFAULT_MEMORY_SIZE, backing=None):
+        """
+        :param max_size: memory cap of the cache in megabytes
+        :param backing: FrameCache read and written on misses, or None
+        """
+        self.max_bytes = max_size * 1024 * 1024
+        self.backing = backing
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path, version, schema, options=None):
+        stat = os.stat(str(path))
+        payload = {'path': str(Path(path).resolve()),
+                   'size': stat.st_size,
+                   'mtime': stat.st_mtime_ns,
+                   'version': version,
+                   'schema': {column: str(dtype) for column, dtype in schema.items()},
+                   'options': options or {}}
+
+        return json.dumps(payload, sort_keys=True)
+
+    def get(self, key):
+        """
+        :param key: cache key
+        :return: copy of the dataframe and metadata, or None when the entry does not exist
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        df, meta, size = entry
+        return df.copy(), dict(meta)
+
+    def put(self, key, df, meta):
+        """
+        Stores a copy of a dataframe, then evicts the least recently used entries until the cache fits under its cap.
+        An entry larger than the whole cache is not stored.
+        :param key: cache key
+        :param df: dataframe
+        :param meta: metadata stored with the dataframe
+        """
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.entries[key] = (df.copy(), dict(meta), size)
+            self.entries.move_to_end(key)
+            total = sum(x[2] for x in self.entries.values())
+            while total > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                total -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        :return: number of entries, megabytes used, hits and misses of the cache
+        """
+        with self.lock:
+            return {'entries': len(self.entries),
+                    'size_mb': sum(x[2] for x in self.entries.values()) / (1024 * 1024),
+                    'max_size_mb': self.max_bytes / (1024 * 1024),
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+
+def open_cache(args):
+    """
+    Builds the cache from the program arguments.
+    :param args: arguments dict with optional no_cache, refresh_cache, cache_dir and cache_size keys
+    :return: the in-memory cache of the resident server when it runs, FrameCache otherwise, or None when caching is
+    disabled
+    """
+    if args.get('no_cache'):
+        return None
+    if resident_cache is not None:
+        return resident_cache
+
+    return FrameCache(args.get('cache_dir') or DEFAULT_CACHE_DIR,
+                      args.get('cache_size') or DEFAULT_CACHE_SIZE,
+                      bool(args.get('refresh_cache')))
+
+
+def load_cached(path, loader, version, schema, options=None, cache=None):
+    """
+    Loads and cleans a file through the cache.
+    :param path: source csv path
+    :param loader: function taking the path and returning the cleaned dataframe and json serializable metadata
+    :param version: cleaning version of the report
+    :param schema: ingestion schema the file is read with
+    :param options: any other settings that change the cleaned output
+    :param cache: FrameCache or MemoryCache, the loader is always called when None
+    :return: cleaned dataframe and metadata
+    """
+    if cache is None:
+        return loader(path)
+
+    key = cache.key(path, version, schema, options)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    df, meta = load_cached(path, loader, version, schema, options, cache.backing)
+    cache.put(key, df, meta)
+
+    return df, meta
@@ -0,0 +1,332 @@
+"""
+Comparison engine of the standard comparison. A comparison is defined by key columns, the rows of both data sets are
+matched on, and measure columns, compared between the matched rows with a tolerance per measure. Keys and measures are
+named by their standardized SF column names, the RE columns are renamed to them while cleaning, and the usual measures
+have aliases: amount for the project total (`sum_of_amount.5`, `Total` in RE) and count for the number of gifts
+(`record_count.5`, `Gift Count` in RE). Only the project ID keys are standardized like project IDs, other keys are only
+stripped.
+
+Every measure is compared in the same merge pass with vectorized differences, so one load validates every field of the
+exports at once. Every measure has a type: amounts are currency parsed into int64 cents, see reporter/money.py, so
+their differences are exact, numbers such as the gift count are plain numbers parsed into float64. Measures are amounts
+by default when their column name holds 'amount', numbers otherwise, and `column:type` sets the type of any other
+column. A matched row is reported when any of its measures differs by more than its tolerance, along with the variance
+of every measure.
+
+With the dask engine the keys to report are found with the same merge on partitioned data sets, see finding_keys.
+"""
+import numpy as np
+import pandas as pd
+from .money import MISSING_CENTS, tolerance_cents
+
+# RE columns and the SF columns they are renamed to while cleaning
+RE_COLUMNS = {'fund_id': 'project_id',
+              'gift_count': 'record_count.5',
+              'total': 'sum_of_amount.5'}
+
+MEASURE_ALIASES = {'amount': 'sum_of_amount.5',
+                   'count': 'record_count.5'}
+
+# measure types, amounts are int64 cents and numbers float64 once cleaned
+AMOUNT = 'amount'
+NUMBER = 'number'
+MEASURE_DTYPES = {AMOUNT: np.int64, NUMBER: np.float64}
+
+# separates a measure from its type, e.g. gift_total:amount
+TYPE_SEPARATOR = ':'
+
+# keys holding project IDs, standardized like project IDs while cleaning
+PROJECT_ID_KEYS = ['project_id']
+
+# marks the keys found in the other data set when the distinct keys are anti-joined
+FOUND_COLUMN = 'found'
+
+DEFAULT_KEYS = ['project_id']
+DEFAULT_MEASURES = ['amount']
+
+
+def cleaned_column(column):
+    """name of the cleaned column of a key or measure, e.g. sum_of_amount.5 -> sum_of_amount_5_new"""
+    return '{}_new'.format(column.replace('.', '_'))
+
+
+def default_type(column):
+    """
+    :param column: standardized measure column
+    :return: AMOUNT for the columns named like amounts, NUMBER otherwise
+    """
+    return AMOUNT if 'amount' in column else NUMBER
+
+
+def parse_measures(values):
+    """
+    Parses measure arguments, measure aliases or standardized columns optionally followed by their type.
+    :param values: list of strings, e.g. ['amount', 'gift_total:amount']
+    :return: list of measures and dict of measure -> type of the measures given one
+    """
+    measures, types = [], {}
+    for value in values:
+        measure, separator, measure_type = str(value).partition(TYPE_SEPARATOR)
+        measures.append(measure)
+        if separator:
+            types[measure] = measure_type
+
+    return measures, types
+
+
+def parse_tolerances(values):
+    """
+    Parses tolerance arguments, either a single number applying to every measure or measure=number pairs.
+    :param values: list of strings, e.g. ['0.01'] or ['amount=0.01', 'count=0']
+    :return: dict of measure -> tolerance, the tolerance of every other measure is under the None key
+    """
+    tolerances = {}
+    for value in values or []:
+        measure, _, tolerance = str(value).rpartition('=')
+        tolerances[measure or None] = float(tolerance)
+
+    return tolerances
+
+
+class Comparison:
+    """
+    Keys, measures and tolerances of a comparison.
+    """
+    def __init__(self, keys=None, measures=None, tolerances=None, types=None):
+        """
+        :param keys: standardized key columns, project_id by default
+        :param measures: measure aliases or standardized measure columns, amount by default
+        :param tolerances: dict of measure -> largest difference that is not reported, 0 by default, the None key
+        applies to every measure without its own tolerance
+        :param types: dict of measure -> AMOUNT or NUMBER, by default amount is an amount, count a number and other
+        measures get the type of their column name, see default_type
+        """
+        self.keys = list(keys or DEFAULT_KEYS)
+        self.measures = list(measures or DEFAULT_MEASURES)
+        tolerances = tolerances or {}
+        self.tolerances = {x: float(tolerances.get(x, tolerances.get(None, 0))) for x in self.measures}
+        types = types or {}
+        self.types = {x: types.get(x) or default_type(MEASURE_ALIASES.get(x, x)) for x in self.measures}
+
+        unknown = set(tolerances) - set(self.measures) - {None}
+        if unknown:
+            raise ValueError('tolerances given for measures that are not compared: {}'.format(sorted(unknown)))
+        unknown = set(self.types.values()) - set(MEASURE_DTYPES)
+        if unknown:
+            raise ValueError('unknown measure types {}, measures are {}'.format(sorted(unknown),
+                                                                               ' or '.join(MEASURE_DTYPES)))
+        for column in set(self.measure_columns.values()):
+            if len({self.types[x] for x, y in self.measure_columns.items() if y == column}) > 1:
+                raise ValueError('{} is compared as both an amount and a number'.format(column))
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        :param args: arguments dict with optional key, compare_column and tolerance keys
+        :return: Comparison
+        """
+        measures = args.get('compare_column') or []
+        if isinstance(measures, str):
+            measures = [measures]
+        measures, types = parse_measures(measures)
+
+        return cls(args.get('key'), measures or None, parse_tolerances(args.get('tolerance')), types)
+
+    @property
+    def key_columns(self):
+        """cleaned key columns"""
+        return [cleaned_column(x) for x in self.keys]
+
+    @property
+    def measure_columns(self):
+        """dict of measure -> standardized SF column"""
+        return {x: MEASURE_ALIASES.get(x, x) for x in self.measures}
+
+    @property
+    def column_types(self):
+        """dict of standardized measure column -> its type"""
+        return {column: self.types[x] for x, column in self.measure_columns.items()}
+
+    @property
+    def measure_dtypes(self):
+        """dict of cleaned measure column -> its dtype"""
+        return {cleaned_column(x): MEASURE_DTYPES[y] for x, y in self.column_types.items()}
+
+    @property
+    def variance_columns(self):
+        """dict of measure -> variance column of the report, a single measure keeps the variance column name"""
+        if len(self.measures) == 1:
+            return {self.measures[0]: 'variance'}
+
+        return {x: '{}_variance'.format(x) for x in self.measures}
+
+    @property
+    def cents_columns(self):
+        """variance columns of the amounts, in int64 cents"""
+        return [y for x, y in self.variance_columns.items() if self.types[x] == AMOUNT]
+
+    @property
+    def columns(self):
+        """cleaned columns the comparison uses"""
+        return self.key_columns + [cleaned_column(x) for x in self.measure_columns.values()] + ['source']
+
+    def source_columns(self):
+        """standardized SF columns of the keys and measures"""
+        return list(dict.fromkeys(self.keys + list(self.measure_columns.values())))
+
+    def schema(self, base):
+        """
+        :param base: ingestion schema of the report
+        :return: ingestion schema loading the keys and measures from both exports as strings as well
+        """
+        schema = dict(base)
+        renamed = {sf: re_ for re_, sf in RE_COLUMNS.items()}
+        for column in self.source_columns():
+            schema.setdefault(column, str)
+            if column in renamed:
+                schema.setdefault(renamed[column], str)
+
+        return schema
+
+    def describe(self):
+        """
+        :return: json serializable settings, part of the version of the state the comparison is saved with
+        """
+        return {'keys': self.keys, 'measures': self.measures, 'tolerances': self.tolerances, 'types': self.types}
+
+
+def key_codes(frames, keys):
+    """
+    Codes the key values of several dataframes, equal key values get the same code across all of them and missing
+    values match each other.
+    :param frames: list of dataframes holding the key columns
+    :param keys: key columns
+    :return: list of int64 code arrays, one per dataframe
+    """
+    lengths = [len(df) for df in frames]
+    codes = np.zeros(sum(lengths), dtype=np.int64)
+    for key in keys:
+        values, uniques = pd.factorize(pd.concat([df[key] for df in frames], ignore_index=True))
+        # missing values are coded -1, shifted to 0 so they match each other, then the pairs are coded densely again
+        codes, _ = pd.factorize(codes * (len(uniques) + 1) + values + 1)
+
+    return np.split(codes.astype(np.int64), np.cumsum(lengths)[:-1])
+
+
+def composite_key(df, keys):
+    """
+    :param df: dataframe holding the key columns
+    :param keys: key columns
+    :return: the key column for a single key, otherwise a string series joining the keys of every row
+    """
+    if len(keys) == 1:
+        return df[keys[0]]
+
+    composite = df[keys[0]].astype(str)
+    for key in keys[1:]:
+        composite = composite + '\x1f' + df[key].astype(str)
+
+    return composite
+
+
+def find_missing(left, right, keys):
+    """
+    Finds the key values that only exist in one of two data sets using hash based membership checks.
+    :param left: first dataframe, must contain the key columns and a source column
+    :param right: second dataframe, must contain the key columns and a source column
+    :param keys: key column or columns to match on
+    :return: dataframe of missing key values with the source they were found in and their row count
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    left_codes, right_codes = key_codes([left, right], keys)
+
+    missing = []
+    for df, codes, other in ((left, left_codes, right_codes), (right, right_codes, left_codes)):
+        absent = ~pd.Series(codes).isin(other).values
+        rows = df.loc[absent, keys + ['source']]
+        absent_codes = pd.Series(codes[absent])
+        first = ~absent_codes.duplicated().values
+        rows = rows[first]
+        rows['count'] = absent_codes.value_counts().reindex(absent_codes[first]).values
+        missing.append(rows)
+
+    return pd.concat(missing, ignore_index=True)
+
+
+def measure_variances(df, comparison):
+    """
+    Compares every measure of rows matched on the keys.
+    :param df: merge of both data sets on the keys, the measures of the first one suffixed _x and of the second _y
+    :param comparison: Comparison
+    :return: boolean array of the rows where any measure differs by more than its tolerance, and dict of measure ->
+    array of its variance, int64 cents with MISSING_CENTS where an amount is missing, float64 with NaN where a number
+    is missing
+    """
+    differs = np.zeros(len(df), dtype=bool)
+    variances = {}
+    for measure, column in comparison.measure_columns.items():
+        col = cleaned_column(column)
+        dtype = MEASURE_DTYPES[comparison.types[measure]]
+        left, right = (df[col + suffix].values.astype(dtype) for suffix in ('_x', '_y'))
+        # missing measures never match
+        if dtype is np.int64:
+            absent = (left == MISSING_CENTS) | (right == MISSING_CENTS)
+            missing, tolerance = MISSING_CENTS, tolerance_cents(comparison.tolerances[measure])
+        else:
+            absent = np.isnan(left) | np.isnan(right)
+            missing, tolerance = np.nan, comparison.tolerances[measure]
+        variance = np.abs(np.where(absent, 0, left - right))
+        differs |= absent | (variance > tolerance)
+        variances[measure] = np.where(absent, missing, variance).astype(dtype)
+
+    return differs, variances
+
+
+def find_variances(left, right, comparison):
+    """
+    Compares every measure of the rows matched on the keys in a single merge pass.
+    :param left: first cleaned dataframe
+    :param right: second cleaned dataframe
+    :param comparison: Comparison
+    :return: dataframe of the keys and the variance of every measure of the matched rows where any measure differs by
+    more than its tolerance, the last match wins for duplicated keys, see measure_variances
+    """
+    keys = comparison.key_columns
+    columns = keys + list(dict.fromkeys(cleaned_column(x) for x in comparison.measure_columns.values()))
+    df = pd.merge(left[columns], right[columns], how='inner', on=keys)
+
+    differs, variances = measure_variances(df, comparison)
+    differ = df.loc[differs, keys]
+    for measure, name in comparison.variance_columns.items():
+        differ[name] = variances[measure][differs]
+
+    return differ.drop_duplicates(keys, keep='last')
+
+
+def finding_keys(left, right, comparison):
+    """
+    Finds the keys a comparison of two partitioned data sets reports, without collecting the data sets: the distinct
+    keys of each one are anti-joined with the other's and the matched rows are merged and compared as dask
+    computations. Only the keys found are collected, find_missing and find_variances report the same on the rows of
+    those keys as on the whole data sets.
+    :param left: first cleaned dask dataframe
+    :param right: second cleaned dask dataframe
+    :param comparison: Comparison
+    :return: dataframe of the distinct keys of one data set only and of the matched rows that differ
+    """
+    import dask.dataframe as dd
+
+    keys = comparison.key_columns
+    columns = keys + list(dict.fromkeys(cleaned_column(x) for x in comparison.measure_columns.values()))
+    distinct = [df[keys].drop_duplicates() for df in (left, right)]
+
+    found = []
+    for own, other in ((distinct[0], distinct[1]), (distinct[1], distinct[0])):
+        marked = dd.merge(own, other.assign(**{FOUND_COLUMN: True}), how='left', on=keys)
+        found.append(marked[marked[FOUND_COLUMN].isnull()][keys])
+
+    merged = dd.merge(left[columns], right[columns], how='inner', on=keys)
+    found.append(merged.map_partitions(lambda x: x.loc[measure_variances(x, comparison)[0], keys],
+                                       meta=left[keys].dtypes.to_dict()))
+
+    return dd.concat(found).drop_duplicates().compute().reset_index(drop=True)
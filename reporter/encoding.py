@@ -0,0 +1,228 @@
+"""
+Dictionary encoding of identifiers. Fund names, gift IDs and payment IDs are mapped to dense integer codes once, the
+analysis runs on arrays of codes, and codes are only decoded back to strings for the rows of the report.
+
+Groups hold the distinct values of every key as flat arrays in the compressed sparse row layout: the values of the key
+at position i are values[offsets[i]:offsets[i + 1]]. Keys and the values within each key keep the order in which they
+first appear, so iterating a group gives the same order as walking the rows one at a time.
+
+The value sets of two groups are compared in bulk, both ways at once, by compare_values. When the values have at most
+MASK_BITS codes, e.g. the few dozen funds of an export, the set of every key is a single 64 bit mask and the differences
+of all the sets are and-nots over two arrays; otherwise the pair codes of both groups are matched.
+"""
+import numpy as np
+import pandas as pd
+
+# codes are stored as 32 bit integers, half the size of the default int64 arrays
+CODE_DTYPE = np.int32
+
+# value sets of vocabularies with at most this many codes are compared as bitmasks
+MASK_BITS = 64
+
+# number of bits set in every byte
+BYTE_BITS = np.array([bin(x).count('1') for x in range(256)], dtype=np.uint8)
+
+
+class Vocabulary:
+    """
+    Maps values to dense integer codes in the order they are first encoded. Encoding several columns with the same
+    vocabulary gives equal values the same code across all of them, e.g. the funds of the payments and the pledges.
+    """
+    def __init__(self):
+        self.index = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self.index)
+
+    def encode(self, values):
+        """
+        :param values: series or array of values
+        :return: array of codes, -1 for missing values
+        """
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype=object)
+        positions = self.index.get_indexer(uniques)
+
+        unseen = positions < 0
+        if unseen.any():
+            positions[unseen] = np.arange(len(self.index), len(self.index) + unseen.sum())
+            self.index = self.index.append(pd.Index(uniques[unseen], dtype=object))
+
+        return np.append(positions, -1).astype(CODE_DTYPE)[codes]
+
+    def decode(self, codes):
+        """
+        :param codes: array of codes
+        :return: object array of values
+        """
+        return self.index.values[np.asarray(codes)]
+
+
+def pair_codes(keys, values, width):
+    """
+    Combines key and value codes into a single int64 code per pair.
+    :param keys: key codes
+    :param values: value codes
+    :param width: number of distinct value codes
+    :return: int64 array
+    """
+    return np.asarray(keys, dtype=np.int64) * width + np.asarray(values, dtype=np.int64)
+
+
+class Groups:
+    """
+    Distinct values of every key, in the compressed sparse row layout described in the module docstring.
+    """
+    def __init__(self, keys, offsets, values, size):
+        """
+        :param keys: key codes in first seen order
+        :param offsets: start of the values of every key, followed by the total number of values
+        :param values: value codes
+        :param size: number of key codes of the vocabulary the keys come from
+        """
+        self.keys = np.asarray(keys, dtype=CODE_DTYPE)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.values = np.asarray(values, dtype=CODE_DTYPE)
+        self.positions = np.full(size, -1, dtype=CODE_DTYPE)
+        self.positions[self.keys] = np.arange(len(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def sizes(self):
+        """number of values of every key"""
+        return np.diff(self.offsets)
+
+    def owners(self):
+        """key code of every value"""
+        return np.repeat(self.keys, self.sizes)
+
+    def locate(self, keys):
+        """
+        :param keys: key codes
+        :return: position of every key in the groups, -1 for keys without values
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        inside = (keys >= 0) & (keys < len(self.positions))
+        located = np.full(len(keys), -1, dtype=np.int64)
+        located[inside] = self.positions[keys[inside]]
+
+        return located
+
+    def expand(self, positions):
+        """
+        Gathers the values of several keys.
+        :param positions: positions of the keys, as returned by locate
+        :return: index in positions of every gathered value, and the values
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        owner = np.repeat(np.arange(len(positions)), lengths)
+        index = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+        return owner, self.values[index]
+
+    def to_dict(self, keys, values):
+        """
+        Decodes the groups into a dict of key -> list of distinct values.
+        :param keys: vocabulary of the keys
+        :param values: vocabulary of the values
+        :return: dict
+        """
+        decoded = values.decode(self.values)
+        groups = np.split(decoded, self.offsets[1:-1])
+
+        return dict(zip(keys.decode(self.keys), (group.tolist() for group in groups)))
+
+
+def group_codes(keys, values, size, width):
+    """
+    Groups the distinct value codes of every key code.
+    :param keys: key code of every row
+    :param values: value code of every row
+    :param size: number of key codes of the vocabulary of the keys
+    :param width: number of value codes of the vocabulary of the values
+    :return: Groups
+    """
+    pairs = pd.unique(pair_codes(keys, values, width))
+    pair_keys, pair_values = pairs // width, pairs % width
+    order_codes, first_keys = pd.factorize(pair_keys)
+
+    # stable sort keeps the first seen order of the values inside every group
+    order = np.argsort(order_codes, kind='mergesort')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(order_codes, minlength=len(first_keys)))])
+
+    return Groups(first_keys, offsets, pair_values[order], size)
+
+
+def value_masks(groups):
+    """
+    Encodes the values of every key as a bitmask, bit v is set when the key has value code v.
+    :param groups: Groups whose value codes are below MASK_BITS
+    :return: uint64 array with the mask of every key of the groups
+    """
+    if not len(groups):
+        return np.zeros(0, dtype=np.uint64)
+
+    bits = np.left_shift(np.uint64(1), groups.values.astype(np.uint64))
+    return np.bitwise_or.reduceat(bits, groups.offsets[:-1])
+
+
+def popcount(masks):
+    """
+    :param masks: uint64 array
+    :return: number of bits set in every mask
+    """
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return BYTE_BITS[masks.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def mask_pairs(keys, masks, width):
+    """
+    Expands bitmasks back into the pairs of their key and of every value they hold.
+    :param keys: key code of every mask
+    :param masks: uint64 array, see value_masks
+    :param width: number of value codes
+    :return: int64 array of pair codes
+    """
+    keys, masks = keys[masks != 0], masks[masks != 0]
+    bits = np.unpackbits(masks.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    owner, values = np.nonzero(bits)
+
+    return pair_codes(keys[owner], values, width)
+
+
+def compare_values(left, right, width):
+    """
+    Compares the values of every key of two groups with the values of the same key in the other, both ways at once.
+    :param left: Groups
+    :param right: Groups with the same key and value vocabularies
+    :param width: number of value codes
+    :return: int64 arrays aligned with left.keys and with right.keys, counting the values of every key that are not
+    values of the same key in the other groups, -1 for the keys without values there, and the sorted pair codes of the
+    symmetric difference of both groups, the key and value pairs found in only one of them
+    """
+    located = [right.locate(left.keys), left.locate(right.keys)]
+
+    if width <= MASK_BITS:
+        masks = [value_masks(left), value_masks(right)]
+        only = []
+        for own, other, position in ((masks[0], masks[1], located[0]), (masks[1], masks[0], located[1])):
+            found = position >= 0
+            shared = np.zeros(len(own), dtype=np.uint64)
+            shared[found] = other[position[found]]
+            only.append(own & ~shared)
+        counts = [popcount(x) for x in only]
+        difference = np.concatenate([mask_pairs(left.keys, only[0], width), mask_pairs(right.keys, only[1], width)])
+    else:
+        pairs = [pair_codes(x.owners(), x.values, width) for x in (left, right)]
+        only = [~np.isin(pairs[0], pairs[1]), ~np.isin(pairs[1], pairs[0])]
+        counts = [np.bincount(np.repeat(np.arange(len(x)), x.sizes), weights=y, minlength=len(x))
+                  for x, y in zip((left, right), only)]
+        difference = np.concatenate([pairs[0][only[0]], pairs[1][only[1]]])
+
+    counts = [np.where(x >= 0, y, -1).astype(np.int64) for x, y in zip(located, counts)]
+
+    return counts[0], counts[1], np.sort(difference)
@@ -0,0 +1,66 @@
+"""
+Execution engine settings shared by the report services. The pandas engine runs every stage in process on whole
+dataframes, the dask engine loads, cleans and reduces the inputs as partitioned dask computations and only collects the
+rows the findings are computed from.
+
+Independently of the engine, the prefect executor decides how the tasks of a flow are run. The local executor runs them
+one after another, the dask executors run independent tasks, such as loading and cleaning each file, at the same time.
+"""
+from contextlib import contextmanager
+
+ENGINES = ['pandas', 'dask']
+EXECUTORS = ['local', 'local-dask', 'dask']
+
+
+def get_executor(args):
+    """
+    Builds the prefect executor the flow of a report runs on.
+    :param args: arguments dict with optional executor, executor_address and workers keys. The executor is local
+    (default) to run tasks sequentially, local-dask to run independent tasks on a thread pool, or dask to run them on a
+    distributed cluster, either the one at executor_address or a local cluster of workers processes.
+    :return: prefect executor
+    """
+    executor = args.get('executor') or 'local'
+    if executor == 'local':
+        from prefect.engine.executors import LocalExecutor
+        return LocalExecutor()
+    elif executor == 'local-dask':
+        from prefect.engine.executors import LocalDaskExecutor
+        return LocalDaskExecutor(scheduler='threads')
+    elif executor == 'dask':
+        from prefect.engine.executors import DaskExecutor
+        if args.get('executor_address'):
+            return DaskExecutor(address=args['executor_address'])
+        if args.get('workers'):
+            return DaskExecutor(local_processes=True, n_workers=args['workers'])
+        return DaskExecutor(local_processes=True)
+
+    raise ValueError('{} is not a valid executor, pick one of {}'.format(executor, ', '.join(EXECUTORS)))
+
+
+@contextmanager
+def dask_scheduler(args):
+    """
+    Sets the scheduler dask computations run on for the duration of a report.
+    :param args: arguments dict with optional engine, scheduler and workers keys. The scheduler is threads (default),
+    processes or synchronous for the local schedulers, local-cluster to start a distributed LocalCluster, or the
+    address of an existing distributed scheduler.
+    """
+    if args.get('engine') != 'dask':
+        yield
+        return
+
+    import dask
+
+    scheduler = args.get('scheduler') or 'threads'
+    if scheduler == 'local-cluster':
+        from distributed import Client, LocalCluster
+        with LocalCluster(n_workers=args.get('workers'), processes=True) as cluster, Client(cluster):
+            yield
+    elif '://' in scheduler:
+        from distributed import Client
+        with Client(scheduler):
+            yield
+    else:
+        with dask.config.set(scheduler=scheduler):
+            yield
@@ -0,0 +1,157 @@
+"""
+Memory-mapped handoff of task results. With a handoff directory in the prefect context, the large results of a task
+(dataframes, numeric arrays, encoded groups and vocabularies) are written once to Arrow (Feather) and NumPy files in
+that directory and replaced by lightweight handles. Handles pickle as a file path, so executors move them between
+threads, processes and workers without copying the data, and downstream tasks memory-map the files when they resolve
+them: numeric arrays are not copied at all, dataframes are read through a memory map.
+
+Tasks opt in with the handoff decorator, placed under the prefect task decorator. Without a handoff directory the
+decorator passes results through untouched.
+"""
+import functools
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import prefect
+from .encoding import Groups, Vocabulary
+from .ingest import init_arrow
+
+
+class Handle:
+    """file backed result, resolved back to the result by load"""
+    def __init__(self, path, rows):
+        self.path = str(path)
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.path)
+
+
+class FrameHandle(Handle):
+    def load(self):
+        import pyarrow as pa
+        from pyarrow import feather
+        init_arrow()
+        return feather.read_table(pa.memory_map(self.path)).to_pandas()
+
+
+class ArrayHandle(Handle):
+    def load(self):
+        return np.load(self.path, mmap_mode='r')
+
+
+class GroupsHandle(Handle):
+    def __init__(self, arrays, rows):
+        super().__init__(None, rows)
+        self.arrays = arrays
+
+    def load(self):
+        groups = Groups.__new__(Groups)
+        groups.__dict__.update({name: handle.load() for name, handle in self.arrays.items()})
+        return groups
+
+
+class VocabularyHandle(Handle):
+    def load(self):
+        vocabulary = Vocabulary()
+        vocabulary.index = pd.Index(FrameHandle(self.path, self.rows).load()['value'], dtype=object)
+        return vocabulary
+
+
+def store(result, directory, loaded=None):
+    """
+    Writes the large members of a result to the handoff directory.
+    :param result: task result, dicts, lists and tuples are walked
+    :param directory: handoff directory
+    :param loaded: dict of id -> handle of the objects the task loaded, objects passed through are not written again
+    :return: the result with its large members replaced by handles
+    """
+    loaded = {} if loaded is None else loaded
+    if id(result) in loaded:
+        return loaded[id(result)]
+
+    path = Path(directory) / uuid.uuid4().hex
+    init_arrow()
+
+    if isinstance(result, pd.DataFrame):
+        result.reset_index(drop=True).to_feather(str(path.with_suffix('.feather')))
+        return FrameHandle(path.with_suffix('.feather'), len(result))
+    if isinstance(result, np.ndarray) and result.dtype != object:
+        np.save(str(path.with_suffix('.npy')), result)
+        return ArrayHandle(path.with_suffix('.npy'), len(result))
+    if isinstance(result, Groups):
+        return GroupsHandle({name: store(array, directory, loaded) for name, array in vars(result).items()},
+                            len(result))
+    if isinstance(result, Vocabulary):
+        pd.DataFrame({'value': result.index.values}).to_feather(str(path.with_suffix('.feather')))
+        return VocabularyHandle(path.with_suffix('.feather'), len(result))
+    if isinstance(result, dict):
+        return {key: store(value, directory, loaded) for key, value in result.items()}
+    if isinstance(result, (list, tuple)):
+        return type(result)(store(value, directory, loaded) for value in result)
+
+    return result
+
+
+def resolve(value, loaded=None):
+    """
+    Loads the handles of a task input.
+    :param value: task input, dicts, lists and tuples are walked
+    :param loaded: dict filled with id -> handle of every loaded object
+    :return: the input with its handles loaded
+    """
+    loaded = {} if loaded is None else loaded
+    if isinstance(value, Handle):
+        result = value.load()
+        loaded[id(result)] = value
+        return result
+    if isinstance(value, dict):
+        return {key: resolve(item, loaded) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(resolve(item, loaded) for item in value)
+
+    return value
+
+
+def handoff(func):
+    """
+    Task decorator resolving the handles of the inputs of a task, and storing its result to the handoff directory of
+    the prefect context when there is one.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        loaded = {}
+        result = func(*(resolve(x, loaded) for x in args),
+                      **{key: resolve(value, loaded) for key, value in kwargs.items()})
+        directory = prefect.context.get('handoff_dir')
+
+        return store(result, directory, loaded) if directory else result
+
+    return wrapper
+
+
+@contextmanager
+def handoff_context(args):
+    """
+    Creates the handoff directory of a flow run, and removes it once the run is over.
+    :param args: arguments dict with optional handoff and handoff_dir keys
+    :return: prefect context with the handoff directory, empty when results are handed off in memory
+    """
+    if args.get('handoff') != 'mmap':
+        yield {}
+        return
+
+    if args.get('handoff_dir'):
+        Path(args['handoff_dir']).mkdir(parents=True, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='handoff_', dir=args.get('handoff_dir'))
+    try:
+        yield {'handoff_dir': directory}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
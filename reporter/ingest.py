@@ -0,0 +1,272 @@
+"""
+Shared csv ingestion helpers for the report services. Each report declares the columns it reads and their dtypes, and
+only those columns are parsed, with column names standardized to lowercase and underscores. Files are read either whole
+or as a stream of fixed size chunks, which never holds the raw export whole.
+
+Submissions are validated from their header row only, before anything is parsed, and the files of a submission are
+loaded at the same time on a thread pool, as reads of the network shares the exports live on mostly wait on I/O.
+
+Two csv readers are available: the pandas C parser, and the multithreaded Arrow csv reader of pyarrow which parses the
+file across all cores. Both produce the same dataframes. The Arrow reader reads whole files only, streamed reads always
+use the pandas parser.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+try:
+    from pandas._libs.parsers import STR_NA_VALUES
+except ImportError:
+    # pandas < 1.0
+    from pandas.io.common import _NA_VALUES as STR_NA_VALUES
+
+READERS = ['pandas', 'pyarrow']
+
+_arrow_lock = threading.Lock()
+_arrow_ready = False
+
+# columns each report type reads, by standardized name, and the dtype they are loaded with. IDs are kept as strings
+# so leading zeros and alphanumeric IDs survive, funds are low cardinality and loaded as categories. Amounts carry
+# currency symbols and separators in the exports, so they are loaded as strings and parsed into int64 cents while
+# cleaning, see reporter/money.py.
+SCHEMAS = {
+    'fund_analysis': {'usergiftid_pledge': str,
+                      'paymentid': str,
+                      'fund': 'category',
+                      'gift_id': str,
+                      'fund_id': 'category'},
+    'standard_comparison': {'fund_id': str,
+                            'project_id': str,
+                            'total': str,
+                            'sum_of_amount.5': str},
+}
+
+# columns a file of each report type must hold, a file is valid when it holds every column of one of the layouts
+LAYOUTS = {
+    'fund_analysis': [['usergiftid_pledge', 'paymentid', 'fund'],
+                      ['gift_id', 'fund_id']],
+    'standard_comparison': [['project_id', 'sum_of_amount.5'],
+                            ['fund_id', 'total']],
+}
+
+
+def normalize_column(column):
+    """utility function to standardize a column name"""
+    return column.lower().replace(' ', '_')
+
+
+def read_header(path):
+    """
+    Reads only the header row of a csv.
+    :param path: csv file path
+    :return: list of column names as pandas labels them (duplicates are suffixed with .1, .2, ...)
+    """
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def validate_file(path, layouts):
+    """
+    Validates a submitted file from its header row only, so bad submissions fail before the file is parsed.
+    :param path: file path
+    :param layouts: lists of standardized column names, the file must hold every column of one of them
+    :return: standardized column names of the file
+    """
+    path = Path(path)
+    if '.csv' not in path.name.lower():
+        raise Exception("{} is not a .csv... This program currently only accepts .csv files".format(path))
+    if not path.is_file():
+        raise Exception("{} does not exist!".format(path))
+
+    try:
+        names = [normalize_column(x) for x in read_header(path)]
+    except pd.errors.EmptyDataError:
+        raise Exception("{} is empty, expected a header row".format(path))
+
+    if not any(set(layout) <= set(names) for layout in layouts):
+        raise Exception("{} is missing required columns: expected one of {}, found {}".format(
+            path, ' or '.join(str(x) for x in layouts), names))
+
+    return names
+
+
+def map_concurrently(func, items, workers=None):
+    """
+    Applies a function to every item on a thread pool, one thread per item by default.
+    :param func: function of a single item
+    :param items: list of items, e.g. the files of a submission
+    :param workers: maximum number of threads
+    :return: list of results in the order of the items, the first exception raised is raised again
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [func(x) for x in items]
+
+    with ThreadPoolExecutor(max_workers=workers or len(items)) as executor:
+        return list(executor.map(func, items))
+
+
+def validate_files(paths, layouts):
+    """
+    Validates the files of a submission at the same time from their header rows.
+    :param paths: file paths
+    :param layouts: lists of standardized column names, every file must hold every column of one of them
+    :return: standardized column names of every file
+    """
+    return map_concurrently(lambda x: validate_file(x, layouts), paths)
+
+
+def init_arrow():
+    """
+    Sets up the pandas support of pyarrow once per process. pyarrow sets it up on first use in a way that is not thread
+    safe, and the tasks of the parallel executors convert dataframes to and from Arrow on several threads at once, so
+    every conversion calls this first.
+    """
+    global _arrow_ready
+    if _arrow_ready:
+        return
+
+    with _arrow_lock:
+        if not _arrow_ready:
+            import pyarrow as pa
+            pa.Table.from_pandas(pd.DataFrame())
+            _arrow_ready = True
+
+
+def read_arrow(path, header, usecols, dtype):
+    """
+    Reads a csv with the multithreaded Arrow csv reader. Columns are parsed as strings, with the same missing value
+    markers as pandas, and converted to their dtype once in pandas.
+    :param path: csv file path
+    :param header: column names as pandas labels them
+    :param usecols: positions of the columns to read, every column when None
+    :param dtype: dict of column name -> dtype, or a single dtype for every column
+    :return: dataframe
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    init_arrow()
+    # the header is passed as the column names so repeated names get the same .1, .2, ... suffixes pandas gives them
+    include = [header[i] for i in usecols] if usecols is not None else list(header)
+    table = csv.read_csv(str(path),
+                         read_options=csv.ReadOptions(use_threads=True, column_names=list(header), skip_rows=1),
+                         convert_options=csv.ConvertOptions(column_types={name: pa.string() for name in include},
+                                                            include_columns=include,
+                                                            null_values=sorted(STR_NA_VALUES),
+                                                            strings_can_be_null=True))
+    df = table.to_pandas()
+    del table
+
+    for col in df.columns:
+        # arrow nulls come through as None, pandas marks missing values as NaN
+        if df[col].hasnans:
+            df[col] = df[col].where(df[col].notna())
+        col_dtype = dtype.get(col, str) if isinstance(dtype, dict) else dtype
+        if col_dtype is not str:
+            df[col] = df[col].astype(col_dtype)
+
+    return df
+
+
+def read_frames(path, schema=None, chunksize=None, reader='pandas'):
+    """
+    Reads a csv with standardized column names, loading only the columns of the schema with their declared dtypes.
+    :param path: csv file path
+    :param schema: dict of standardized column name -> dtype, every column is loaded as a string when None
+    :param chunksize: number of rows per chunk, the whole file is read as a single frame when None
+    :param reader: csv reader of whole files, pandas or pyarrow
+    :return: iterator of dataframes
+    """
+    header = read_header(path)
+    names = [normalize_column(x) for x in header]
+    usecols = None
+    dtype = str
+    if schema is not None:
+        usecols = [i for i, name in enumerate(names) if name in schema]
+        dtype = {header[i]: schema[names[i]] for i in usecols}
+        names = [names[i] for i in usecols]
+
+    if reader == 'pyarrow' and chunksize is None:
+        frames = [read_arrow(path, header, usecols, dtype)]
+    else:
+        frames = pd.read_csv(path, dtype=dtype, usecols=usecols, chunksize=chunksize)
+        if chunksize is None:
+            frames = [frames]
+
+    for df in frames:
+        df.columns = names
+        yield df
+
+
+def read_dask(path, schema):
+    """
+    Reads a csv as a partitioned dask dataframe with standardized column names, loading only the schema columns.
+    Categorical columns are loaded as strings, partitions rarely share categories so they are categorized by the
+    caller once the partitions are reduced and collected.
+    :param path: csv file path
+    :param schema: dict of standardized column name -> dtype
+    :return: dask dataframe
+    """
+    import dask.dataframe as dd
+
+    header = read_header(path)
+    names = [normalize_column(x) for x in header]
+    usecols = [i for i, name in enumerate(names) if name in schema]
+    dtype = {header[i]: str if schema[names[i]] == 'category' else schema[names[i]] for i in usecols}
+
+    ddf = dd.read_csv(str(path), dtype=dtype, usecols=usecols)
+
+    return ddf.rename(columns=dict(zip(ddf.columns, [names[i] for i in usecols])))
+
+
+def restore_categories(df, schema):
+    """
+    Converts the columns declared as categories in the schema back to categoricals after partitions or chunks with
+    different categories were concatenated.
+    :param df: dataframe
+    :param schema: dict of standardized column name -> dtype
+    :return: dataframe
+    """
+    for col in df.columns:
+        if schema.get(col) == 'category' and df[col].dtype.name != 'category':
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def fill_missing(df, value='nan'):
+    """
+    Fills missing values with a placeholder string, adding it to the categories of categorical columns first.
+    :param df: dataframe
+    :param value: placeholder for missing values
+    :return: dataframe
+    """
+    for col in df.columns:
+        if not df[col].hasnans:
+            continue
+        if df[col].dtype.name == 'category' and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+        df[col] = df[col].fillna(value)
+
+    return df
+
+
+def concat_frames(frames, columns=None):
+    """
+    Concatenates processed chunks back into a single dataframe. Categorical columns whose categories differ between
+    chunks are converted back to categoricals.
+    :param frames: list of dataframes
+    :param columns: columns of the empty result when no chunks were read
+    :return: dataframe
+    """
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat(frames, ignore_index=True)
+    categories = [col for col in frames[0].columns if frames[0][col].dtype.name == 'category']
+    for col in categories:
+        if df[col].dtype.name != 'category':
+            df[col] = df[col].astype('category')
+
+    return df
@@ -0,0 +1,215 @@
+"""
+Fixed-point money. Amounts are parsed once into int64 cents, compared and totalled as integers, so comparisons are exact
+and free of float noise, and turned back into currency only when a report is written. Missing amounts are kept as the
+MISSING_CENTS sentinel, an int64 column cannot hold NaN.
+"""
+import math
+import re
+import numpy as np
+import pandas as pd
+
+CENTS = 100
+
+MISSING_CENTS = np.iinfo(np.int64).min
+
+# integer digits of the largest amount, 10 ** 18 cents fit an int64 with room to spare and never reach MISSING_CENTS
+MAX_DIGITS = 16
+
+# ISO code of the currency of the exports, written before or after the amounts
+CURRENCY_CODE = 'USD'
+
+# a currency amount once its thousands separators are removed, nothing else: an optional currency code, a single sign or
+# opening parenthesis of an accounting negative and an optional $ in either order, the integer part, optional decimals,
+# at least one digit, an optional currency code suffix and the closing parenthesis, surrounded by whitespace
+AMOUNT_PATTERN = re.compile(r"""^\s*(?:{code}\s*)?(?P<prefix>\((?:\$\s*)?|\$\s*\(|[-+](?:\$\s*)?|\$\s*[-+]?|)(?=\.?\d)
+                                (?P<whole>\d*)(?:\.(?P<fraction>\d*))?
+                                (?:\s*{code})?(?P<close>\)?)\s*$""".format(code=CURRENCY_CODE), re.VERBOSE)
+
+# plain decimals with an exponent, parsed as floats
+EXPONENT_PATTERN = re.compile(r'^\s*[-+]?(?:\d+\.?\d*|\.\d+)[eE][-+]?\d+\s*$')
+
+# strings up to this many characters go through the fixed width parser, longer ones through the pattern
+PARSE_WIDTH = 32
+
+# classes of the characters of the fixed width parser, nul is the padding of the shorter strings
+OTHER, SPACE, DIGIT, POINT, SIGN, COMMA, DOLLAR, LETTER_U, LETTER_S, LETTER_D, PAD = range(11)
+CHARACTER_CLASSES = np.full(256, OTHER, dtype=np.uint8)
+CHARACTER_CLASSES[ord('0'):ord('9') + 1] = DIGIT
+CHARACTER_CLASSES[[ord(' '), ord('\t'), ord('\n'), ord('\r'), 0xa0]] = SPACE
+CHARACTER_CLASSES[ord('.')] = POINT
+CHARACTER_CLASSES[[ord('-'), ord('+')]] = SIGN
+CHARACTER_CLASSES[ord(',')] = COMMA
+CHARACTER_CLASSES[ord('$')] = DOLLAR
+CHARACTER_CLASSES[[ord('U'), ord('S'), ord('D')]] = [LETTER_U, LETTER_S, LETTER_D]
+CHARACTER_CLASSES[0] = PAD
+
+# states of the fixed width parser, which reads an optional $, an optional sign, the integer part with its commas,
+# optional decimals and an optional USD suffix, surrounded by whitespace
+(START, DOLLAR_READ, SIGN_READ, WHOLE_READ, POINT_READ, FRACTION_READ, SPACE_READ, U_READ, US_READ, USD_READ,
+ REJECTED) = range(11)
+TRANSITIONS = np.full((11, 11), REJECTED, dtype=np.uint8)
+for state, character, following in [
+        (START, SPACE, START), (START, DOLLAR, DOLLAR_READ), (START, SIGN, SIGN_READ), (START, DIGIT, WHOLE_READ),
+        (START, POINT, POINT_READ),
+        (DOLLAR_READ, SPACE, DOLLAR_READ), (DOLLAR_READ, SIGN, SIGN_READ), (DOLLAR_READ, DIGIT, WHOLE_READ),
+        (DOLLAR_READ, POINT, POINT_READ),
+        (SIGN_READ, DIGIT, WHOLE_READ), (SIGN_READ, POINT, POINT_READ),
+        (WHOLE_READ, DIGIT, WHOLE_READ), (WHOLE_READ, COMMA, WHOLE_READ), (WHOLE_READ, POINT, FRACTION_READ),
+        (WHOLE_READ, SPACE, SPACE_READ), (WHOLE_READ, LETTER_U, U_READ),
+        (POINT_READ, DIGIT, FRACTION_READ),
+        (FRACTION_READ, DIGIT, FRACTION_READ), (FRACTION_READ, SPACE, SPACE_READ), (FRACTION_READ, LETTER_U, U_READ),
+        (SPACE_READ, SPACE, SPACE_READ), (SPACE_READ, LETTER_U, U_READ),
+        (U_READ, LETTER_S, US_READ), (US_READ, LETTER_D, USD_READ), (USD_READ, SPACE, USD_READ)]:
+    TRANSITIONS[state, character] = following
+# the padding ends every string
+TRANSITIONS[:, PAD] = np.arange(11)
+
+# states a string may end in, START is a blank string
+ACCEPTED = np.isin(np.arange(11), [WHOLE_READ, FRACTION_READ, SPACE_READ, USD_READ])
+
+# states in which a digit belongs to the integer part
+WHOLE_STATES = np.isin(np.arange(11), [START, DOLLAR_READ, SIGN_READ, WHOLE_READ])
+
+
+def parse_pattern(values):
+    """
+    Parses currency strings against AMOUNT_PATTERN, for the strings the fixed width parser leaves out.
+    :param values: series of currency strings with a range index
+    :return: int64 array of cents, empty strings are MISSING_CENTS
+    :raises ValueError: for strings that are not amounts, and amounts over MAX_DIGITS integer digits
+    """
+    cents = np.full(len(values), MISSING_CENTS, dtype=np.int64)
+
+    text = values.str.replace(',', '', regex=False)
+    parts = text.str.extract(AMOUNT_PATTERN)
+    # parentheses come in pairs
+    opened = parts['prefix'].str.contains('(', regex=False).fillna(False).values.astype(bool)
+    parsed = parts['whole'].notna().values & (opened == (parts['close'] == ')').values)
+
+    rest = text[~parsed & (values.str.strip() != '').values]
+    exponent = rest.str.match(EXPONENT_PATTERN).fillna(False).values.astype(bool)
+    if not exponent.all():
+        raise ValueError('not currency amounts: {}'.format(list(values[rest.index[~exponent]].unique()[:5])))
+
+    parts = parts[parsed]
+    whole = parts['whole'].str.lstrip('0')
+    overflow = (whole.str.len() > MAX_DIGITS).values
+    if overflow.any():
+        raise ValueError('amounts over {} integer digits: {}'.format(MAX_DIGITS, list(values[parsed][overflow][:5])))
+
+    # whole units and the first 3 decimals, the third rounds the cents half away from zero
+    units = whole.where(whole != '', '0').astype(np.int64).values
+    decimals = (parts['fraction'].fillna('') + '000').str[:3].astype(np.int64).values
+    amounts = units * CENTS + (decimals + 5) // 10
+    negative = opened[parsed] | parts['prefix'].str.contains('-', regex=False).values.astype(bool)
+    cents[parsed] = np.where(negative, -amounts, amounts)
+
+    if len(rest):
+        scaled = rest.astype(float).values * CENTS
+        # checked before the cast, larger floats would wrap around or land on MISSING_CENTS
+        overflow = ~(np.abs(scaled) < CENTS * 10 ** MAX_DIGITS)
+        if overflow.any():
+            raise ValueError('amounts over {} integer digits: {}'.format(MAX_DIGITS,
+                                                                         list(values[rest.index[overflow]][:5])))
+        cents[rest.index.values] = np.round(scaled).astype(np.int64)
+
+    return cents
+
+
+def parse_fixed_point(strings):
+    """
+    Parses the usual currency strings, e.g. ' $-1,234.50 USD', on a fixed width array of their characters. The parser
+    is a state machine run a character position at a time across every string, strings in any other shape are left to
+    parse_pattern.
+    :param strings: array of strings, at most PARSE_WIDTH characters long
+    :return: int64 array of cents, empty strings are MISSING_CENTS, and a boolean array of the strings parsed
+    """
+    if not len(strings):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+
+    chars = np.array(list(strings), dtype=str)
+    if not chars.dtype.itemsize:
+        chars = chars.astype('U1')
+    # one row per character position, code points past 255 are never part of an amount and are clipped to work on bytes
+    codes = np.minimum(chars.view(np.uint32).reshape(len(chars), -1), 255).astype(np.uint8).T
+
+    state = np.full(len(chars), START, dtype=np.uint8)
+    whole = np.zeros(len(chars), dtype=np.int64)
+    digits = np.zeros(len(chars), dtype=np.int64)
+    fraction = np.zeros(len(chars), dtype=np.int64)
+    decimals = np.zeros(len(chars), dtype=np.int64)
+    for position in codes:
+        digit = position.astype(np.int64) - ord('0')
+        is_digit = CHARACTER_CLASSES[position] == DIGIT
+        in_whole = is_digit & WHOLE_STATES[state]
+        in_fraction = is_digit & ~WHOLE_STATES[state]
+        # leading zeros are not counted, digits past MAX_DIGITS overflow and are not accumulated
+        digits += in_whole & ((whole > 0) | (digit > 0))
+        whole = np.where(in_whole & (digits <= MAX_DIGITS), whole * 10 + digit, whole)
+        fraction = np.where(in_fraction & (decimals < 3), fraction * 10 + digit, fraction)
+        decimals += in_fraction
+        state = TRANSITIONS[state, CHARACTER_CLASSES[position]]
+
+    overflow = ACCEPTED[state] & (digits > MAX_DIGITS)
+    if overflow.any():
+        raise ValueError('amounts over {} integer digits: {}'.format(MAX_DIGITS, list(strings[overflow][:5])))
+
+    # the third decimal rounds the cents half away from zero
+    amounts = whole * CENTS + (fraction * 10 ** (3 - np.minimum(decimals, 3)) + 5) // 10
+    cents = np.where((codes == ord('-')).any(axis=0), -amounts, amounts)
+
+    return np.where(state == START, MISSING_CENTS, cents), ACCEPTED[state] | (state == START)
+
+
+def parse_cents(values):
+    """
+    Parses currency strings such as ' $1,234.50 USD', 'USD 12' or '(12.00)' into cents without going through floats.
+    Commas are thousands separators wherever they are, as in the original float parser, decimals past the cent are
+    rounded half away from zero, amounts with an exponent go through the float parser. The usual shapes are parsed
+    by parse_fixed_point, the others by parse_pattern.
+    :param values: series of currency strings, without missing values
+    :return: int64 array of cents, empty strings are MISSING_CENTS
+    :raises ValueError: for strings that are not amounts, and amounts over MAX_DIGITS integer digits
+    """
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    cents = np.full(len(values), MISSING_CENTS, dtype=np.int64)
+    if not len(values):
+        return cents
+
+    short = np.flatnonzero(np.fromiter(map(len, values.values), dtype=np.int64, count=len(values)) <= PARSE_WIDTH)
+    fixed, parsed = parse_fixed_point(values.values[short])
+    cents[short[parsed]] = fixed[parsed]
+
+    rest = np.ones(len(values), dtype=bool)
+    rest[short[parsed]] = False
+    if rest.any():
+        cents[rest] = parse_pattern(values[rest].reset_index(drop=True))
+
+    return cents
+
+
+def to_currency(cents):
+    """
+    :param cents: int64 array of cents
+    :return: float array of currency, NaN for missing amounts
+    """
+    cents = np.asarray(cents, dtype=np.int64)
+    return np.where(cents == MISSING_CENTS, np.nan, cents / CENTS)
+
+
+def total_cents(cents):
+    """
+    :param cents: int64 array of cents
+    :return: sum of the amounts that are not missing, in cents
+    """
+    cents = np.asarray(cents, dtype=np.int64)
+    return int(cents[cents != MISSING_CENTS].sum())
+
+
+def tolerance_cents(tolerance):
+    """
+    :param tolerance: largest difference in currency that is not reported
+    :return: largest difference in whole cents that is not reported
+    """
+    # rounded first so 0.29 is 29 cents, not the 28.999... of its float
+    return int(math.floor(round(tolerance * CENTS, 6)))
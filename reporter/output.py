@@ -0,0 +1,190 @@
+"""
+Output stage of the report flows. Reports are streamed to disk a slice of rows at a time by a ReportWriter, so the
+serialized report never has to be held in memory. Producers that compute their rows piecewise, like the merge of the
+findings of sharded runs, hand the writer an iterator of frames and nothing past the current slice is materialized;
+findings computed in a single pass are written from their dataframe. The output formats are:
+- csv: plain csv, the default.
+- gzip, zstd: csv compressed with gzip or zstandard (through the Arrow codecs).
+- parquet: Parquet file with a row group per slice of rows.
+- jsonl: JSON Lines, a JSON object per row.
+
+Every run also writes a small json manifest next to its reports, with the path, format, row count, columns and the totals
+of the numeric columns of every report, so dashboards can load the results without parsing the reports themselves.
+Money columns are handed over as int64 cents, written as currency and totalled exactly in cents.
+"""
+import gzip
+import json
+from pathlib import Path
+import pandas as pd
+from .money import CENTS, to_currency, total_cents
+
+OUTPUT_FORMATS = ['csv', 'gzip', 'zstd', 'parquet', 'jsonl']
+EXTENSIONS = {'csv': '.csv', 'gzip': '.csv.gz', 'zstd': '.csv.zst', 'parquet': '.parquet', 'jsonl': '.jsonl'}
+
+# rows serialized at a time, bounds the memory of the writer whatever the size of the report
+WRITE_CHUNKSIZE = 100000
+
+
+def output_directory(args):
+    """
+    :param args: arguments dict with an optional output key
+    :return: directory the reports of a run are written to, created when missing
+    """
+    directory = Path(args['output']) if args.get('output') else Path.cwd()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    return directory
+
+
+def report_path(directory, name, output_format='csv'):
+    """
+    :param directory: output directory
+    :param name: report name without extension, e.g. fund_report_{now}
+    :param output_format: one of OUTPUT_FORMATS
+    :return: path of the report with the extension of its format
+    """
+    return Path(directory) / (name + EXTENSIONS[output_format])
+
+
+class ReportWriter:
+    """
+    Streams dataframes to a report file, used as a context manager. Every call of write appends its rows to the report,
+    and the row count and numeric totals are kept as the rows go by for the manifest.
+    """
+    def __init__(self, path, output_format='csv', cents=None):
+        """
+        :param path: report file path
+        :param output_format: one of OUTPUT_FORMATS
+        :param cents: int64 cents columns, written as currency
+        """
+        if output_format not in EXTENSIONS:
+            raise ValueError('unknown output format {}, expected one of {}'.format(output_format, OUTPUT_FORMATS))
+
+        self.path = Path(path)
+        self.format = output_format
+        self.columns = None
+        self.rows = 0
+        self.totals = {}
+        self.cents = list(cents or [])
+        self._sink = None
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        if self.format == 'parquet':
+            return None
+        if self.format == 'gzip':
+            return gzip.open(str(self.path), 'wb')
+        if self.format == 'zstd':
+            import pyarrow as pa
+            return pa.CompressedOutputStream(pa.OSFile(str(self.path), 'wb'), 'zstd')
+
+        return open(str(self.path), 'wb')
+
+    def _write_chunk(self, chunk):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            if self._sink is None:
+                self._schema = table.schema
+                self._sink = pq.ParquetWriter(str(self.path), self._schema)
+            self._sink.write_table(table)
+            return
+
+        if self._sink is None:
+            self._sink = self._open()
+            if self.format != 'jsonl':
+                self._sink.write(chunk.to_csv(index=False).encode('utf-8'))
+                return
+
+        if self.format == 'jsonl':
+            if len(chunk):
+                # newer pandas versions end the lines with a newline already, slices must not leave blank lines
+                lines = chunk.to_json(orient='records', lines=True)
+                self._sink.write((lines if lines.endswith('\n') else lines + '\n').encode('utf-8'))
+        else:
+            self._sink.write(chunk.to_csv(index=False, header=False).encode('utf-8'))
+
+    def write(self, frame):
+        """
+        Appends the rows of a dataframe to the report.
+        :param frame: dataframe, with the columns of the first frame written
+        """
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        frame = frame[self.columns]
+
+        cents = [x for x in self.cents if x in frame.columns]
+        for start in range(0, len(frame), WRITE_CHUNKSIZE):
+            chunk = frame.iloc[start:start + WRITE_CHUNKSIZE]
+            if cents:
+                chunk = chunk.assign(**{col: to_currency(chunk[col].values) for col in cents})
+            self._write_chunk(chunk)
+
+        for col, total in frame.drop(columns=cents).select_dtypes('number').sum().items():
+            self.totals[col] = self.totals.get(col, 0) + (total.item() if hasattr(total, 'item') else total)
+        for col in cents:
+            self.totals[col] = self.totals.get(col, 0) + total_cents(frame[col].values)
+        self.rows += len(frame)
+
+    def close(self):
+        """Writes the header of reports without rows and closes the file."""
+        if self._sink is None and self.columns is not None:
+            self._write_chunk(pd.DataFrame(columns=self.columns))
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def describe(self):
+        """
+        :return: manifest entry of the report
+        """
+        return {'path': str(self.path),
+                'format': self.format,
+                'rows': self.rows,
+                'columns': self.columns or [],
+                'totals': {col: total / CENTS if col in self.cents else total for col, total in self.totals.items()},
+                'bytes': self.path.stat().st_size if self.path.exists() else 0}
+
+
+def write_report(directory, name, frames, output_format='csv', cents=None):
+    """
+    Streams report rows to a report file, every frame is written as soon as the producer hands it over.
+    :param directory: output directory
+    :param name: report name without extension
+    :param frames: dataframe of the report rows, or an iterator of dataframes producing them a slice at a time
+    :param output_format: one of OUTPUT_FORMATS
+    :param cents: int64 cents columns, written as currency
+    :return: the closed ReportWriter
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+
+    with ReportWriter(report_path(directory, name, output_format), output_format, cents) as writer:
+        for frame in frames:
+            writer.write(frame)
+
+    return writer
+
+
+def write_manifest(directory, report, now, writers):
+    """
+    Writes the manifest of a run next to its reports.
+    :param directory: output directory
+    :param report: report type, e.g. fund_analysis
+    :param now: timestamp of the run
+    :param writers: dict of name -> closed ReportWriter
+    :return: path of the manifest
+    """
+    path = Path(directory) / 'manifest_{}.json'.format(now)
+    with open(str(path), 'w') as f:
+        json.dump({'report': report, 'created': str(now),
+                   'outputs': {name: writer.describe() for name, writer in writers.items()}}, f, indent=2)
+
+    return path
@@ -0,0 +1,373 @@
+"""
+Execution planner of the report manager. Before a report runs, the planner sizes its inputs from their file stats and
+a sniffed sample of their first lines (header columns, bytes per row) and estimates the peak memory of the three ways a
+pair can be run:
+- in-memory: both files are loaded whole, the fastest plan.
+- chunked: the files are streamed --chunksize rows at a time, only the cleaned columns of every row are held. This
+saves memory on the standard comparison, whose exports are wide, not on the fund analysis, which keeps every loaded
+column.
+- sharded: the pair is split by join key into --shards shard files reconciled --workers at a time, see
+reporter/shard.py. The slowest plan, it bounds memory by the size of a shard.
+
+The first plan that fits the memory budget is picked, and its settings are added to the arguments of the run. The
+executor and engine given are always kept, the reason of the plan notes when small inputs are given the parallel
+executors or the dask engine, whose start up takes longer than the report itself. In directory mode the number of pairs
+run at once is capped so they fit the budget together.
+
+The budgets default to the memory available to the process and its cpu count. A plan given with --plan, or settings
+given with --chunksize or --shards, are kept. The plan picked and the reason it was picked are logged.
+
+The estimates are measured peaks per loaded csv cell of the exports of benchmarks/synthetic.py, they are meant to tell
+a 50 MB export from a 5 GB one, not to be exact.
+"""
+import math
+import os
+from pathlib import Path
+
+MB = 1024 * 1024
+
+PLANS = ['auto', 'in-memory', 'chunked', 'sharded']
+
+# share of the available memory used as the default budget
+MEMORY_HEADROOM = 0.8
+
+# memory of a report process with pandas, prefect and dask imported, before any data is loaded
+PROCESS_BYTES = 150 * MB
+
+# peak bytes per loaded csv cell of an in-memory run
+CELL_BYTES = {'fund_analysis': 80, 'standard_comparison': 280}
+
+# share of the in-memory peak a chunked run still holds, the cleaned columns of every row
+CHUNKED_SHARE = {'fund_analysis': 1.0, 'standard_comparison': 0.45}
+
+# bytes per row of the key index built while sharding, the paymentid owners of the fund analysis
+SHARD_KEY_BYTES = 40
+
+# share of the budget a chunk read while streaming may take
+CHUNK_SHARE = 0.125
+MIN_CHUNKSIZE = 10000
+MAX_CHUNKSIZE = 1000000
+MAX_SHARDS = 256
+
+# below this many csv bytes of inputs the parallel executors and the dask engine cost more than they save
+SMALL_INPUT_BYTES = 32 * MB
+
+# bytes sampled from the top of a file to estimate its row count
+SNIFF_BYTES = 64 * 1024
+
+
+def available_memory():
+    """
+    :return: bytes of memory available to the process, the lowest of the available system memory and the free memory
+    of its cgroup, or None when neither can be read
+    """
+    limits = []
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    limits.append(int(line.split()[1]) * 1024)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        limit = Path('/sys/fs/cgroup/memory.max').read_text().strip()
+        usage = Path('/sys/fs/cgroup/memory.current').read_text().strip()
+        if limit != 'max':
+            limits.append(int(limit) - int(usage))
+    except (OSError, ValueError):
+        pass
+
+    if not limits:
+        try:
+            limits.append(os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    return max(min(limits), 0)
+
+
+def available_cpus():
+    """:return: number of cpus the process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def sniff_rows(path, size):
+    """
+    Estimates the row count of a csv from the bytes per line of its first lines.
+    :param path: csv file path
+    :param size: file size in bytes
+    :return: estimated number of data rows
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+
+    header_end = sample.find(b'\n') + 1
+    if not header_end:
+        return 0
+
+    body = sample[header_end:]
+    if len(sample) == size:
+        return body.count(b'\n') + (0 if not body or body.endswith(b'\n') else 1)
+
+    # the last line of the sample is cut off
+    lines = body.count(b'\n')
+    if not lines:
+        return 1
+
+    return int((size - header_end) / (body.rfind(b'\n') + 1) * lines)
+
+
+class InputEstimate:
+    """
+    Size of an input file.
+    """
+    def __init__(self, path, columns):
+        """
+        :param path: csv file path
+        :param columns: standardized columns the report loads from its files
+        """
+        from .ingest import read_header, normalize_column
+
+        self.path = str(path)
+        self.size = os.path.getsize(self.path)
+        self.rows = sniff_rows(self.path, self.size)
+        header = [normalize_column(x) for x in read_header(self.path)]
+        self.columns = max(len(set(header) & set(columns)), 1)
+
+    @property
+    def cells(self):
+        return self.rows * self.columns
+
+    def __repr__(self):
+        return '{} ({:.0f} MB, ~{} rows, {} columns used)'.format(Path(self.path).name, self.size / MB, self.rows,
+                                                                    self.columns)
+
+
+def report_columns(args):
+    """
+    :param args: arguments dict of the run
+    :return: standardized columns the report loads from its files
+    """
+    from .ingest import SCHEMAS
+
+    if args['type'] == 'standard_comparison':
+        from .comparison import Comparison
+        return list(Comparison.from_args(args).schema(SCHEMAS['standard_comparison']))
+
+    return list(SCHEMAS['fund_analysis'])
+
+
+class Plan:
+    """
+    Strategy of a run, the settings it adds to the arguments and the reason it was picked.
+    """
+    def __init__(self, name, settings=None, reason=''):
+        """
+        :param name: in-memory, chunked, sharded, batch or given
+        :param settings: dict of arguments the plan sets
+        :param reason: why the plan was picked
+        """
+        self.name = name
+        self.settings = settings or {}
+        self.reason = reason
+
+    def apply(self, args):
+        """
+        :param args: arguments dict of the run
+        :return: the arguments with the settings of the plan
+        """
+        return dict(args, **self.settings)
+
+    def describe(self):
+        settings = ', '.join('{}={}'.format(key, value) for key, value in sorted(self.settings.items()))
+        return '{} plan{}: {}'.format(self.name, ' ({})'.format(settings) if settings else '', self.reason)
+
+
+class Planner:
+    """
+    Picks the plan of a run from the size of its inputs and the budgets of the arguments.
+    """
+    def __init__(self, args):
+        """
+        :param args: arguments dict with type, file1, file2 or dir, and the optional plan, memory_budget (megabytes)
+        and cpu_budget keys
+        """
+        self.args = args
+        self.report = args['type']
+        if args.get('memory_budget'):
+            self.memory = args['memory_budget'] * MB
+        else:
+            available = available_memory()
+            self.memory = int(available * MEMORY_HEADROOM) if available is not None else None
+        # the workers of a sharded run are capped by --workers as well
+        self.cpus = args.get('cpu_budget') or (args.get('workers') if not args.get('dir') else None) or available_cpus()
+
+    def budget(self):
+        return '{} MB and {} cpus'.format(self.memory // MB if self.memory is not None else 'unlimited', self.cpus)
+
+    def estimate(self, inputs):
+        """
+        :param inputs: list of InputEstimate
+        :return: dict with the rows and cells of the inputs, and the peak bytes of their data in memory and chunked
+        """
+        cells = sum(x.cells for x in inputs)
+        data = cells * CELL_BYTES[self.report]
+
+        return {'in-memory': data, 'chunked': data * CHUNKED_SHARE[self.report], 'cells': cells,
+                'rows': sum(x.rows for x in inputs)}
+
+    def chunksize(self, inputs):
+        """
+        :param inputs: list of InputEstimate
+        :return: rows per chunk, a chunk of the widest file takes at most CHUNK_SHARE of the budget
+        """
+        if self.memory is None:
+            return MAX_CHUNKSIZE
+
+        columns = max(x.columns for x in inputs)
+        rows = int(self.memory * CHUNK_SHARE / (columns * CELL_BYTES[self.report]))
+
+        return min(max(rows, MIN_CHUNKSIZE), MAX_CHUNKSIZE)
+
+    def chunk_bytes(self, inputs, chunksize):
+        """
+        :param inputs: list of InputEstimate
+        :param chunksize: rows per chunk
+        :return: peak bytes of the chunks of both files, they are read at the same time
+        """
+        return sum(min(chunksize, x.rows) * x.columns for x in inputs) * CELL_BYTES[self.report]
+
+    def sharded(self, inputs, estimate, chunksize):
+        """
+        Picks the shard and worker counts that fit the budget, the partitioning pass holds a chunk and the key index of
+        every row, every worker holds a shard, and every worker past the first is a process of its own.
+        :return: settings and estimated peak bytes
+        """
+        fixed = PROCESS_BYTES + self.chunk_bytes(inputs, chunksize) + estimate['rows'] * SHARD_KEY_BYTES
+        data = estimate['in-memory']
+
+        for workers in range(self.cpus, 0, -1):
+            room = (self.memory - fixed - (workers - 1) * PROCESS_BYTES) if self.memory is not None else data
+            if room <= 0:
+                continue
+            shards = max(math.ceil(data * workers / room), workers, 2)
+            if shards <= MAX_SHARDS:
+                peak = fixed + (workers - 1) * PROCESS_BYTES + data * workers / shards
+                return {'shards': shards, 'workers': workers, 'chunksize': chunksize}, peak
+
+        return {'shards': MAX_SHARDS, 'workers': 1, 'chunksize': chunksize}, fixed + data / MAX_SHARDS
+
+    def plan(self):
+        """
+        :return: Plan
+        """
+        if self.args.get('dir'):
+            return self.plan_batch()
+
+        try:
+            inputs = [InputEstimate(self.args[x], report_columns(self.args)) for x in ('file1', 'file2')]
+        except Exception as exc:
+            # a missing or unreadable file is reported by the validation of the flow
+            return Plan('given', reason='inputs could not be sized ({}), the run keeps its arguments'.format(exc))
+
+        forced = self.args.get('plan') or 'auto'
+        given = {key: self.args[key] for key in ('chunksize', 'shards') if self.args.get(key)}
+        if forced == 'auto' and given:
+            return Plan('given', reason='--chunksize or --shards given, sized {}'.format(inputs))
+
+        estimate = self.estimate(inputs)
+        peaks = {'in-memory': PROCESS_BYTES + estimate['in-memory']}
+        chunksize = self.args.get('chunksize') or self.chunksize(inputs)
+        peaks['chunked'] = PROCESS_BYTES + estimate['chunked'] + self.chunk_bytes(inputs, chunksize)
+        shard_settings, peaks['sharded'] = self.sharded(inputs, estimate, chunksize)
+        if self.args.get('shards'):
+            shard_settings['shards'] = self.args['shards']
+
+        sized = 'inputs {}, estimated peak {} in memory, {} chunked, {} sharded, budget {}'.format(
+            inputs, *('{:.0f} MB'.format(peaks[x] / MB) for x in ('in-memory', 'chunked', 'sharded')), self.budget())
+
+        if forced != 'auto':
+            name = forced
+            reason = '--plan {} given, {}'.format(forced, sized)
+        elif self.memory is None or peaks['in-memory'] <= self.memory:
+            name = 'in-memory'
+            reason = 'fits the memory budget, {}'.format(sized)
+        elif peaks['chunked'] <= self.memory and peaks['chunked'] < peaks['in-memory']:
+            name = 'chunked'
+            reason = 'does not fit in memory whole but fits streamed, {}'.format(sized)
+        elif self.args.get('state_dir'):
+            # incremental runs cannot be sharded, streaming is the smallest plan left
+            name = 'chunked'
+            reason = 'does not fit the memory budget and --state-dir runs cannot be sharded, {}'.format(sized)
+        else:
+            name = 'sharded'
+            reason = ('does not fit the memory budget in one piece, {}'.format(sized) if peaks['sharded'] <= self.memory
+                      else 'no plan fits the memory budget, sharding needs the least, {}'.format(sized))
+
+        settings = {'in-memory': {}, 'chunked': {'chunksize': chunksize}, 'sharded': shard_settings}[name]
+        # settings of the other plans given along with --plan
+        settings.update({key: None for key in ('chunksize', 'shards') if key not in settings and self.args.get(key)})
+
+        return Plan(name, settings, reason + self.parallelism(sum(x.size for x in inputs), name))
+
+    def parallelism(self, size, name):
+        """
+        The executor and engine are given by the user, they are kept whatever the size of the inputs.
+        :param size: csv bytes of the inputs
+        :param name: plan picked
+        :return: note added to the reason of the plan when small inputs are given the parallel executors or the dask
+        engine, empty otherwise
+        """
+        if size >= SMALL_INPUT_BYTES or name == 'sharded':
+            return ''
+
+        given = []
+        if self.args.get('engine') == 'dask':
+            given.append('--engine dask')
+        if self.args.get('executor') in ('local-dask', 'dask') and not self.args.get('executor_address'):
+            given.append('--executor {}'.format(self.args['executor']))
+        if not given:
+            return ''
+
+        return ', {} kept for {:.0f} MB of inputs, pandas on the local executor is likely faster under {} MB'.format(
+            ' and '.join(given), size / MB, SMALL_INPUT_BYTES // MB)
+
+    def plan_batch(self):
+        """
+        Caps the number of pairs of directory mode run at once so they fit the memory budget together.
+        :return: Plan
+        """
+        from .batch import find_pairs
+
+        if self.args.get('workers'):
+            return Plan('given', reason='--workers given in directory mode')
+
+        try:
+            columns = report_columns(self.args)
+            peaks = [PROCESS_BYTES + self.estimate([InputEstimate(x, columns) for x in files])['in-memory']
+                     for files in find_pairs(self.args['dir']).values() if len(files) == 2]
+        except Exception as exc:
+            return Plan('given', reason='pairs could not be sized ({}), the run keeps its arguments'.format(exc))
+
+        if not peaks:
+            return Plan('given', reason='no pairs found to size')
+
+        workers = min(self.cpus, len(peaks))
+        if self.memory is not None:
+            workers = max(min(workers, int(self.memory // max(peaks))), 1)
+
+        return Plan('batch', {'workers': workers},
+                    '{} pairs, largest estimated peak {:.0f} MB, budget {}'.format(len(peaks), max(peaks) / MB,
+                                                                                   self.budget()))
+
+
+def plan_run(args):
+    """
+    :param args: arguments dict of the run
+    :return: Plan
+    """
+    return Planner(args).plan()
@@ -0,0 +1,229 @@
+"""
+Per task instrumentation of the report flows. The timestamper state handler every task runs with measures the task
+between its Running and finished states: wall time, CPU time of the process running it, resident memory and the growth
+of the peak resident memory of the process. The measures travel on the final state of the task, so they come back from
+every executor, and are collected with the row counts of the task results into a run profile written once the flow
+finishes.
+
+Profiling also runs every task under cProfile and dumps its stats to a .prof file per task, to be read with pstats or
+snakeviz.
+"""
+import cProfile
+import json
+import re
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pendulum
+import prefect
+import psutil
+from .encoding import Groups
+from .handoff import Handle
+
+try:
+    import resource
+except ImportError:
+    # windows, peaks fall back to the resident memory when the task finishes
+    resource = None
+
+# results whose length is their row count
+SIZED = (pd.DataFrame, pd.Series, np.ndarray, Groups, Handle)
+
+PROFILE_COLUMNS = ['task', 'map_index', 'state', 'start', 'wall_seconds', 'cpu_seconds', 'rss_mb',
+                   'peak_rss_delta_mb', 'input_rows', 'output_rows', 'profile']
+
+
+def peak_rss():
+    """peak resident memory of the process so far, in megabytes"""
+    if resource is None:
+        return current_rss()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss():
+    """resident memory of the process, in megabytes"""
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def cpu_time():
+    """
+    CPU time of the process in seconds, user and system, over every thread of the process, so the thread pools of
+    pyarrow, dask and the file loads count, plus the CPU time of the child processes that have finished, such as the
+    workers of the shard process pool
+    """
+    if resource is None:
+        return time.process_time()
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def timestamper(task, old_state, new_state):
+    """
+    Task state handler that timestamps new states
+    and logs the duration between state changes using
+    the task's logger. Running states record where the
+    measures of the task start from, and the state the
+    task finishes with carries its measures.
+    """
+    new_state.timestamp = pendulum.now("utc")
+    if hasattr(old_state, "timestamp"):
+        duration = (new_state.timestamp - old_state.timestamp).in_seconds()
+        task.logger.info(
+            "{} seconds passed in between state transitions".format(duration)
+        )
+
+    if new_state.is_running():
+        new_state.started = {'start': str(new_state.timestamp),
+                             'wall': time.perf_counter(),
+                             'cpu': cpu_time(),
+                             'peak_rss': peak_rss()}
+        if prefect.context.get('profile_dir'):
+            new_state.profiler = cProfile.Profile()
+            new_state.profiler.enable()
+
+    elif new_state.is_finished() and hasattr(old_state, "started"):
+        started = old_state.started
+        new_state.metrics = {'start': started['start'],
+                             'wall_seconds': time.perf_counter() - started['wall'],
+                             'cpu_seconds': cpu_time() - started['cpu'],
+                             'rss_mb': current_rss(),
+                             'peak_rss_delta_mb': peak_rss() - started['peak_rss'],
+                             'profile': None}
+        if hasattr(old_state, "profiler"):
+            old_state.profiler.disable()
+            name = re.sub(r'\W+', '_', task.name.lower())
+            if prefect.context.get('map_index') is not None:
+                name = '{}_{}'.format(name, prefect.context.get('map_index'))
+            path = Path(prefect.context.get('profile_dir')) / '{}.prof'.format(name)
+            old_state.profiler.dump_stats(str(path))
+            new_state.metrics['profile'] = str(path)
+
+    return new_state
+
+
+def count_rows(result):
+    """
+    Counts the rows of a task result: the length of a dataframe, array, group, handle or list of keys, summed over the
+    members of dicts, lists and tuples holding them. Mappings of keys to lists count the items of the lists.
+    :param result: task result
+    :return: row count, or None when the result holds no rows
+    """
+    if isinstance(result, SIZED):
+        return len(result)
+
+    if isinstance(result, dict):
+        members = list(result.values())
+    elif isinstance(result, (list, tuple)):
+        members = result
+    else:
+        return None
+
+    containers = [x for x in members if isinstance(x, SIZED + (dict, list, tuple))]
+    if not containers:
+        return len(members) if isinstance(result, (list, tuple)) else None
+
+    counts = [x for x in (count_rows(x) for x in containers) if x is not None]
+
+    return sum(counts) if counts else None
+
+
+def task_states(flow_state):
+    """
+    Flattens the task states of a flow run.
+    :param flow_state: final state of the flow run
+    :return: list of (task, map index, state), mapped tasks are listed once per mapped run
+    """
+    states = []
+    for task, state in (flow_state.result or {}).items():
+        if state.is_mapped():
+            states.extend((task, i, x) for i, x in enumerate(state.map_states))
+        else:
+            states.append((task, None, state))
+
+    return states
+
+
+def collect_profile(flow, flow_state):
+    """
+    Builds the run profile of a flow run. The input rows of a task are the output rows of the tasks it depends on, one
+    element of them for the mapped runs of a task.
+    :param flow: flow that was run
+    :param flow_state: final state of the flow run
+    :return: dataframe with a row per task run
+    """
+    states = task_states(flow_state)
+    rows = {(task, index): count_rows(state.result) for task, index, state in states if state.is_successful()}
+    results = {task: state.result for task, index, state in states if index is None}
+
+    # output rows of every task, summed over the runs of mapped tasks
+    totals = {}
+    for (task, index), count in rows.items():
+        if count is not None:
+            totals[task] = totals.get(task, 0) + count
+
+    records = []
+    for task, index, state in states:
+        if not hasattr(state, 'metrics'):
+            continue
+
+        inputs = []
+        for edge in flow.edges_to(task):
+            if edge.mapped and index is not None and isinstance(results.get(edge.upstream_task), (list, tuple)):
+                inputs.append(count_rows(results[edge.upstream_task][index]))
+            else:
+                inputs.append(totals.get(edge.upstream_task))
+        inputs = [x for x in inputs if x is not None]
+
+        record = dict(state.metrics, task=task.name, map_index=index, state=type(state).__name__,
+                      input_rows=sum(inputs) if inputs else None, output_rows=rows.get((task, index)))
+        records.append(record)
+
+    records.sort(key=lambda x: (x['start'], x['map_index'] or 0))
+    profile = pd.DataFrame(records, columns=PROFILE_COLUMNS)
+    # keep the counts integers, missing counts would turn them into floats
+    for col in ['map_index', 'input_rows', 'output_rows']:
+        profile[col] = pd.Series([x[col] for x in records], index=profile.index, dtype=object)
+
+    return profile
+
+
+def profile_context(args, now):
+    """
+    Builds the prefect context of a flow run, with the directory the cProfile stats are dumped to when profiling.
+    :param args: arguments dict with optional profile and output keys
+    :param now: timestamp of the run
+    :return: context dict
+    """
+    if not args.get('profile'):
+        return {}
+
+    directory = Path(args.get('output') or Path.cwd()) / 'profile_{}'.format(now)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    return {'profile_dir': str(directory)}
+
+
+def write_profile(flow, flow_state, args, now):
+    """
+    Writes the run profile of a flow run as json and csv next to the reports.
+    :param flow: flow that was run
+    :param flow_state: final state of the flow run
+    :param args: arguments dict with an optional output key
+    :param now: timestamp of the run
+    :return: run profile dataframe
+    """
+    profile = collect_profile(flow, flow_state)
+
+    destination = Path(args.get('output') or Path.cwd())
+    profile.to_csv(destination / 'run_profile_{}.csv'.format(now), index=False)
+    with open(destination / 'run_profile_{}.json'.format(now), 'w') as f:
+        json.dump({'flow': flow.name, 'state': type(flow_state).__name__,
+                   'tasks': json.loads(profile.to_json(orient='records'))}, f, indent=2)
+
+    return profile
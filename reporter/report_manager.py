@@ -1,7 +1,11 @@
 import argparse
 import datetime
-from .services.fund_report import run as run_fund_report
-from .services.data_compare import run as run_standard_compare
+import json
+import os
+from .arguments import comparison_parser, run_parser
+
+# the report services pull in pandas, prefect and dask, they are imported by Reporter.run_checks for the report being
+# run only, so --help and argument errors return straight away
 
 
 now = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
@@ -9,61 +13,67 @@ now = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
 
 class ReportGen:
     """
-    This class is used as a shell for future development, and will serve as the entry point for any and all report
-    logging and validation checks prior to the prefect pipeline.
+    Entry point of every report run, checks the arguments and plans the run before the prefect pipeline starts.
     """
     def __init__(self, args):
         self.args = args
-        self.files = args['file1'], args['file2']
+        self.files = args.get('file1'), args.get('file2')
         if 'output' in args.keys():
             self.output_report_location = args['output']
         self.type = args['type']
-        self.results = self.run_report
-
-    @staticmethod
-    def check_arguments():
-        # """
-        # Checks whether the file is an spss or csv file
-        # :return: file type (spss or csv)
-        # """
-        # if str(self.file).endswith('.sav'):
-        #     details = 'This is a .sav file'
-        #     return {'value': 'sav', 'log_status': 1, 'log_details': details}
-        #
-        # elif str(self.file).endswith('.csv'):
-        #     details = 'This is a csv file.'
-        #     return {'value': 'csv', 'log_status': 1, 'log_details': details}
-        # else:
-        #     # return a failure or Raise Exception
-        #     return {'value': '', 'log_status': -1,
-        #             'log_details': 'The wrong file type was passed'}
-        return 0
-
-    @staticmethod
+        self.plan = None
+        self.results = None
+
+    def check_arguments(self):
+        """
+        Checks the arguments of the run for combinations the reports cannot run.
+        :return: list of problems, empty when the arguments are valid
+        """
+        problems = []
+        if not self.args.get('dir') and not all(self.files):
+            problems.append('either --dir or both --file1 and --file2 are required')
+        if self.args.get('state_dir') and (self.args.get('shards') or self.args.get('plan') == 'sharded'):
+            problems.append('sharded runs are full reconciliations and cannot be combined with --state-dir')
+
+        return problems
+
     def prep_for_report(self):
+        """
+        Plans the run from the size of its inputs and the memory and cpu budgets, see reporter/planner.py, and adds the
+        settings of the plan to the arguments.
+        :return: Plan
+        """
+        from prefect.utilities.logging import get_logger
+        from .planner import plan_run
 
-        return 0
+        self.plan = plan_run(self.args)
+        get_logger('Planner').info(self.plan.describe())
+        self.args = self.plan.apply(self.args)
+
+        return self.plan
 
-    @staticmethod
     def results_report(self):
         """
-        This function turns the dictionary of qc check results into a
-        dataframe.
-
-        :return: the results formatted into a dataframe and the generated
-        filename
+        :return: final state of the flow run, or the summary dataframe of a directory run
         """
+        return self.results
 
-        return 0
-
-    @staticmethod
     def run_report(self):
         """
-        This function checks if values exist within each existing required
-         column. Results "pass"/"fail" are passed to a results dict.
-
-        :return: dictionary of results (pass/fail)
+        Runs the report the arguments ask for.
+        :return: final state of the flow run, or the summary dataframe of a directory run
         """
+        if self.args.get('dir'):
+            from .batch import run_batch
+            self.results = run_batch(self.args)
+        elif self.type == 'fund_analysis':
+            from .services.fund_report import run as run_fund_report
+            self.results = run_fund_report(self.args)
+        elif self.type == 'standard_comparison':
+            from .services.data_compare import run as run_standard_compare
+            self.results = run_standard_compare(self.args)
+
+        return self.results
 
 
 class Reporter(ReportGen):
@@ -75,21 +85,41 @@ class Reporter(ReportGen):
 
     def run_checks(self):
         """
-        Using functions from the master class, this function executes the
-        checks in order and outputs the final results into a dict.
+        Using functions from the master class, this function plans the run and runs the report. The arguments are
+        checked once by the caller with check_arguments before, main reports the problems as argument errors and the
+        report server as bad requests.
 
-        :return: Final results dict
+        :return: Final results
         """
-        if self.type == 'fund_analysis':
-            self.results = run_fund_report(self.args)
-            return self.results_report(self)
-        elif self.type == 'standard_comparison':
-            self.results = run_standard_compare(self.args)
-            return self.results_report(self)
+        self.prep_for_report()
+        self.run_report()
+        return self.results_report()
+
+
+def run_on_server(args):
+    """
+    Sends a report run to a resident report server and prints the summary of the run.
+    :param args: parsed arguments, paths are resolved here as the server may run from another directory
+    :return: summary of the run
+    """
+    from .server import request
+
+    body = {key: value for key, value in args.items() if value not in (None, False) and key != 'server'}
+    for key in ('file1', 'file2', 'dir', 'output', 'state_dir', 'handoff_dir', 'cache_dir'):
+        if body.get(key):
+            body[key] = os.path.abspath(body[key])
+
+    status, summary = request(args['server'], '/report', body)
+    print(json.dumps(summary, indent=2))
+    if status != 200:
+        raise SystemExit(1)
+
+    return summary
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Finance Report Generator')
+    parser = argparse.ArgumentParser(description='Finance Report Generator',
+                                     parents=[run_parser(), comparison_parser()])
     parser.add_argument('-t', '--type', required=True, choices=['standard_comparison', 'fund_analysis'],
                         help='pick which type of report you need {}'),
 
@@ -100,18 +130,35 @@ def main():
                         help='file or directory of files to analyze'),
 
     parser.add_argument('-dir', '--dir', required=False,
-                        help='file or directory of files to analyze'),
+                        help='directory of file pairs to analyze in parallel, see reporter/batch.py for pairing'),
 
-    parser.add_argument('-o', '--output_report', required=False,
+    parser.add_argument('-o', '--output_report', dest='output', default=False, required=False,
                         help='submit a location where you would like a csv '
                              'report output to.'),
 
+    parser.add_argument('--plan', choices=['auto', 'in-memory', 'chunked', 'sharded'], default='auto', required=False,
+                        help='how the pair is run: auto (default) picks the first of in-memory, chunked or sharded that '
+                             'fits --memory-budget, see reporter/planner.py, --chunksize and --shards are kept'),
+
+    parser.add_argument('--memory-budget', type=int, default=None, required=False,
+                        help='memory the run may use in megabytes (default: 80%% of the available memory)'),
+
+    parser.add_argument('--cpu-budget', type=int, default=None, required=False,
+                        help='cpus the run may use for shards and directory mode pairs (default: cpu count)'),
+
+    parser.add_argument('--server', default=None, required=False,
+                        help='run the report on a resident report server instead of in this process, '
+                             'http://{host}:{port} or unix:{socket path}, see reporter/server.py'),
+
     args = vars(parser.parse_args())
+    reporter = Reporter(args)
+    for problem in reporter.check_arguments():
+        parser.error(problem)
 
-    runner = {'fund_analysis': Reporter(args).run_checks,
-              'standard_comparison': Reporter(args).run_checks}
+    if args.get('server'):
+        return run_on_server(args)
 
-    results = runner.get(args.get('type'))()
+    results = reporter.run_checks()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,243 @@
+"""
+Resident report server. Analysts run many ad hoc reports against the same few RE and SF snapshots; a new process per
+run pays for importing pandas and prefect and for loading and cleaning the snapshots every time. The server imports the
+report services once and keeps the cleaned snapshots in an in-memory LRU cache with a memory budget, so a report on
+files it has already seen skips straight to the comparison.
+
+The server listens on localhost HTTP or on a Unix socket and runs one report at a time:
+- POST /report with a json body holding the same arguments as the report manager, e.g.
+{"type": "fund_analysis", "file1": "payments.csv", "file2": "pledges.csv", "output": "reports/"}, answers with the state,
+duration and summary of the run (row counts and report paths).
+- GET /status answers with the statistics of the in-memory cache.
+- POST /clear empties the in-memory cache.
+
+Cached snapshots are keyed by path, size and modification time, a snapshot replaced on disk is loaded again. Reports run
+on the dask executor clean the files in other processes and do not use the in-memory cache.
+
+To Run:
+python -m reporter.server --port 8765 --memory-budget 4096
+python -m reporter.server --socket /tmp/reporter.sock
+python -m reporter.report_manager -t fund_analysis -f1 {payments} -f2 {pledges} -o {output} --server http://127.0.0.1:8765
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+REPORT_TYPES = ['standard_comparison', 'fund_analysis']
+
+
+def summarize(state):
+    """
+    Summarizes a report run.
+    :param state: final state of the flow run
+    :return: dict with the state, the summary returned by the report findings task and the failure of the run
+    """
+    from prefect.engine.state import TriggerFailed
+
+    summary = {'state': type(state).__name__, 'error': ''}
+    failures = []
+    for task, task_state in (state.result or {}).items():
+        if task.name == 'Report Findings' and task_state.is_successful():
+            summary.update(task_state.result)
+        elif task_state.is_failed():
+            failures.append((isinstance(task_state, TriggerFailed), '{}: {}'.format(task.name, task_state.message)))
+
+    if failures:
+        # the failure the others were triggered by
+        summary['error'] = min(failures)[1]
+
+    return summary
+
+
+def run_request(args, defaults):
+    """
+    Runs a report requested from the server.
+    :param args: report manager arguments of the request
+    :param defaults: arguments of the server every request starts from
+    :return: HTTP status and response body
+    """
+    import pendulum
+    from . import cache
+    from .report_manager import Reporter
+
+    args = dict(defaults, **args)
+    if args.get('type') not in REPORT_TYPES:
+        return 400, {'error': 'type must be one of {}'.format(REPORT_TYPES)}
+    if not (args.get('file1') and args.get('file2')):
+        return 400, {'error': 'file1 and file2 are required'}
+    if args.get('dir'):
+        return 400, {'error': 'directory mode is not available on the server'}
+
+    if args.get('refresh_cache') and cache.resident_cache is not None:
+        cache.resident_cache.clear()
+    args['now'] = str(pendulum.now())
+
+    start = time.perf_counter()
+    reporter = Reporter(args)
+    problems = reporter.check_arguments()
+    if problems:
+        return 400, {'error': '; '.join(problems)}
+    reporter.run_checks()
+    summary = summarize(reporter.results)
+    summary['seconds'] = time.perf_counter() - start
+
+    return (200 if summary['state'] == 'Success' else 500), summary
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """answers the requests of the report server, the server holds the default arguments of the reports"""
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def respond(self, status, body):
+        payload = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        from . import cache
+        if self.path != '/status':
+            return self.respond(404, {'error': 'unknown path {}'.format(self.path)})
+
+        stats = cache.resident_cache.stats() if cache.resident_cache is not None else None
+        self.respond(200, {'status': 'ok', 'pid': os.getpid(), 'cache': stats})
+
+    def do_POST(self):
+        from . import cache
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            args = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as exc:
+            return self.respond(400, {'error': 'invalid json: {}'.format(exc)})
+
+        if self.path == '/clear':
+            if cache.resident_cache is not None:
+                cache.resident_cache.clear()
+            return self.respond(200, {'status': 'cleared'})
+        if self.path != '/report':
+            return self.respond(404, {'error': 'unknown path {}'.format(self.path)})
+
+        try:
+            status, body = run_request(args, self.server.defaults)
+        except Exception as exc:
+            status, body = 500, {'state': 'Failed', 'error': repr(exc)}
+        self.respond(status, body)
+
+
+class UnixReportServer(socketserver.UnixStreamServer):
+    """report server listening on a Unix socket"""
+    def __init__(self, path, handler):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, handler)
+
+
+def serve(args):
+    """
+    Imports the report services, sets up the in-memory cache and serves report requests until interrupted.
+    :param args: server arguments dict with host, port, socket, memory_budget and the cache settings of the on-disk
+    cache the in-memory cache falls back to
+    """
+    from . import cache
+    # imported once so requests do not pay for it
+    from .services import data_compare, fund_report
+
+    backing = cache.open_cache(args)
+    cache.resident_cache = cache.MemoryCache(args.get('memory_budget') or cache.DEFAULT_MEMORY_SIZE, backing)
+
+    if args.get('socket'):
+        server = UnixReportServer(args['socket'], ReportHandler)
+        address = args['socket']
+    else:
+        server = HTTPServer((args.get('host') or DEFAULT_HOST, args.get('port') or DEFAULT_PORT), ReportHandler)
+        address = 'http://{}:{}'.format(*server.server_address[:2])
+
+    # every request runs with the output settings the server was started with unless it overrides them
+    server.defaults = {key: args[key] for key in ('output', 'output_format') if args.get(key)}
+    print('serving reports on {}'.format(address), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.get('socket') and os.path.exists(args['socket']):
+            os.unlink(args['socket'])
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket"""
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(address, path, body=None, timeout=None):
+    """
+    Sends a request to a running report server.
+    :param address: http://{host}:{port} or unix:{socket path}
+    :param path: /report, /status or /clear
+    :param body: json body of POST requests, a GET request is sent when None
+    :param timeout: socket timeout in seconds
+    :return: HTTP status and response body
+    """
+    if address.startswith('unix:'):
+        connection = UnixHTTPConnection(address[len('unix:'):], timeout=timeout)
+    else:
+        parsed = urlparse(address if '://' in address else 'http://' + address)
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or DEFAULT_PORT, timeout=timeout)
+
+    try:
+        if body is None:
+            connection.request('GET', path)
+        else:
+            connection.request('POST', path, json.dumps(body, default=str), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident Report Server')
+    parser.add_argument('--host', default=DEFAULT_HOST, required=False,
+                        help='interface the server listens on, localhost by default.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, required=False,
+                        help='port the server listens on.')
+    parser.add_argument('--socket', default=None, required=False,
+                        help='listen on this Unix socket instead of HTTP on localhost.')
+    parser.add_argument('--memory-budget', type=int, default=None, required=False,
+                        help='memory cap of the in-memory cache of cleaned files in megabytes.')
+    parser.add_argument('-o', '--output', default=False, required=False,
+                        help='location the reports are saved to when a request does not provide one.')
+    parser.add_argument('--output-format', default=None, required=False,
+                        help='format of the reports when a request does not provide one.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not back the in-memory cache with the on-disk cache of cleaned files.')
+    parser.add_argument('--cache-dir', default=None, required=False,
+                        help='directory of the on-disk cache of cleaned files.')
+    parser.add_argument('--cache-size', type=int, default=None, required=False,
+                        help='size cap of the on-disk cache in megabytes.')
+
+    serve(vars(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
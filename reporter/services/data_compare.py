@@ -1,225 +1,588 @@
 """
-This script takes two csv files and compares them based on the field provided.
-For example, if a field called "JOBID" is provided, this program takes File1 and
-File2 and compares them based on the "JOBID" field. This program determines whether the field provided are
-identical in both files or not. If they are not identical, a report is exported illustrating the differences.
+This script takes two csv files and compares them based on the fields provided.
+Rows of File1 and File2 are matched on the key columns (the project ID by default) and every measure
+provided (the project total by default) is compared between the matched rows, within its tolerance. This
+program determines whether the fields provided are identical in both files or not. If they are not identical,
+a report is exported illustrating the differences.
 
 To Run:
-python data_compare.py -f1 {File1} -f2 {file2} -c {Field to compare} -o {Report Output Location}
+python data_compare.py -f1 {File1} -f2 {file2} -c {Fields to compare} -o {Report Output Location}
+python data_compare.py -f1 {File1} -f2 {file2} -c amount count --tolerance amount=0.01 -o {Report Output Location}
 """
 import argparse
-import os
+from functools import partial
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import pendulum
-from prefect import task, Flow, Parameter
+from prefect import task, unmapped, Flow, Parameter
+from ..cache import load_cached, open_cache
+from ..handoff import handoff, handoff_context
+from ..arguments import comparison_parser, run_parser
+from ..engine import dask_scheduler, get_executor
+from ..profiling import timestamper, profile_context, write_profile
+from ..comparison import (AMOUNT, NUMBER, PROJECT_ID_KEYS, Comparison, RE_COLUMNS, cleaned_column, composite_key,
+                          find_missing, find_variances, finding_keys)
+from ..money import MISSING_CENTS, parse_cents
+from ..output import output_directory, write_report, write_manifest
+from ..ingest import SCHEMAS, LAYOUTS, read_frames, read_dask, concat_frames, validate_files, map_concurrently
+from ..shard import (SHARD_CHUNKSIZE, ROW_COLUMN, ShardWriter, shard_ids, read_shard, number_rows, map_shards,
+                     order_rows, shard_context)
+from ..state import open_state, with_hashes, changed_rows, first_seen
+
+# side of the pair a missing key was found in, the keys of file1 are reported before the keys of file2
+SIDE_COLUMN = 'shard_side'
 
 now = pendulum.now()
-current_dir = Path.cwd()
 
+# bump whenever the output of load_file changes so cached files are cleaned again
+CLEAN_VERSION = 6
 
-def sort_nums(num1, num2):
-    """utility function to return numbers in order"""
-    if num1 > num2:
-        return num1, num2
-    elif num2 > num1:
-        return num2, num1
 
+@task(name='Gather Data', state_handlers=[timestamper])
+@handoff
+def gather_data(instance):
+    """
+    Gathers and validates the file paths per the arguments provided. Both files
+    are validated at the same time from their header rows only, so a bad
+    submission fails before anything is parsed.
+    :param args: Supplied arguments when the program is initiated
+    :return: 2 file paths
+    """
+    paths = [instance.get('file1'), instance.get('file2')]
+    if not all(Path(x).parents[0].is_dir() for x in paths):
+        raise Exception('Please pass a valid file path.')
+
+    comparison = Comparison.from_args(instance)
+    for path, names in zip(paths, validate_files(paths, LAYOUTS['standard_comparison'])):
+        if 'fund_id' in names:
+            names = [RE_COLUMNS.get(x, x) for x in names]
+        absent = [x for x in comparison.source_columns() if x not in names]
+        if absent:
+            raise Exception('{} is missing the compared columns {}'.format(path, absent))
 
-def timestamper(task, old_state, new_state):
+    return paths
+
+
+def map_unique(values, func, missing=np.nan):
     """
-    Task state handler that timestamps new states
-    and logs the duration between state changes using
-    the task's logger.
+    Applies a vectorized function to the distinct values of a series only and maps the result back onto every row.
+    :param values: series
+    :param func: function taking and returning a series or array of the distinct values
+    :param missing: value of the rows whose value is missing
+    :return: series aligned with values
     """
-    new_state.timestamp = pendulum.now("utc")
-    if hasattr(old_state, "timestamp"):
-        duration = (new_state.timestamp - old_state.timestamp).in_seconds()
-        task.logger.info(
-            "{} seconds passed in between state transitions".format(duration)
-        )
-    return new_state
+    codes, uniques = pd.factorize(values)
+    lookup = np.append(np.asarray(func(pd.Series(uniques, dtype=object))), missing)
 
+    return pd.Series(lookup[codes], index=values.index)
 
-@task(name='Gather Data', state_handlers=[timestamper])
-def gather_data(instance):
+
+def normalize_project_ids(ids):
     """
-    Gathers paths and converts to data frames per the arguments provided. Multiple
-    checks are in place to ensure data exists prior to processing.
-    :param args: Supplied arguments when the program is initiated
-    :return: 2 dataframes and arguments object
+    Standardizes project IDs: strips them, collapses the spacing around dashes, replaces dashes and spaces with
+    underscores and lowercases them, e.g. 'AB - 1 2' -> 'ab_1_2'.
+    :param ids: series of project IDs
+    :return: series of standardized project IDs
     """
-    paths = [instance.get('file1'), instance.get('file2')]
-    if Path(instance.get('file1')).parents[0].is_dir() is True and Path(
-            instance.get('file2')).parents[0].is_dir() is True:
-        files = [f for f in paths if os.path.isfile(f)]
-        if len(files) == 0:
-            raise Exception('The files you passed do not exist!')
-        dfs = []
-        for file in files:
-            try:
-                if file.endswith('.csv'):
-                    dfs.append(pd.read_csv(file))
-
-                else:
-                    raise Exception('Please pass a file ending in .csv')
-
-            except Exception as exc:
-                formatted = "Unable to locate files! Please ensure you have provided accurate file paths. {}".format(
-                    repr(exc))
-                raise Exception(formatted)
-
-        return dfs, instance
+    def normalize(unique):
+        unique = unique.str.strip()
+        for spaced in (' - ', '- ', ' -'):
+            unique = unique.str.replace(spaced, '-', regex=False)
+
+        return unique.str.replace('[- ]', '_', regex=True).str.lower()
+
+    return map_unique(ids, normalize)
+
+
+def normalize_amounts(amounts):
+    """
+    Parses currency strings such as ' $1,234.50 USD' into int64 cents, see reporter/money.py.
+    :param amounts: series of currency strings
+    :return: int64 series of cents, missing amounts are MISSING_CENTS
+    """
+    return map_unique(amounts, parse_cents, MISSING_CENTS).astype(np.int64)
+
+
+def parse_numbers(values):
+    """
+    Parses plain numbers such as ' 1,234' or '3.5', commas are thousands separators.
+    :param values: series of number strings, without missing values
+    :return: float64 array, blank strings are NaN
+    :raises ValueError: for strings that are not numbers, e.g. currency amounts
+    """
+    text = values.str.replace(',', '', regex=False).str.strip()
+    numbers = pd.to_numeric(text.where(text != ''), errors='coerce')
+    invalid = (numbers.isna() & (text != '')).values
+    if invalid.any():
+        raise ValueError('not numbers: {}'.format(list(values[invalid][:5])))
+
+    return numbers.values.astype(np.float64)
+
+
+def normalize_numbers(numbers):
+    """
+    Parses plain number strings such as the gift counts into float64.
+    :param numbers: series of number strings
+    :return: float64 series, missing numbers are NaN
+    """
+    return map_unique(numbers, parse_numbers).astype(np.float64)
+
+
+def normalize_keys(keys):
+    """
+    Strips the keys that are not project IDs.
+    :param keys: series of key strings
+    :return: series of stripped keys
+    """
+    return map_unique(keys, lambda unique: unique.str.strip())
+
+
+# cleaning of every measure type
+NORMALIZERS = {AMOUNT: normalize_amounts, NUMBER: normalize_numbers}
+
+
+def standardize(df, comparison=None):
+    """
+    cleans and standardizes a single data set, or a chunk of one
+    :param df: dataframe with standardized column names
+    :param comparison: Comparison whose keys and measures are cleaned, the default comparison when None
+    :return: cleaned dataframe
+    """
+    comparison = comparison or Comparison()
 
+    # clean columns in dataframes, the names of the RE data set are flipped to match SF
+    if 'fund_id' in df.columns:
+        df['source'] = 'RE'
+        df.rename(columns=RE_COLUMNS, inplace=True)
     else:
-        raise Exception('Please pass a valid file path.')
+        df['source'] = 'SF'
+
+    # standardize the project IDs, strip the other keys and parse the measures by their type
+    for key in comparison.keys:
+        df[cleaned_column(key)] = (normalize_project_ids if key in PROJECT_ID_KEYS else normalize_keys)(df[key])
+    for column, measure_type in comparison.column_types.items():
+        df[cleaned_column(column)] = NORMALIZERS[measure_type](df[column])
+
+    return df
+
+
+def load_file(file, chunksize=None, engine='pandas', reader='pandas', comparison=None):
+    """
+    loads and cleans a single data set. When a chunksize is provided the file is
+    cleaned chunk by chunk and only the columns needed by the comparison are kept.
+    With the dask engine the cleaning is left as a partitioned computation of those
+    columns, reduce_data collects what the comparison needs of it.
+    :param file: file path
+    :param chunksize: number of rows per chunk, the file is loaded whole when None
+    :param engine: pandas or dask
+    :param reader: csv reader of the pandas engine, pandas or pyarrow
+    :param comparison: Comparison the data set is cleaned for, the default comparison when None
+    :return: cleaned dataframe and metadata
+    """
+    comparison = comparison or Comparison()
+    schema = comparison.schema(SCHEMAS['standard_comparison'])
+    columns = comparison.columns
+
+    if engine == 'dask':
+        dtypes = comparison.measure_dtypes
+        meta = pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, object)) for col in columns}, columns=columns)
+        df = read_dask(file, schema).map_partitions(lambda x: standardize(x, comparison)[columns], meta=meta)
+    elif chunksize:
+        frames = read_frames(file, schema, chunksize)
+        df = concat_frames([standardize(chunk, comparison)[columns] for chunk in frames], columns=columns)
+    else:
+        df = standardize(next(read_frames(file, schema, reader=reader)), comparison)
+
+    return df, {}
+
+
+def clean_file(file, args):
+    """
+    loads, cleans and standardizes a single data set, reusing the cleaned file
+    from the cache when it has not changed.
+    :param file: file path
+    :param args: Supplied arguments when the program is initiated
+    :return: cleaned data set
+    """
+    chunksize = args.get('chunksize')
+    engine = args.get('engine') or 'pandas'
+    reader = args.get('reader') or 'pandas'
+    comparison = Comparison.from_args(args)
+    # the dask engine never holds the cleaned data set, there is nothing to cache
+    cache = open_cache(args) if engine != 'dask' else None
+
+    try:
+        df, meta = load_cached(file, partial(load_file, chunksize=chunksize, engine=engine, reader=reader,
+                                             comparison=comparison),
+                               CLEAN_VERSION, comparison.schema(SCHEMAS['standard_comparison']),
+                               {'streamed': bool(chunksize), 'columns': comparison.columns}, cache)
+    except Exception as exc:
+        formatted = "Unable to locate files! Please ensure you have provided accurate file paths. {}".format(
+            repr(exc))
+        raise Exception(formatted)
+
+    return df
+
+
+@task(name='Clean Data', state_handlers=[timestamper])
+@handoff
+def clean_data(file, args):
+    """
+    cleans a single data set. Mapped over the gathered files so both files are
+    cleaned at the same time on a parallel executor.
+    :param file: file path
+    :param args: Supplied arguments when the program is initiated
+    :return: cleaned data set
+    """
+    return clean_file(file, args)
 
 
 @task(name='Clean Data', state_handlers=[timestamper])
-def clean_data(data):
+@handoff
+def clean_files(files, args):
     """
-    cleans and standardizes data
-    :param data: 2 dataframes and arguments object
+    cleans the gathered files at the same time on a thread pool, for the
+    sequential local executor which would otherwise read one file after the other.
+    :param files: file paths
+    :param args: Supplied arguments when the program is initiated
     :return: cleaned data sets
     """
-    # switch dict to flip the names of the RE data set to match SF
-    col_switch = {'fund_id': 'project_id',
-                  'gift_count': 'record_count.5',
-                  'total': 'sum_of_amount.5'}
-
-    # define package items
-    dfs = data[0]
-    args = data[1]
-
-    # clean columns in dataframes
-    for df in dfs:
-        df.columns = [x.lower() for x in df.columns]
-        if 'fund id' in df.columns:
-            df.columns = [x.lower().replace(' ', '_') for x in df.columns]
-            df['source'] = 'RE'
-            df.rename(columns=col_switch, inplace=True)
-        else:
-            df.columns = [x.lower().replace(' ', '_') for x in df.columns]
-            df['source'] = 'SF'
-            df.drop(columns=['sum_of_amount', 'record_count', 'sum_of_amount.1', 'record_count.1', 'sum_of_amount.2',
-                             'record_count.2', 'sum_of_amount.3',
-                             'record_count.3', 'sum_of_amount.4', 'record_count.4'], inplace=True)
-
-    # standardize project_IDs
-    for df in dfs:
-        df['project_id_new'] = df['project_id'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-        df['project_id_new'] = df['project_id_new'].apply(
-            lambda x: x.replace(' - ', '-').lower() if isinstance(x, str) and '-' in x else x)
-        df['project_id_new'] = df['project_id_new'].apply(
-            lambda x: x.replace('- ', '-').lower() if isinstance(x, str) and '-' in x else x)
-        df['project_id_new'] = df['project_id_new'].apply(
-            lambda x: x.replace(' -', '-').lower() if isinstance(x, str) and '-' in x else x)
-        df['project_id_new'] = df['project_id_new'].apply(
-            lambda x: x.replace('-', '_').lower() if isinstance(x, str) and '-' in x else x)
-        df['project_id_new'] = df['project_id_new'].apply(
-            lambda x: x.replace(' ', '_').lower() if isinstance(x, str) and ' ' in x else x)
-        df['project_id_new'] = df['project_id_new'].apply(lambda x: x.lower() if isinstance(x, str) else x)
-
-    # standardize sum_of_amount
-    for df in dfs:
-        df['sum_of_amount_new'] = df['sum_of_amount.5'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-        df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
-            lambda x: x.replace('USD', '').lower() if isinstance(x, str) and 'USD' in x else x)
-        df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
-            lambda x: x.replace('$', '').lower() if isinstance(x, str) and '$' in x else x)
-        df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
-            lambda x: x.replace(',', '').lower() if isinstance(x, str) and ',' in x else x)
-        df['sum_of_amount_new'] = df['sum_of_amount_new'].apply(
-            lambda x: float("{0:.2f}".format(float(x))) if isinstance(x, str) else x)
-
-    return dfs, args
+    return map_concurrently(lambda file: clean_file(file, args), files)
+
+
+@task(name='Reduce Data', state_handlers=[timestamper])
+@handoff
+def reduce_data(dfs, args):
+    """
+    Collects the data sets the dask engine cleaned as partitioned computations.
+    The keys the comparison reports are found in dask, see finding_keys, and only
+    the rows of those keys are collected, in the order of the files, so comparing
+    them reports the same as comparing the whole data sets. An incremental run
+    saves every row in its state and collects them all. The data sets of the
+    pandas engine are passed through.
+    :param dfs: 2 cleaned dataframes, or dask dataframes with the dask engine
+    :param args: Supplied arguments when the program is initiated
+    :return: 2 cleaned dataframes
+    """
+    if (args.get('engine') or 'pandas') != 'dask':
+        return dfs
+
+    import dask
+
+    if open_state(args) is None:
+        comparison = Comparison.from_args(args)
+        keys = comparison.key_columns
+        found = composite_key(finding_keys(dfs[0], dfs[1], comparison), keys)
+        dfs = [df.map_partitions(lambda x: x[composite_key(x, keys).isin(found).values]) for df in dfs]
+
+    return [df.reset_index(drop=True) for df in dask.compute(*dfs)]
+
+
+def state_version(comparison):
+    """
+    :param comparison: Comparison
+    :return: version of the saved state, a state saved with other keys, measures or tolerances is not reused
+    """
+    return [CLEAN_VERSION, comparison.describe()]
+
+
+@task(name='Diff State', state_handlers=[timestamper])
+@handoff
+def diff_state(dfs, args):
+    """
+    Compares both data sets with the state saved by the previous run and narrows
+    them down to the rows of the project IDs touched by an added, changed or
+    deleted row. Without a state directory, or on the first run, the data sets are
+    passed through whole.
+    :param dfs: 2 cleaned dataframes
+    :param args: Supplied arguments when the program is initiated
+    :return: the data sets to compare, the project IDs being recomputed (None for
+    a full run) and what the state needs
+    """
+    store = open_state(args)
+    if store is None:
+        return {'data': dfs, 'affected': None}
+
+    comparison = Comparison.from_args(args)
+    keys = comparison.key_columns
+    frames = [with_hashes(df, comparison.columns) for df in dfs]
+    diff = {'data': dfs, 'affected': None, 'store': store, 'previous': None, 'frames': frames}
+
+    previous = store.load('standard_comparison', state_version(comparison))
+    if previous is None:
+        return diff
+
+    changed = [changed_rows(previous[name], df, keys) for name, df in zip(['file1', 'file2'], frames)]
+    affected = pd.unique(composite_key(pd.concat(changed, ignore_index=True), keys))
+    diff.update({'data': [df[composite_key(df, keys).isin(affected).values] for df in frames],
+                 'affected': affected,
+                 'previous': [previous['missing'], previous['differ']]})
+
+    return diff
 
 
 @task(name='Compare Data', state_handlers=[timestamper])
-def compare_data(data):
+@handoff
+def compare_data(dfs, args):
     """
-    Using pandas, this compares the data via the field provided.
-    :param data: 2 dataframes and arguments object
-    :return: either a string stating a match or the difference data.
+    Using pandas, this compares the data via the fields provided: the rows are matched
+    on the key columns and every measure is compared within its tolerance.
+    :param dfs: 2 cleaned dataframes
+    :param args: Supplied arguments when the program is initiated
+    :return: dataframe of missing projects, dataframe of project variances and arguments object
     """
-    dfs = data[0]
-    args = data[1]
+    comparison = Comparison.from_args(args)
 
-    # ID the project IDs that do not exist in both data sets
-    missing = []
-    for value in dfs[0]['project_id_new']:
-        if value not in [x for x in dfs[1]['project_id_new']]:
-            missing.append(value)
+    # ID the keys that do not exist in both data sets
+    missing = find_missing(dfs[0], dfs[1], comparison.key_columns)
 
-    for value in dfs[1]['project_id_new']:
-        if value not in [x for x in dfs[0]['project_id_new']] and value not in missing:
-            missing.append(value)
+    # variances of every measure of the rows found in both data sets, in one merge
+    differ = find_variances(dfs[0], dfs[1], comparison)
 
-    # join data on values that exist in both data sets
-    df = pd.merge(dfs[0], dfs[1], how='inner', on='project_id_new')
+    return missing, differ, args
 
-    differ = {}
 
-    for index, row in df.iterrows():
-        project = row['project_id_new']
-        if row['sum_of_amount_new_x'] != row['sum_of_amount_new_y']:
-            num1, num2 = sort_nums(row['sum_of_amount_new_x'], row['sum_of_amount_new_y'])
-            variance = num1 - num2
-            differ.update({project: variance})
+@task(name='Merge State', state_handlers=[timestamper])
+@handoff
+def merge_state(findings, diff):
+    """
+    Replaces the findings of the recomputed project IDs in the findings of the
+    previous run, then saves the state of this run. Findings are ordered the way a
+    full run orders them: missing projects by the file they were found in and
+    their first row, projects that differ by their first row in the first file.
+    :param findings: Output of the comparison function.
+    :param diff: Output of the state diff.
+    :return: dataframe of missing projects, dataframe of project variances and arguments object
+    """
+    missing, differ, args = findings
+    comparison = Comparison.from_args(args)
+    keys = comparison.key_columns
+
+    if diff['affected'] is not None:
+        left, right = (composite_key(df, keys) for df in diff['frames'])
+        merged = []
+        for previous, current in zip(diff['previous'], (missing, differ)):
+            merged.append(pd.concat([previous[~composite_key(previous, keys).isin(diff['affected']).values],
+                                     current[composite_key(current, keys).isin(diff['affected']).values]],
+                                    ignore_index=True))
+        missing, differ = merged
+
+        order = first_seen(composite_key(missing, keys), left)
+        order = np.where(order < 0, first_seen(composite_key(missing, keys), right) + len(left), order)
+        missing = missing.iloc[np.argsort(order, kind='mergesort')].reset_index(drop=True)
+        differ = differ.iloc[np.argsort(first_seen(composite_key(differ, keys), left),
+                                        kind='mergesort')].reset_index(drop=True)
+
+    if 'store' in diff:
+        diff['store'].save('standard_comparison', state_version(comparison), {'file1': diff['frames'][0],
+                                                                  'file2': diff['frames'][1],
+                                                                  'missing': missing,
+                                                                  'differ': differ})
 
     return missing, differ, args
 
 
+def write_findings(missing, differ, args):
+    """
+    Streams the missing and differ findings to their reports in the requested output format, with their manifest.
+    :param missing: dataframe of missing projects, or an iterator of dataframes producing them a slice at a time
+    :param differ: dataframe of project variances, or an iterator of dataframes producing them a slice at a time
+    :param args: Supplied arguments when the program is initiated
+    :return: summary of the row counts and destinations of the reports
+    """
+    comparison = Comparison.from_args(args)
+    names = {cleaned_column(x): x for x in comparison.keys}
+    output_format = args.get('output_format') or 'csv'
+    stamp = args.get('now') or str(now)
+    if isinstance(missing, pd.DataFrame):
+        missing, differ = [missing], [differ]
+
+    # variances of the amounts are compared in cents and written as currency
+    destination = output_directory(args)
+    writers = {'missing': write_report(destination, 'missing_report_{}'.format(stamp),
+                                       (x.rename(columns=names) for x in missing), output_format),
+               'differ': write_report(destination, 'differ_report_{}'.format(stamp),
+                                      (x.rename(columns=names) for x in differ), output_format,
+                                      cents=comparison.cents_columns)}
+    manifest = write_manifest(destination, 'standard_comparison', stamp, writers)
+
+    return {'missing': writers['missing'].rows,
+            'differ': writers['differ'].rows,
+            'outputs': ';'.join(str(x.path) for x in writers.values()),
+            'manifest': str(manifest)}
+
+
 @task(name='Report Findings', state_handlers=[timestamper])
+@handoff
 def report_findings(findings):
     """
     Compiles differences into a report and structures it so it is legible.
     :param findings: Output of the comparison function.
-    :return: Report saved to the location specified in the initial arguments.
+    :return: Reports streamed to the location specified in the initial arguments in the requested output format with
+    their manifest, and a summary of the row counts and destinations of the reports.
     """
-    missing = pd.DataFrame(findings[0], columns=['project_id'])
-    differ = pd.DataFrame(list(findings[1].items()), columns=['project_id', 'variance'])
-    args = findings[2]
+    return write_findings(findings[0], findings[1], findings[2])
 
-    if args['output'] is not False:
-        if Path(args['output']).is_dir():
-            # build filenames
-            missing_report_destination = Path(args['output'] + 'missing_report_{}'.format(str(now)) + '.csv')
-            differ_report_destination = Path(args['output'] + 'differ_report_{}'.format(str(now)) + '.csv')
 
-            # output df to csv
-            missing.to_csv(missing_report_destination, index=False)
-            differ.to_csv(differ_report_destination, index=False)
+def partition_file(file, name, args, directory):
+    """
+    Cleans a file a chunk at a time and splits it into shards by the cleaned keys of the comparison.
+    :param file: file path
+    :param name: file1 or file2
+    :param args: Supplied arguments when the program is initiated (shards, chunksize and comparison settings)
+    :param directory: shard directory of the run
+    :return: number of rows written to every shard
+    """
+    comparison = Comparison.from_args(args)
+    columns = comparison.columns + [ROW_COLUMN]
 
-    elif args['output'] is False:
-        # build filenames
-        missing_report_destination = Path(str(current_dir) + 'missing_report_{}'.format(str(now)) + '.csv')
-        differ_report_destination = Path(str(current_dir) + 'differ_report_{}'.format(str(now)) + '.csv')
+    with ShardWriter(directory, name, args['shards']) as writer:
+        for chunk in number_rows(read_frames(file, comparison.schema(SCHEMAS['standard_comparison']),
+                                             args.get('chunksize') or SHARD_CHUNKSIZE)):
+            chunk = standardize(chunk, comparison)[columns]
+            writer.write(chunk, shard_ids(chunk, comparison.key_columns, args['shards']))
 
-        # output df to csv
-        missing.to_csv(missing_report_destination, index=False)
-        differ.to_csv(differ_report_destination, index=False)
+    return writer.rows
+
+
+@task(name='Partition Data', state_handlers=[timestamper])
+@handoff
+def partition_data(paths, args, directory):
+    """
+    Splits both files into shards by the keys of the comparison, both files at the same time.
+    :param paths: 2 file paths
+    :param args: Supplied arguments when the program is initiated
+    :param directory: shard directory of the run
+    :return: number of rows written to every shard of both files
+    """
+    names = ['file1', 'file2']
+    return dict(zip(names, map_concurrently(lambda x: partition_file(x[0], x[1], args, directory),
+                                            list(zip(paths, names)))))
+
+
+def reconcile_shard(directory, args, index):
+    """
+    Compares a single shard of both files. Executed inside the worker processes.
+    :param directory: shard directory of the run
+    :param args: Supplied arguments when the program is initiated
+    :param index: shard number
+    :return: missing and differ findings of the shard, with the position of their key in the files
+    """
+    comparison = Comparison.from_args(args)
+    keys = comparison.key_columns
+    columns = comparison.columns + [ROW_COLUMN]
+    schema = dict(comparison.measure_dtypes, **{ROW_COLUMN: np.int64})
+    left, right = (read_shard(directory, name, index, schema, columns) for name in ('file1', 'file2'))
+
+    missing = find_missing(left, right, keys)
+    differ = find_variances(left, right, comparison)
+
+    # position of the first row of every key, in file1 when it is found there, otherwise in file2
+    left_rows, right_rows = (df.drop_duplicates(keys)[ROW_COLUMN].values for df in (left, right))
+    found = first_seen(composite_key(missing, keys), composite_key(left, keys))
+    rows = np.zeros(len(missing), dtype=np.int64)
+    rows[found >= 0] = left_rows[found[found >= 0]]
+    rows[found < 0] = right_rows[first_seen(composite_key(missing[found < 0], keys), composite_key(right, keys))]
+    missing[SIDE_COLUMN] = (found < 0).astype(np.int64)
+    missing[ROW_COLUMN] = rows
+    differ[ROW_COLUMN] = left_rows[first_seen(composite_key(differ, keys), composite_key(left, keys))]
+
+    return missing, differ
+
+
+@task(name='Reconcile Shard', state_handlers=[timestamper])
+@handoff
+def reconcile_shard_data(index, args, directory):
+    """
+    Compares a single shard. Mapped over the shards on the parallel executors.
+    :param index: shard number
+    :param args: Supplied arguments when the program is initiated
+    :param directory: shard directory of the run
+    :return: missing and differ findings of the shard
+    """
+    return reconcile_shard(directory, args, index)
+
+
+@task(name='Reconcile Shard', state_handlers=[timestamper])
+@handoff
+def reconcile_shards(partitions, args, directory):
+    """
+    Compares every shard on a process pool, for the sequential local executor.
+    :param partitions: output of the partition, the shards are compared once it is done
+    :param args: Supplied arguments when the program is initiated (shards and workers)
+    :param directory: shard directory of the run
+    :return: missing and differ findings of every shard
+    """
+    return map_shards(partial(reconcile_shard, directory, args), args['shards'], args)
+
+
+@task(name='Report Findings', state_handlers=[timestamper])
+@handoff
+def report_shards(results, args):
+    """
+    Merges the findings of every shard in the order of a single run and streams them to the reports a slice at a time
+    as they are merged.
+    :param results: missing and differ findings of every shard
+    :param args: Supplied arguments when the program is initiated
+    :return: summary of the row counts and destinations of the reports
+    """
+    return write_findings(order_rows([x[0] for x in results], SIDE_COLUMN, ROW_COLUMN),
+                          order_rows([x[1] for x in results], ROW_COLUMN), args)
+
+
+def run_sharded(args):
+    """
+    Runs the comparison on shards of both files, see reporter/shard.py.
+    :param args: Supplied arguments when the program is initiated, with the number of shards
+    :return: final state of the flow run
+    """
+    with shard_context(args) as directory:
+        with Flow('Compare Data') as flow:
+            partitions = partition_data(gather_data(args), args, directory)
+            if (args.get('executor') or 'local') == 'local':
+                results = reconcile_shards(partitions, args, directory)
+            else:
+                results = reconcile_shard_data.map(list(range(args['shards'])), unmapped(args), unmapped(directory),
+                                                   upstream_tasks=[unmapped(partitions)])
+            report_shards(results, args)
+
+        with handoff_context(args) as context:
+            results = flow.run(executor=get_executor(args), context=dict(profile_context(args, args['now']), **context))
+    write_profile(flow, results, args, args['now'])
+
+    return results
 
 
 def run(args):
+    # runs of the resident server each pass their own timestamp, the reports of a run are named after it
+    args = dict(args, now=str(args.get('now') or now))
+    if args.get('shards'):
+        return run_sharded(args)
+
     with Flow('Compare Data') as flow:
         gather = gather_data(args)
-        clean = clean_data(gather)
-        compare = compare_data(clean)
-        report_findings(compare)
+        if (args.get('executor') or 'local') == 'local':
+            clean = clean_files(gather, args)
+        else:
+            clean = clean_data.map(gather, unmapped(args))
+        diff = diff_state(reduce_data(clean, args), args)
+        compare = compare_data(diff['data'], args)
+        report_findings(merge_state(compare, diff))
+
+    with dask_scheduler(args), handoff_context(args) as context:
+        results = flow.run(executor=get_executor(args), context=dict(profile_context(args, args['now']), **context))
+    write_profile(flow, results, args, args['now'])
 
-    return flow.run()
+    return results
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Data Comparison Tool')
+    parser = argparse.ArgumentParser(description='Data Comparison Tool', parents=[run_parser(), comparison_parser()])
     parser.add_argument('-f1', '--file1', default=False, required=True,
                         help='first file path to be compared'),
     parser.add_argument('-f2', '--file2', default=False, required=True,
                         help='second file path to be compared'),
-    parser.add_argument('-c', '--compare_column', default=False,
-                        required=False,
-                        help='enter the column to be used during the comparison'),
     parser.add_argument('-o', '--output', default=False, required=True,
                         help='location where the report is saved.')
 
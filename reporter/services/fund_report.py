@@ -9,75 +9,169 @@ python -m reporter.report_manager -f1 {File1} -f2 {file2} -c {Field to compare}
 """
 import argparse
 import os
+from functools import partial
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import pendulum
-from prefect import task, Flow, Parameter
+import prefect
+from prefect import task, unmapped, Flow, Parameter
+from ..cache import load_cached, open_cache
+from ..handoff import handoff, handoff_context
+from ..encoding import Vocabulary, compare_values, group_codes, pair_codes
+from ..arguments import run_parser
+from ..engine import dask_scheduler, get_executor
+from ..profiling import timestamper, profile_context, write_profile
+from ..output import output_directory, write_report, write_manifest
+from ..ingest import (SCHEMAS, LAYOUTS, read_frames, read_dask, read_header, normalize_column, concat_frames,
+                      fill_missing, restore_categories, validate_files, map_concurrently)
+from ..shard import (SHARD_CHUNKSIZE, ROW_COLUMN, ShardWriter, key_hashes, shard_ids, read_shard, number_rows,
+                     map_shards, order_rows, shard_context)
+from ..state import open_state, with_hashes, changed_rows, first_seen
 
 now = pendulum.now()
-current_dir = Path.cwd()
 
+# bump whenever the output of load_file changes so cached files are cleaned again
+CLEAN_VERSION = 1
 
-def timestamper(task, old_state, new_state):
-    """
-    Task state handler that timestamps new states
-    and logs the duration between state changes using
-    the task's logger.
-    """
-    new_state.timestamp = pendulum.now("utc")
-    if hasattr(old_state, "timestamp"):
-        duration = (new_state.timestamp - old_state.timestamp).in_seconds()
-        task.logger.info(
-            "{} seconds passed in between state transitions".format(duration)
-        )
-    return new_state
+# key columns of the payments and pledge data, the row hashes of the incremental state cover these
+PAYMENT_KEYS = ['usergiftid_pledge', 'paymentid', 'fund']
+PLEDGE_KEYS = ['gift_id', 'fund_id']
+FINDING_COLUMNS = ['usergiftid', 'payment_count', 'payment_funds', 'pledge_funds', 'unmatched_funds']
 
 
 @task(name='Validate Submission', state_handlers=[timestamper])
+@handoff
 def validate_submission(data):
+    """
+    Validates the submitted files from their header rows only, both files at the same time, so a bad submission fails
+    before anything is parsed.
+    :param data: Supplied arguments when the program is initiated
+    :return: 2 file paths
+    """
     files = [data['file1'], data['file2']]
-    for file in files:
-        if len(files) < 2:
-            raise Exception("You must submit two files!")
-        if Path(file[0]).name == Path(file[1]).name:
-            raise Exception("You must submit two different files!")
-        if '.csv' not in Path(file).name.lower():
-            raise Exception("{} is not a .csv... This program currently only accepts .csv files".format(file))
+    if not all(files):
+        raise Exception("You must submit two files!")
+    if Path(files[0]).resolve() == Path(files[1]).resolve():
+        raise Exception("You must submit two different files!")
+    validate_files(files, LAYOUTS['fund_analysis'])
 
     return files
 
 
+def standardize_funds(df):
+    """lowercases every fund column so funds match regardless of case"""
+    for col in df.columns:
+        if 'fund' in col:
+            df[col] = df[col].map(str.lower).astype('category')
+
+    return df
+
+
+def load_file(file, chunksize=None, engine='pandas', reader='pandas'):
+    """
+    Loads the fund analysis columns of a file and standardizes them. When a chunksize is provided the file is streamed
+    in chunks and only the distinct key combinations are kept. Payments are distinct to begin with, so this does not
+    lower the peak of the fund analysis, which only loads its key columns anyway; its memory is bounded by sharding the
+    files, see run_sharded. With the dask engine the cleaning is left as a partitioned computation, reduce_data collects
+    what the analysis needs of it, and the rows are not counted.
+
+    :param file: file path
+    :param chunksize: number of rows per chunk, the file is loaded whole when None
+    :param engine: pandas or dask
+    :param reader: csv reader of the pandas engine, pandas or pyarrow
+    :return: dataframe and the number of rows in the file
+    """
+    if engine == 'dask':
+        # funds stay strings until the rows are collected, partitions do not share categories
+        df = read_dask(Path(file), SCHEMAS['fund_analysis']).map_partitions(
+            lambda x: standardize_funds(fill_missing(x)).astype(object))
+        return df, {'rows': None}
+    elif chunksize:
+        chunks = []
+        rows = 0
+        for chunk in read_frames(Path(file), SCHEMAS['fund_analysis'], chunksize):
+            rows += len(chunk)
+            chunks.append(standardize_funds(fill_missing(chunk)).drop_duplicates())
+        df = concat_frames(chunks).drop_duplicates().reset_index(drop=True)
+    else:
+        df = standardize_funds(fill_missing(next(read_frames(Path(file), SCHEMAS['fund_analysis'], reader=reader))))
+        rows = len(df)
+
+    return df, {'rows': int(rows)}
+
+
+def clean_file(file, args):
+    """
+    Loads and standardizes a single file, reusing the cleaned file from the cache when it has not changed.
+
+    :param file: file path
+    :param args: Supplied arguments when the program is initiated (chunksize, engine and cache settings)
+    :return: cleaned dataframe and its metadata
+    """
+    chunksize = args.get('chunksize')
+    engine = args.get('engine') or 'pandas'
+    reader = args.get('reader') or 'pandas'
+    # the dask engine never holds the cleaned file, there is nothing to cache
+    cache = open_cache(args) if engine != 'dask' else None
+
+    return load_cached(file, partial(load_file, chunksize=chunksize, engine=engine, reader=reader), CLEAN_VERSION,
+                       SCHEMAS['fund_analysis'], {'streamed': bool(chunksize)}, cache)
+
+
 @task(name='Clean Data', state_handlers=[timestamper])
-def clean_data(data):
-    files = data
-    dfs = {}
-    data = {}
-
-    cnt = 0
-    # df the csvs provided
-    for file in files:
-        df = pd.read_csv(Path(file))
-        df[df.columns] = df[df.columns].applymap(lambda x: str(x))
-        df.columns = [x.replace(' ', '_').lower() for x in df.columns]
-        for col in df.columns:
-            if 'fund' in col and df[col].dtype == 'object':
-                df[col] = [x.lower() for x in df[col]]
-        dfs.update({cnt: df})
-        cnt += 1
-
-    # determine which df is the payments or the pledge data. The payments dataset
-    # will always have significantly more columns
-    if len(dfs[0]) > len(dfs[1]):
-        data.update({'payments': dfs[0]})
-        data.update({'pledge_data': dfs[1]})
+@handoff
+def clean_data(file, args):
+    """
+    Cleans a single file. Mapped over the submitted files so both files are cleaned at the same time on a parallel
+    executor.
+
+    :param file: file path
+    :param args: Supplied arguments when the program is initiated
+    :return: cleaned dataframe and its metadata
+    """
+    return clean_file(file, args)
+
+
+@task(name='Clean Data', state_handlers=[timestamper])
+@handoff
+def clean_files(files, args):
+    """
+    Cleans the submitted files at the same time on a thread pool, for the sequential local executor which would
+    otherwise read one file after the other.
+
+    :param files: file paths
+    :param args: Supplied arguments when the program is initiated
+    :return: cleaned dataframe and metadata of every file
+    """
+    return map_concurrently(lambda file: clean_file(file, args), files)
+
+
+@task(name='Sort Data', state_handlers=[timestamper])
+@handoff
+def sort_data(cleaned):
+    """
+    Determines which of the cleaned files is the payments data and which is the pledge data.
+
+    :param cleaned: cleaned dataframe and metadata of both files
+    :return: payments and pledge dataframes
+    """
+    (df_0, meta_0), (df_1, meta_1) = cleaned
+
+    # the payments dataset will always have significantly more rows, the dask engine does not count them and tells
+    # the payments apart by their columns
+    if meta_0['rows'] is None:
+        payments_first = 'usergiftid_pledge' in df_0.columns
     else:
-        data.update({'payments': dfs[1]})
-        data.update({'pledge_data': dfs[0]})
+        payments_first = meta_0['rows'] > meta_1['rows']
+    if payments_first:
+        return {'payments': df_0, 'pledge_data': df_1}
 
-    return data
+    return {'payments': df_1, 'pledge_data': df_0}
 
 
 @task(name='Validate Data', state_handlers=[timestamper])
+@handoff
 def validate_data(data):
     # key_cols = ['fundid', 'opportunity_re_recordid', 'paymentid']
     #
@@ -91,167 +185,486 @@ def validate_data(data):
     return data
 
 
+def finding_gifts(payments, pledges):
+    """
+    Finds the usergiftids the first pass flags in partitioned data without collecting it: the usergiftids with a
+    pledge and more than one payment fund, one of them at least missing from the funds of the pledge. The distinct
+    usergiftid and fund pairs of both datasets are merged and grouped as dask computations, and only the usergiftids
+    found and the paymentids of their payments are collected.
+
+    :param payments: cleaned payments dask dataframe
+    :param pledges: cleaned pledge dask dataframe
+    :return: arrays of the usergiftids found and of the paymentids of their payments
+    """
+    import dask
+    import dask.dataframe as dd
+
+    keys = ['usergiftid_pledge', 'fund']
+    pledged = pledges[PLEDGE_KEYS].drop_duplicates().rename(columns=dict(zip(PLEDGE_KEYS, keys)))
+    pairs = dd.merge(payments[keys].drop_duplicates(), pledged.assign(pledged=True), how='left', on=keys)
+    pairs = pairs.assign(unpledged=pairs['pledged'].isnull())[['usergiftid_pledge', 'unpledged']]
+
+    funds = pairs.groupby('usergiftid_pledge')['unpledged'].agg(['count', 'sum'])
+    flagged = funds[(funds['count'] > 1) & (funds['sum'] > 0)].reset_index()[['usergiftid_pledge']]
+    flagged = dd.merge(flagged, pledged[['usergiftid_pledge']].drop_duplicates(), on='usergiftid_pledge')
+    paid = dd.merge(payments[['usergiftid_pledge', 'paymentid']], flagged, on='usergiftid_pledge')['paymentid']
+
+    gifts, payment_ids = dask.compute(flagged['usergiftid_pledge'], paid.drop_duplicates())
+
+    return gifts.values, payment_ids.values
+
+
+@task(name='Reduce Data', state_handlers=[timestamper])
+@handoff
+def reduce_data(data, args):
+    """
+    Collects the datasets the dask engine cleaned as partitioned computations. The usergiftids the first pass flags
+    are found in dask, see finding_gifts, and only their pledges and every payment row of their paymentids are
+    collected, in the order of the files, so the second pass reports the same as on the whole datasets; the first pass
+    only sees these rows. An incremental run saves every row in its state and collects them all. The datasets of the
+    pandas engine are passed through.
+
+    :param data: payments and pledge dataframes, or dask dataframes with the dask engine
+    :param args: Supplied arguments when the program is initiated
+    :return: payments and pledge dataframes
+    """
+    if (args.get('engine') or 'pandas') != 'dask':
+        return data
+
+    import dask
+
+    payments, pledges = data['payments'], data['pledge_data']
+    if open_state(args) is None:
+        gifts, payment_ids = finding_gifts(payments, pledges)
+        payments = payments.map_partitions(lambda x: x[x['paymentid'].isin(payment_ids).values])
+        pledges = pledges.map_partitions(lambda x: x[x['gift_id'].isin(gifts).values])
+
+    return {name: restore_categories(df, SCHEMAS['fund_analysis']).reset_index(drop=True)
+            for name, df in zip(['payments', 'pledge_data'], dask.compute(payments, pledges))}
+
+
+@task(name='Diff State', state_handlers=[timestamper])
+@handoff
+def diff_state(data, args):
+    """
+    Compares both datasets with the state saved by the previous run and narrows them down to the rows of the
+    usergiftids touched by an added, changed or deleted row. Along with the rows of those usergiftids, every row
+    sharing one of their paymentids is kept so the funds of their payments are complete. Without a state directory, or
+    on the first run, the data is passed through whole.
+
+    :param data: payments and pledge dataframes
+    :param args: Supplied arguments when the program is initiated
+    :return: the data to analyze, the usergiftids being recomputed (None for a full run) and what the state needs
+    """
+    store = open_state(args)
+    if store is None:
+        return {'data': data, 'affected': None}
+
+    payments = with_hashes(data['payments'], PAYMENT_KEYS)
+    pledges = with_hashes(data['pledge_data'], PLEDGE_KEYS)
+    diff = {'data': data, 'affected': None, 'store': store, 'previous': None, 'payments': payments,
+            'pledge_data': pledges}
+
+    previous = store.load('fund_analysis', CLEAN_VERSION)
+    if previous is None:
+        return diff
+
+    changed_payments = changed_rows(previous['payments'], payments, ['usergiftid_pledge', 'paymentid'])
+    changed_pledges = changed_rows(previous['pledge_data'], pledges, ['gift_id'])
+
+    # usergiftids of every changed row, and of every row sharing a paymentid with a changed row
+    shared = payments['paymentid'].isin(changed_payments['paymentid'])
+    affected = pd.unique(np.concatenate([changed_payments['usergiftid_pledge'].values,
+                                         changed_pledges['gift_id'].values,
+                                         payments.loc[shared, 'usergiftid_pledge'].values]))
+
+    rows = payments['usergiftid_pledge'].isin(affected)
+    rows |= payments['paymentid'].isin(payments.loc[rows, 'paymentid'])
+    diff.update({'data': {'payments': data['payments'][rows.values],
+                          'pledge_data': data['pledge_data'][pledges['gift_id'].isin(affected).values]},
+                 'affected': affected,
+                 'previous': previous['findings']})
+
+    return diff
+
+
 @task(name='Build Dict', state_handlers=[timestamper])
+@handoff
 def build_dict(data):
     """
-    Creates two dictionaries sorting funds by usergiftids in both datasets.
+    Encodes usergiftids, funds and paymentids as integer codes and groups the funds of every usergiftid in both
+    datasets, along with the payment index (paymentid -> funds, usergiftid -> paymentids) shared by both comparison
+    passes. Funds and usergiftids share a vocabulary across both datasets so their codes can be compared directly.
 
     :param data: two dataframes
-    :return: two dictionaries
+    :return: fund groups of both datasets, the payment index and the vocabularies to decode them
     """
 
     # dataframes to compare
     df_payments = data['payments']
     df_pledge = data['pledge_data']
 
-    # populate payment_data dict
-    payment_data = {}
-    for index, row in df_payments.iterrows():
-        pledge = row['usergiftid_pledge']
-        fund = row['fund']
-        if pledge not in payment_data.keys():
-            payment_data.update({pledge: []})
-        if fund not in payment_data[pledge]:
-            payment_data[pledge].append(fund)
-
-    # populate pledge_data dict
-    pledge_data = {}
-    for index, row in df_pledge.iterrows():
-        giftid = row['gift_id']
-        fund = row['fund_id']
-        if giftid not in pledge_data.keys():
-            pledge_data.update({giftid: []})
-        if fund not in pledge_data[giftid]:
-            pledge_data[giftid].append(fund)
-
-    return {'payment_dict': payment_data,
-            'pledge_dict': pledge_data,
-            'dfs': data}
+    gifts, funds, payment_ids = Vocabulary(), Vocabulary(), Vocabulary()
+    payment_gifts = gifts.encode(df_payments['usergiftid_pledge'])
+    payment_funds = funds.encode(df_payments['fund'])
+    payments = payment_ids.encode(df_payments['paymentid'])
+    pledge_gifts = gifts.encode(df_pledge['gift_id'])
+    pledge_funds = funds.encode(df_pledge['fund_id'])
+
+    size, width = len(gifts), max(len(funds), 1)
+
+    # index payments once so the second pass never has to rescan the payments dataframe
+    payment_index = {'payment_funds': group_codes(payments, payment_funds, len(payment_ids), width),
+                     'gift_payments': group_codes(payment_gifts, payments, size, max(len(payment_ids), 1))}
+
+    return {'payment_groups': group_codes(payment_gifts, payment_funds, size, width),
+            'pledge_groups': group_codes(pledge_gifts, pledge_funds, size, width),
+            'payment_index': payment_index,
+            'vocabulary': {'gifts': gifts, 'funds': funds, 'payments': payment_ids}}
+
+
+def unmatched_gifts(groups, counts):
+    """
+    Lists the usergiftids with more than one fund in one dataset whose funds are not all in the other dataset. A
+    usergiftid is listed once for every fund that is missing from the other dataset, in the order of the groups.
+
+    :param groups: fund groups of the dataset checked
+    :param counts: number of funds of every usergiftid of the groups missing from the other dataset, see compare_values
+    :return: dict of arrays of usergiftid codes, the unmatched ones and the ones missing from the other dataset
+    """
+    checked = groups.sizes > 1
+
+    return {'unmatched': np.repeat(groups.keys[checked], np.maximum(counts[checked], 0)),
+            'not_exist': groups.keys[checked & (counts < 0)]}
 
 
 @task(name='First Pass', state_handlers=[timestamper])
+@handoff
 def first_pass(data):
     """
-    Takes dictionaries of data and if all the pledge payments in dataset 1 should only be allocated to the funds in
-    dataset 2 and vice versa. Where usergiftids with inconsistencies are logged and returned in two separate lists.
-
-    :param data: two dictionaries
-    :return: two lists of results
-    """
-    # Run first comparison
-    not_exist = []
-    pledge_results = []
-
-    # define dictionaries
-    pledge_data = data['pledge_dict']
-    payment_data = data['payment_dict']
-
-    for ugi, fund in pledge_data.items():
-        if len(fund) > 1:
-            try:
-                payment_funds = payment_data[ugi]
-                for i in fund:
-                    if i not in payment_funds:
-                        pledge_results.append(ugi)
-            except KeyError:
-                not_exist.append(ugi)
-
-    # Run second comparison
-    not_exist_ = []
-    payment_results = []
-    payment_results_u = []
-    for ugi, fund in payment_data.items():
-        if len(fund) > 1:
-            try:
-                pledge_funds = pledge_data[ugi]
-                for i in fund:
-                    if i not in pledge_funds:
-                        payment_results.append(ugi)
-            except KeyError:
-                not_exist_.append(ugi)
-
-    for x in payment_results:
-        if x not in payment_results_u:
-            payment_results_u.append(x)
-
-    return {'payment_results': payment_results_u,
-            'pledge_results': pledge_results,
-            'pledge_dict': pledge_data,
-            'dfs': data['dfs']}
+    Compares the funds of every usergiftid of both datasets, both ways in one pass: the pledge payments in dataset 1
+    must only be allocated to the funds of the pledge in dataset 2, and every fund of the pledge must be a fund of its
+    payments. The second pass looks into the usergiftids flagged on the payments side.
+
+    :param data: fund groups of both datasets
+    :return: dict of arrays of usergiftid codes: the distinct ones with inconsistent payments, in the order they were
+    found, and the ones without a pledge (unmatched, not_exist), the ones with pledge funds missing from their payments,
+    once per fund, and the ones without payments (pledge_unmatched, pledge_not_exist), and the symmetric difference of
+    the funds of both datasets as usergiftid and fund codes (difference_gifts, difference_funds)
+    """
+    payment_groups, pledge_groups = data['payment_groups'], data['pledge_groups']
+    width = max(len(data['vocabulary']['funds']), 1)
+    payment_counts, pledge_counts, difference = compare_values(payment_groups, pledge_groups, width)
+    payments = unmatched_gifts(payment_groups, payment_counts)
+    pledges = unmatched_gifts(pledge_groups, pledge_counts)
+
+    return {'unmatched': pd.unique(payments['unmatched']), 'not_exist': payments['not_exist'],
+            'pledge_unmatched': pledges['unmatched'], 'pledge_not_exist': pledges['not_exist'],
+            'difference_gifts': difference // width, 'difference_funds': difference % width}
 
 
 @task(name='Second Pass', state_handlers=[timestamper])
-def second_pass(data):
-
-    payment_results = data['payment_results']
-    pledge_results = data['pledge_results']
-    pledge_dict = data['pledge_dict']
-    payments_df = data['dfs']['payments']
-    pledge_df = data['dfs']['pledge_data']
-
-    # using the identified usergiftids in the payment_results list to create a new dictionary of all
-    # payments associated to those usergiftids
-    payments_dict = {}
-    for ugid in payment_results:
-        for index, row in payments_df.iterrows():
-            if row['usergiftid_pledge'] == ugid:
-                paymentid = row['paymentid']
-                if ugid not in payments_dict.keys():
-                    payments_dict.update({ugid: []})
-                if paymentid not in payments_dict[ugid]:
-                    payments_dict[ugid].append(paymentid)
-
-    # analysis
-    # all of the funds that are associated to all the payments are associated to the usergiftids from payment_results
-    analysis = {}
-    for key, value in payments_dict.items():
-        if len(value) > 1:
-            for index, row in payments_df.iterrows():
-                for i in value:
-                    if row['paymentid'] == i:
-                        fund = row['fund']
-                        if key not in analysis.keys():
-                            analysis.update({key: []})
-                        if fund not in analysis[key]:
-                            analysis[key].append(fund)
-
-    # Run second comparison
-    not_exist_ = []
-    payment_results = []
-    payment_results_u = []
-    for ugi, fund in analysis.items():
-        if len(fund) > 1:
-            try:
-                pledge_funds = pledge_dict[ugi]
-                for i in fund:
-                    if i not in pledge_funds:
-                        payment_results.append(ugi)
-            except KeyError:
-                not_exist_.append(ugi)
-
-    for x in payment_results:
-        if x not in payment_results_u:
-            payment_results_u.append(x)
-
-    print(payment_results_u)
+@handoff
+def second_pass(data, payment_results):
+    """
+    Takes the usergiftids flagged by the first pass and collects the funds of every payment associated to them. Where
+    the payments of a usergiftid are allocated to funds that do not exist on the pledge, the usergiftid is reported.
+    Codes are decoded back to strings for the reported usergiftids only.
+
+    :param data: fund groups, payment index and vocabularies
+    :param payment_results: output of first_pass
+    :return: dataframe of usergiftids whose payments are allocated to funds outside of the pledge
+    """
+    pledge_groups = data['pledge_groups']
+    payment_funds = data['payment_index']['payment_funds']
+    gift_payments = data['payment_index']['gift_payments']
+    gifts, funds = data['vocabulary']['gifts'], data['vocabulary']['funds']
+    width = max(len(funds), 1)
+
+    # usergiftids with at least 2 payments
+    flagged = np.asarray(payment_results['unmatched'], dtype=np.int64)
+    located = gift_payments.locate(flagged)
+    payment_count = np.where(located >= 0, gift_payments.sizes[np.maximum(located, 0)], 0)
+    keep = payment_count >= 2
+    flagged, located, payment_count = flagged[keep], located[keep], payment_count[keep]
+
+    # all of the funds that are associated to all the payments of the flagged usergiftids, in first seen order
+    owner, payments = gift_payments.expand(located)
+    fund_owner, fund = payment_funds.expand(payment_funds.locate(payments))
+    fund_owner = owner[fund_owner]
+    first = np.sort(np.unique(pair_codes(fund_owner, fund, width), return_index=True)[1])
+    fund_owner, fund = fund_owner[first], fund[first]
+
+    unmatched = ~np.isin(pair_codes(flagged[fund_owner], fund, width),
+                         pair_codes(pledge_groups.owners(), pledge_groups.values, width))
+    pledge_located = pledge_groups.locate(flagged)
+    reported = ((np.bincount(fund_owner, minlength=len(flagged)) >= 2) & (pledge_located >= 0)
+                & (np.bincount(fund_owner[unmatched], minlength=len(flagged)) > 0))
+
+    findings = []
+    bounds = np.searchsorted(fund_owner, np.arange(len(flagged) + 1))
+    for i in np.flatnonzero(reported):
+        gift_funds = slice(bounds[i], bounds[i + 1])
+        pledge_funds = pledge_groups.values[pledge_groups.offsets[pledge_located[i]]:
+                                            pledge_groups.offsets[pledge_located[i] + 1]]
+        findings.append({'usergiftid': gifts.decode([flagged[i]])[0],
+                         'payment_count': int(payment_count[i]),
+                         'payment_funds': '; '.join(funds.decode(fund[gift_funds])),
+                         'pledge_funds': '; '.join(funds.decode(pledge_funds)),
+                         'unmatched_funds': '; '.join(funds.decode(fund[gift_funds][unmatched[gift_funds]]))})
+
+    return pd.DataFrame(findings, columns=FINDING_COLUMNS)
+
+
+@task(name='Merge State', state_handlers=[timestamper])
+@handoff
+def merge_state(findings, diff):
+    """
+    Replaces the findings of the recomputed usergiftids in the findings of the previous run, then saves the state of
+    this run. Findings are ordered the way a full run orders them, by the first payment of each usergiftid.
+
+    :param findings: output of the second pass
+    :param diff: output of the state diff
+    :return: findings of the whole dataset
+    """
+    if diff['affected'] is not None:
+        previous = diff['previous']
+        findings = pd.concat([previous[~previous['usergiftid'].isin(diff['affected'])],
+                              findings[findings['usergiftid'].isin(diff['affected'])]], ignore_index=True)
+        order = first_seen(findings['usergiftid'], diff['payments']['usergiftid_pledge'])
+        findings = findings.iloc[np.argsort(order, kind='mergesort')].reset_index(drop=True)
+
+    if 'store' in diff:
+        diff['store'].save('fund_analysis', CLEAN_VERSION, {'payments': diff['payments'],
+                                                            'pledge_data': diff['pledge_data'],
+                                                            'findings': findings})
+
+    return findings
+
+
+def write_findings(findings, args):
+    """
+    Streams findings to a report in the requested output format, with its manifest.
+    :param findings: dataframe of findings, or an iterator of dataframes producing them a slice at a time
+    :param args: Supplied arguments when the program is initiated
+    :return: summary of the row count and destination of the report.
+    """
+    stamp = args.get('now') or str(now)
+    destination = output_directory(args)
+    writer = write_report(destination, 'fund_report_{}'.format(stamp), findings, args.get('output_format') or 'csv')
+    manifest = write_manifest(destination, 'fund_analysis', stamp, {'findings': writer})
+
+    return {'findings': writer.rows,
+            'outputs': str(writer.path),
+            'manifest': str(manifest)}
+
+
+@task(name='Report Findings', state_handlers=[timestamper])
+@handoff
+def report_findings(findings, args):
+    """
+    Streams the usergiftids flagged by the second pass to a report in the requested output format, with its manifest.
+    :param findings: Output of the second pass.
+    :param args: Supplied arguments when the program is initiated
+    :return: summary of the row count and destination of the report.
+    """
+    return write_findings(findings, args)
+
+
+def partition_payments(file, directory, shards, chunksize):
+    """
+    Splits the payments into shards by usergiftid. A row whose paymentid is shared with usergiftids of other shards is
+    copied to those shards as well, so the funds of every payment are complete in the shards of all its usergiftids.
+
+    :param file: payments file path
+    :param directory: shard directory of the run
+    :param shards: number of shards
+    :param chunksize: number of rows read at a time
+    :return: number of rows written to every shard
+    """
+    # first pass over the keys only: the shards of the usergiftids of every paymentid, paymentids are compared by hash
+    # as a collision only copies a few more rows
+    owners = []
+    for chunk in read_frames(Path(file), {'usergiftid_pledge': str, 'paymentid': str}, chunksize):
+        chunk = fill_missing(chunk)
+        owners.append(pd.DataFrame({'payment': key_hashes(chunk, ['paymentid']),
+                                    'shard': shard_ids(chunk, ['usergiftid_pledge'], shards)}).drop_duplicates())
+    owners = concat_frames(owners, columns=['payment', 'shard']).drop_duplicates()
+    shared = owners[owners['payment'].duplicated(keep=False)]
+
+    # rows repeated in a shard are dropped by reconcile_shard, in parallel
+    with ShardWriter(directory, 'payments', shards) as writer:
+        for chunk in number_rows(read_frames(Path(file), SCHEMAS['fund_analysis'], chunksize)):
+            chunk = standardize_funds(fill_missing(chunk))
+            ids = shard_ids(chunk, ['usergiftid_pledge'], shards)
+            copies = pd.DataFrame({'payment': key_hashes(chunk, ['paymentid']), 'position': np.arange(len(chunk)),
+                                   'own': ids}).merge(shared, on='payment')
+            copies = copies[copies['shard'].values != copies['own'].values]
+
+            # copies follow their row so every shard stays in file order
+            positions = np.concatenate([np.arange(len(chunk)), copies['position'].values])
+            order = np.argsort(positions, kind='mergesort')
+            writer.write(chunk.iloc[positions[order]], np.concatenate([ids, copies['shard'].values])[order])
+
+    return writer.rows
+
+
+def partition_pledges(file, directory, shards, chunksize):
+    """
+    Splits the pledges into shards by usergiftid.
+
+    :param file: pledge file path
+    :param directory: shard directory of the run
+    :param shards: number of shards
+    :param chunksize: number of rows read at a time
+    :return: number of rows written to every shard
+    """
+    with ShardWriter(directory, 'pledge_data', shards) as writer:
+        for chunk in number_rows(read_frames(Path(file), SCHEMAS['fund_analysis'], chunksize)):
+            chunk = standardize_funds(fill_missing(chunk))
+            writer.write(chunk, shard_ids(chunk, ['gift_id'], shards))
+
+    return writer.rows
+
+
+@task(name='Partition Data', state_handlers=[timestamper])
+@handoff
+def partition_data(files, args, directory):
+    """
+    Splits both files into shards by usergiftid, both files at the same time. The payments file is told apart from the
+    pledge file by its header.
+
+    :param files: 2 file paths
+    :param args: Supplied arguments when the program is initiated (shards and chunksize)
+    :param directory: shard directory of the run
+    :return: number of rows written to every shard of both files
+    """
+    shards = args['shards']
+    chunksize = args.get('chunksize') or SHARD_CHUNKSIZE
+
+    def partition(file):
+        if 'usergiftid_pledge' in [normalize_column(x) for x in read_header(file)]:
+            return 'payments', partition_payments(file, directory, shards, chunksize)
+        return 'pledge_data', partition_pledges(file, directory, shards, chunksize)
+
+    return dict(map_concurrently(partition, files))
+
+
+def reconcile_shard(directory, index):
+    """
+    Runs the fund analysis on a single shard. Executed inside the worker processes.
+
+    :param directory: shard directory of the run
+    :param index: shard number
+    :return: findings of the shard, with the position of the first payment of every usergiftid
+    """
+    payments = read_shard(directory, 'payments', index, SCHEMAS['fund_analysis'],
+                          PAYMENT_KEYS + [ROW_COLUMN]).drop_duplicates(PAYMENT_KEYS)
+    pledges = read_shard(directory, 'pledge_data', index, SCHEMAS['fund_analysis'],
+                         PLEDGE_KEYS + [ROW_COLUMN]).drop_duplicates(PLEDGE_KEYS)
+
+    # the tasks run as plain functions here, their results stay in memory whatever the handoff of the flow
+    with prefect.context(handoff_dir=None):
+        build = build_dict.run({'payments': payments, 'pledge_data': pledges})
+        findings = second_pass.run(build, first_pass.run(build))
+
+    first = payments.drop_duplicates('usergiftid_pledge').set_index('usergiftid_pledge')[ROW_COLUMN]
+    findings[ROW_COLUMN] = first.reindex(findings['usergiftid']).values
+
+    return findings
+
+
+@task(name='Reconcile Shard', state_handlers=[timestamper])
+@handoff
+def reconcile_shard_data(index, directory):
+    """
+    Runs the fund analysis on a single shard. Mapped over the shards on the parallel executors.
+
+    :param index: shard number
+    :param directory: shard directory of the run
+    :return: findings of the shard
+    """
+    return reconcile_shard(directory, index)
+
+
+@task(name='Reconcile Shard', state_handlers=[timestamper])
+@handoff
+def reconcile_shards(partitions, args, directory):
+    """
+    Runs the fund analysis on every shard on a process pool, for the sequential local executor.
+
+    :param partitions: output of the partition, the shards are reconciled once it is done
+    :param args: Supplied arguments when the program is initiated (shards and workers)
+    :param directory: shard directory of the run
+    :return: findings of every shard
+    """
+    return map_shards(partial(reconcile_shard, directory), args['shards'], args)
+
+
+@task(name='Report Findings', state_handlers=[timestamper])
+@handoff
+def report_shards(results, args):
+    """
+    Merges the findings of every shard in the order of a single run, by the first payment of each usergiftid, and
+    streams them to the report a slice at a time as they are merged.
+
+    :param results: findings of every shard
+    :param args: Supplied arguments when the program is initiated
+    :return: summary of the row count and destination of the report.
+    """
+    return write_findings(order_rows(results, ROW_COLUMN), args)
+
+
+def run_sharded(args):
+    """
+    Runs the fund analysis on shards of both files, see reporter/shard.py.
+    :param args: Supplied arguments when the program is initiated, with the number of shards
+    :return: final state of the flow run
+    """
+    with shard_context(args) as directory:
+        with Flow('Compare Data') as flow:
+            partitions = partition_data(validate_submission(args), args, directory)
+            if (args.get('executor') or 'local') == 'local':
+                results = reconcile_shards(partitions, args, directory)
+            else:
+                results = reconcile_shard_data.map(list(range(args['shards'])), unmapped(directory),
+                                                   upstream_tasks=[unmapped(partitions)])
+            report_shards(results, args)
+
+        with handoff_context(args) as context:
+            results = flow.run(executor=get_executor(args), context=dict(profile_context(args, args['now']), **context))
+    write_profile(flow, results, args, args['now'])
+
+    return results
 
 
 def run(args):
+    # runs of the resident server each pass their own timestamp, the reports of a run are named after it
+    args = dict(args, now=str(args.get('now') or now))
+    if args.get('shards'):
+        return run_sharded(args)
+
     with Flow('Compare Data') as flow:
         submission = validate_submission(args)
-        clean = clean_data(submission)
-        validate = validate_data(clean)
-        build = build_dict(validate)
-        first = first_pass(build)
-        second_pass(first)
-
-    results = flow.run()
+        if (args.get('executor') or 'local') == 'local':
+            clean = clean_files(submission, args)
+        else:
+            clean = clean_data.map(submission, unmapped(args))
+        validate = validate_data(sort_data(clean))
+        diff = diff_state(reduce_data(validate, args), args)
+        build = build_dict(diff['data'])
+        second = second_pass(build, first_pass(build))
+        report_findings(merge_state(second, diff), args)
+
+    with dask_scheduler(args), handoff_context(args) as context:
+        results = flow.run(executor=get_executor(args), context=dict(profile_context(args, args['now']), **context))
+    write_profile(flow, results, args, args['now'])
 
     return results
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Data Comparison Tool')
+    parser = argparse.ArgumentParser(description='Data Comparison Tool', parents=[run_parser()])
     parser.add_argument('-f1', '--file1', default=False, required=True,
                         help='first file path to be compared'),
     parser.add_argument('-f2', '--file2', default=False, required=True,
@@ -0,0 +1,223 @@
+"""
+Sharded reconciliation of a single large file pair. Both inputs are streamed a chunk at a time, cleaned, and split by a
+hash of their join key into N shard files on disk, so every row of a key lands in the same shard on both sides. The
+shards are then reconciled independently, on a process pool with the local executor or as mapped tasks on the dask
+executors, and the findings of every shard are merged back in the order a single run would report them, streamed to the
+report a slice at a time. Only one shard per worker is held in memory at a time.
+
+Shards are Parquet files in a temporary directory, one per shard and side, holding the cleaned columns of the report
+and the position of every row in its input file. The directory is created under the shard directory of the arguments
+(default: the system temp directory) and removed once the run is over.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .ingest import init_arrow
+from .output import WRITE_CHUNKSIZE
+
+# rows read at a time while partitioning when no chunksize is provided
+SHARD_CHUNKSIZE = 1000000
+
+# position of every row in its input file, findings are put back in the order of a single run with it
+ROW_COLUMN = 'shard_row'
+
+
+def key_hashes(df, keys):
+    """
+    :param df: dataframe holding the key columns
+    :param keys: key columns
+    :return: uint64 array with the hash of the keys of every row, the same in every file and process
+    """
+    if len(keys) == 1:
+        return pd.util.hash_array(np.asarray(df[keys[0]].values))
+
+    return pd.util.hash_pandas_object(df[keys], index=False).values
+
+
+def shard_ids(df, keys, shards):
+    """
+    :param df: dataframe holding the key columns
+    :param keys: key columns
+    :param shards: number of shards
+    :return: int64 array with the shard of every row, equal keys get the same shard in every file
+    """
+    return (key_hashes(df, keys) % np.uint64(shards)).astype(np.int64)
+
+
+def shard_path(directory, name, index):
+    """
+    :param directory: shard directory of the run
+    :param name: side of the pair, e.g. payments
+    :param index: shard number
+    :return: path of the shard file
+    """
+    return Path(directory) / '{}_{:04d}.parquet'.format(name, index)
+
+
+class ShardWriter:
+    """
+    Appends rows to the shard files of one side of a pair, used as a context manager. Categorical columns are written as
+    strings, chunks rarely share categories, and restored by read_shard.
+    """
+    def __init__(self, directory, name, shards):
+        """
+        :param directory: shard directory of the run
+        :param name: side of the pair
+        :param shards: number of shards
+        """
+        self.directory = directory
+        self.name = name
+        self.shards = shards
+        self.rows = np.zeros(shards, dtype=np.int64)
+        self._writers = {}
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, df, ids):
+        """
+        Appends the rows of a chunk to their shards, in the order of the chunk.
+        :param df: cleaned chunk
+        :param ids: shard of every row
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        init_arrow()
+        df = df.reset_index(drop=True)
+        for col in df.columns:
+            if df[col].dtype.name == 'category':
+                df[col] = df[col].astype(object)
+
+        # stable sort so the rows of every shard keep their order
+        order = np.argsort(ids, kind='mergesort')
+        bounds = np.searchsorted(ids[order], np.arange(self.shards + 1))
+        for index in np.flatnonzero(np.diff(bounds)):
+            rows = df.iloc[order[bounds[index]:bounds[index + 1]]]
+            table = pa.Table.from_pandas(rows, schema=self._schema, preserve_index=False)
+            if self._schema is None:
+                self._schema = table.schema
+            if index not in self._writers:
+                self._writers[index] = pq.ParquetWriter(str(shard_path(self.directory, self.name, index)),
+                                                        self._schema)
+            self._writers[index].write_table(table)
+            self.rows[index] += len(rows)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def read_shard(directory, name, index, schema, columns):
+    """
+    Reads a shard file back.
+    :param directory: shard directory of the run
+    :param name: side of the pair
+    :param index: shard number
+    :param schema: dict of column -> dtype, categorical columns are restored
+    :param columns: columns of the empty dataframe returned for shards without rows
+    :return: dataframe
+    """
+    path = shard_path(directory, name, index)
+    if not path.exists():
+        return pd.DataFrame({col: pd.Series(dtype=schema.get(col, np.int64 if col == ROW_COLUMN else object))
+                             for col in columns}, columns=columns)
+
+    import pyarrow.parquet as pq
+    init_arrow()
+    df = pq.read_table(str(path)).to_pandas()
+    for col in df.columns:
+        # parquet nulls come back as None, pandas marks missing values as NaN
+        if df[col].dtype == object and df[col].hasnans:
+            df[col] = df[col].where(df[col].notna())
+        if schema.get(col) == 'category':
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def number_rows(chunks):
+    """
+    Adds the position of every row in its file to a stream of chunks.
+    :param chunks: iterator of dataframes read from a file in order
+    :return: iterator of dataframes with a ROW_COLUMN column
+    """
+    start = 0
+    for chunk in chunks:
+        chunk[ROW_COLUMN] = np.arange(start, start + len(chunk), dtype=np.int64)
+        start += len(chunk)
+        yield chunk
+
+
+def map_shards(func, shards, args):
+    """
+    Reconciles the shards in parallel on a process pool, a process per worker and at most one per shard. With fewer
+    than 2 workers, or when called from a daemonic process like the workers of directory mode, the shards are reconciled
+    one after another in the current process.
+    :param func: picklable function of a shard number
+    :param shards: number of shards
+    :param args: arguments dict with an optional workers key, the cpu count by default
+    :return: list of results in shard order
+    """
+    workers = min(args.get('workers') or os.cpu_count(), shards)
+    # the pairs of directory mode already run in worker processes, which cannot start processes of their own
+    if workers < 2 or multiprocessing.current_process().daemon:
+        return [func(index) for index in range(shards)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, range(shards)))
+
+
+def order_rows(frames, *columns, chunksize=WRITE_CHUNKSIZE):
+    """
+    Merges the findings of every shard in the order of the order columns, which are dropped, a slice of rows at a time.
+    Only the order columns are concatenated, the rows of a slice are taken from the shards it draws from, so the merged
+    findings are never held in memory next to the findings of the shards.
+    :param frames: list of dataframes holding the order columns
+    :param columns: order columns, the first is the primary one
+    :param chunksize: rows of every slice
+    :return: iterator of dataframes, a single empty one when no shard has rows
+    """
+    frames = list(frames)
+    lengths = [len(df) for df in frames]
+    shard = np.repeat(np.arange(len(frames)), lengths)
+    position = np.concatenate([np.arange(x, dtype=np.int64) for x in lengths] or [np.empty(0, dtype=np.int64)])
+    order = np.lexsort([np.concatenate([df[col].values for df in frames]) for col in reversed(columns)])
+
+    if not len(order):
+        yield frames[0].iloc[:0].drop(columns=list(columns)) if frames else pd.DataFrame()
+    for start in range(0, len(order), chunksize):
+        rows = order[start:start + chunksize]
+        # the rows of the slice are taken shard by shard, then put back in the order of the slice
+        grouped = np.argsort(shard[rows], kind='mergesort')
+        rows = rows[grouped]
+        chunk = pd.concat([frames[i].iloc[position[rows[shard[rows] == i]]] for i in np.unique(shard[rows])],
+                          ignore_index=True)
+        yield chunk.iloc[np.argsort(grouped, kind='mergesort')].drop(columns=list(columns)).reset_index(drop=True)
+
+
+@contextmanager
+def shard_context(args):
+    """
+    Creates the shard directory of a run, and removes it once the run is over.
+    :param args: arguments dict with an optional shard_dir key
+    :return: path of the shard directory
+    """
+    if args.get('shard_dir'):
+        Path(args['shard_dir']).mkdir(parents=True, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='shards_', dir=args.get('shard_dir'))
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,145 @@
+"""
+State store of incremental reconciliations. After a run, the cleaned key rows of both inputs are saved along with a hash
+of every row and the findings of the report. The next run against the same state hashes its rows again, finds the rows
+that were added, changed or deleted since, and only recomputes the findings of the usergiftids or project IDs those rows
+touch. The findings of every other key are carried over from the previous run.
+
+A state belongs to one reconciliation (e.g. the daily RE/SF export of a fund), so every reconciliation gets its own
+state directory. A state written by another report type or an older state version is ignored and rebuilt by a full run.
+"""
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# bump whenever the layout of the saved frames changes so older states are rebuilt
+STATE_VERSION = 1
+
+HASH_COLUMN = 'row_hash'
+
+
+def row_hashes(df, columns):
+    """
+    Hashes the values of every row of a dataframe.
+    :param df: dataframe
+    :param columns: columns the hash covers
+    :return: uint64 array, one hash per row
+    """
+    return pd.util.hash_pandas_object(df[columns], index=False).values
+
+
+def changed_hashes(old, new):
+    """
+    Finds the row hashes whose number of occurrences differ between two runs, i.e. rows that were added or deleted. A
+    changed row shows up as the deletion of its old hash and the addition of its new one.
+    :param old: row hashes of the previous run
+    :param new: row hashes of this run
+    :return: array of changed hashes
+    """
+    counts = pd.Series(old).value_counts().sub(pd.Series(new).value_counts(), fill_value=0)
+
+    return counts.index[counts != 0].values
+
+
+def first_seen(values, order):
+    """
+    Positions of values by the order they first appear in another series, used to put merged findings back in the
+    order a full run would produce them.
+    :param values: values to position
+    :param order: series whose first appearances define the order
+    :return: integer array, -1 for values that never appear
+    """
+    return pd.Index(pd.unique(order)).get_indexer(values)
+
+
+class StateStore:
+    """
+    Directory holding the frames and findings of the previous run of one reconciliation as Feather files, with a json
+    file recording the report type and versions they were written with.
+    """
+    def __init__(self, directory):
+        """
+        :param directory: state directory of the reconciliation
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def load(self, report, version):
+        """
+        :param report: report type
+        :param version: cleaning version of the report
+        :return: dict of name -> dataframe, or None when there is no usable state
+        """
+        meta_path = self.directory / 'state.json'
+        if not meta_path.exists():
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta != {'report': report, 'version': version, 'state_version': STATE_VERSION, 'frames': meta['frames']}:
+            return None
+
+        return {name: pd.read_feather(str(self.directory / '{}.feather'.format(name))) for name in meta['frames']}
+
+    def save(self, report, version, frames):
+        """
+        Replaces the state with the frames of this run. The json file is written last so an interrupted save leaves no
+        usable state behind and the next run falls back to a full run.
+        :param report: report type
+        :param version: cleaning version of the report
+        :param frames: dict of name -> dataframe
+        """
+        meta_path = self.directory / 'state.json'
+        if meta_path.exists():
+            meta_path.unlink()
+
+        for name, df in frames.items():
+            path = self.directory / '{}.feather'.format(name)
+            tmp_path = path.with_suffix('.tmp')
+            df.reset_index(drop=True).to_feather(str(tmp_path))
+            os.replace(str(tmp_path), str(path))
+
+        with open(meta_path, 'w') as f:
+            json.dump({'report': report, 'version': version, 'state_version': STATE_VERSION,
+                       'frames': list(frames)}, f)
+
+
+def open_state(args):
+    """
+    Builds the state store from the program arguments.
+    :param args: arguments dict with an optional state_dir key
+    :return: StateStore, or None when the run is not incremental
+    """
+    if not args.get('state_dir'):
+        return None
+
+    return StateStore(args['state_dir'])
+
+
+def with_hashes(df, columns):
+    """
+    :param df: dataframe
+    :param columns: columns the row hash covers
+    :return: the columns of the dataframe along with their row hash, as saved in the state
+    """
+    saved = df[columns].reset_index(drop=True)
+    saved[HASH_COLUMN] = row_hashes(saved, columns)
+
+    return saved
+
+
+def changed_rows(previous, current, columns):
+    """
+    Finds the rows added to or deleted from a dataframe since the previous run.
+    :param previous: dataframe saved by the previous run, with its row hashes
+    :param current: dataframe of this run, with its row hashes
+    :param columns: columns returned
+    :return: dataframe of the changed rows of both runs
+    """
+    changed = changed_hashes(previous[HASH_COLUMN].values, current[HASH_COLUMN].values)
+    if len(changed) == 0:
+        return current.loc[[], columns]
+
+    return pd.concat([previous.loc[np.isin(previous[HASH_COLUMN].values, changed), columns],
+                      current.loc[np.isin(current[HASH_COLUMN].values, changed), columns]], ignore_index=True)
@@ -0,0 +1,20 @@
+import pytest
+from reporter import arguments, ingest, output
+from reporter.services import data_compare, fund_report
+
+
+def test_choices_match_the_modules():
+    assert arguments.OUTPUT_FORMATS == output.OUTPUT_FORMATS
+    assert arguments.READERS == ingest.READERS
+
+
+@pytest.mark.parametrize('service', [data_compare, fund_report])
+def test_services_take_the_shared_arguments(service, monkeypatch):
+    runs = []
+    monkeypatch.setattr('sys.argv', ['service', '-f1', 'a.csv', '-f2', 'b.csv', '-o', 'out', '--engine', 'dask',
+                                     '--shards', '4', '-w', '2', '--no-cache'])
+    monkeypatch.setattr(service, 'run', runs.append)
+
+    service.main()
+    assert runs[0]['engine'] == 'dask' and runs[0]['shards'] == 4 and runs[0]['workers'] == 2
+    assert runs[0]['no_cache'] and runs[0]['output_format'] == 'csv'
@@ -0,0 +1,118 @@
+import os
+import pandas as pd
+import pytest
+from reporter.cache import FrameCache, MemoryCache, cache_key, load_cached, open_cache
+
+SCHEMA = {'project_id': str, 'fund': 'category'}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'export.csv'
+    path.write_text('project_id,fund\na,x\nb,y\n')
+    return path
+
+
+class Loader:
+    """counts the calls of a cleaning function"""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return pd.read_csv(str(path), dtype=str), {'rows': 2}
+
+
+def test_key_changes_with_the_inputs(source):
+    key = cache_key(source, 1, SCHEMA, {'reader': 'pandas'})
+
+    assert cache_key(source, 1, SCHEMA, {'reader': 'pandas'}) == key
+    assert cache_key(source, 2, SCHEMA, {'reader': 'pandas'}) != key
+    assert cache_key(source, 1, dict(SCHEMA, fund=str), {'reader': 'pandas'}) != key
+    assert cache_key(source, 1, SCHEMA, {'reader': 'pyarrow'}) != key
+
+    source.write_text('project_id,fund\na,x\nb,z\n')
+    assert cache_key(source, 1, SCHEMA, {'reader': 'pandas'}) != key
+
+
+def test_memory_key_changes_with_the_file(source):
+    key = MemoryCache.key(source, 1, SCHEMA)
+    assert MemoryCache.key(source, 1, SCHEMA) == key
+
+    stat = source.stat()
+    os.utime(str(source), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert MemoryCache.key(source, 1, SCHEMA) != key
+
+
+def test_load_cached(tmp_path, source):
+    cache = FrameCache(tmp_path / 'cache')
+    loader = Loader()
+
+    first = load_cached(source, loader, 1, SCHEMA, cache=cache)
+    second = load_cached(source, loader, 1, SCHEMA, cache=cache)
+    assert loader.calls == 1
+    pd.testing.assert_frame_equal(first[0], second[0])
+    assert second[1] == {'rows': 2}
+
+    load_cached(source, loader, 2, SCHEMA, cache=cache)
+    assert loader.calls == 2
+    load_cached(source, loader, 2, SCHEMA)
+    assert loader.calls == 3
+    assert not list((tmp_path / 'cache').glob('*.tmp'))
+
+
+def test_refresh(tmp_path, source):
+    loader = Loader()
+    load_cached(source, loader, 1, SCHEMA, cache=FrameCache(tmp_path))
+    load_cached(source, loader, 1, SCHEMA, cache=FrameCache(tmp_path, refresh=True))
+
+    assert loader.calls == 2
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = FrameCache(tmp_path, max_size=1)
+    df = pd.DataFrame({'value': range(50000)})
+    for key in ('a', 'b', 'c'):
+        cache.put(key, df, {})
+        os.utime(str(cache.paths(key)[0]), (0, {'a': 1, 'b': 3, 'c': 2}[key]))
+    cache.max_bytes = 2 * cache.paths('a')[0].stat().st_size
+    cache.evict()
+
+    assert cache.get('a') is None
+    assert cache.get('b') is not None and cache.get('c') is not None
+    assert not cache.paths('a')[1].exists()
+
+
+def test_memory_cache(tmp_path):
+    backing = FrameCache(tmp_path)
+    cache = MemoryCache(backing=backing)
+    df = pd.DataFrame({'value': [1, 2]})
+    cache.put('a', df, {'rows': 2})
+
+    cached, meta = cache.get('a')
+    cached.loc[0, 'value'] = 5
+    assert cache.get('a')[0]['value'].tolist() == [1, 2]
+    assert cache.get('b') is None
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 1
+
+    cache.max_bytes = int(df.memory_usage(deep=True).sum()) * 3 // 2
+    cache.put('b', df, {})
+    assert cache.get('a') is None and cache.stats()['entries'] == 1
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_memory_cache_falls_back_to_disk(tmp_path, source):
+    loader = Loader()
+    load_cached(source, loader, 1, SCHEMA, cache=MemoryCache(backing=FrameCache(tmp_path)))
+    load_cached(source, loader, 1, SCHEMA, cache=MemoryCache(backing=FrameCache(tmp_path)))
+
+    assert loader.calls == 1
+
+
+def test_open_cache(tmp_path):
+    assert open_cache({'no_cache': True}) is None
+
+    cache = open_cache({'cache_dir': str(tmp_path), 'cache_size': 5, 'refresh_cache': True})
+    assert cache.directory == tmp_path and cache.max_bytes == 5 * 1024 * 1024 and cache.refresh
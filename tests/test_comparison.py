@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import pytest
+from reporter.comparison import (Comparison, cleaned_column, find_missing, find_variances, finding_keys,
+                                 parse_tolerances)
+from reporter.money import MISSING_CENTS
+from reporter.services.data_compare import standardize
+
+
+@pytest.mark.parametrize('values, tolerances', [
+    (None, {}),
+    (['0.5'], {None: 0.5}),
+    (['amount=0.01', 'count=0'], {'amount': 0.01, 'count': 0.0}),
+])
+def test_parse_tolerances(values, tolerances):
+    assert parse_tolerances(values) == tolerances
+
+
+def test_comparison_columns():
+    comparison = Comparison(measures=['amount', 'count'], tolerances={None: 1, 'count': 0})
+
+    assert comparison.tolerances == {'amount': 1.0, 'count': 0.0}
+    assert comparison.key_columns == ['project_id_new']
+    assert comparison.variance_columns == {'amount': 'amount_variance', 'count': 'count_variance'}
+    assert comparison.columns == ['project_id_new', 'sum_of_amount_5_new', 'record_count_5_new', 'source']
+    assert comparison.schema({})['gift_count'] is str
+    assert Comparison().variance_columns == {'amount': 'variance'}
+    assert cleaned_column('sum_of_amount.5') == 'sum_of_amount_5_new'
+
+
+def test_comparison_from_args():
+    comparison = Comparison.from_args({'key': ['project_id', 'fund'], 'compare_column': 'count',
+                                       'tolerance': ['0.1']})
+
+    assert comparison.keys == ['project_id', 'fund']
+    assert comparison.measures == ['count']
+    assert comparison.tolerances == {'count': 0.1}
+
+
+def test_measure_types():
+    comparison = Comparison.from_args({'compare_column': ['amount', 'count', 'gift_total:amount', 'sum_of_amount.1']})
+
+    assert comparison.measures == ['amount', 'count', 'gift_total', 'sum_of_amount.1']
+    assert comparison.types == {'amount': 'amount', 'count': 'number', 'gift_total': 'amount',
+                                'sum_of_amount.1': 'amount'}
+    assert comparison.measure_dtypes['record_count_5_new'] is np.float64
+    assert comparison.cents_columns == ['amount_variance', 'gift_total_variance', 'sum_of_amount.1_variance']
+    with pytest.raises(ValueError, match='unknown measure types'):
+        Comparison.from_args({'compare_column': ['gift_total:money']})
+    with pytest.raises(ValueError, match='both an amount and a number'):
+        Comparison.from_args({'compare_column': ['amount', 'sum_of_amount.5:number']})
+
+
+def test_standardize_by_type():
+    comparison = Comparison(keys=['project_id', 'fund'], measures=['amount', 'count'])
+    df = pd.DataFrame({'project_id': ['AB - 1 2'], 'fund': [' General - Fund '], 'sum_of_amount.5': ['$1,234.50'],
+                       'record_count.5': ['1,003']})
+
+    df = standardize(df, comparison)
+    assert df['project_id_new'].tolist() == ['ab_1_2']
+    assert df['fund_new'].tolist() == ['General - Fund']
+    assert df['sum_of_amount_5_new'].tolist() == [123450]
+    assert df['record_count_5_new'].dtype == np.float64 and df['record_count_5_new'].tolist() == [1003]
+    with pytest.raises(ValueError, match='not numbers'):
+        standardize(pd.DataFrame({'project_id': ['a'], 'record_count.5': ['$3']}), Comparison(measures=['count']))
+
+
+def test_unknown_tolerance():
+    with pytest.raises(ValueError, match='not compared'):
+        Comparison(tolerances={'count': 1})
+
+
+def test_find_missing():
+    left = pd.DataFrame({'key': ['a', 'b', 'b', np.nan, 'c'], 'source': 'RE'})
+    right = pd.DataFrame({'key': ['a', 'd', np.nan], 'source': 'SF'})
+
+    missing = find_missing(left, right, 'key')
+    assert missing.values.tolist() == [['b', 'RE', 2], ['c', 'RE', 1], ['d', 'SF', 1]]
+
+
+def test_find_missing_composite_keys():
+    left = pd.DataFrame({'a': ['x', 'x'], 'b': ['1', '2'], 'source': 'RE'})
+    right = pd.DataFrame({'a': ['x', 'y'], 'b': ['2', '1'], 'source': 'SF'})
+
+    missing = find_missing(left, right, ['a', 'b'])
+    assert missing[['a', 'b', 'source']].values.tolist() == [['x', '1', 'RE'], ['y', '1', 'SF']]
+
+
+def test_find_variances():
+    comparison = Comparison(measures=['amount', 'count'], tolerances={'amount': 0.01, 'count': 0})
+    left = pd.DataFrame({'project_id_new': ['a', 'b', 'c', 'd'],
+                         'sum_of_amount_5_new': [100, 100, MISSING_CENTS, 100],
+                         'record_count_5_new': [1, 1, 1, 1]})
+    right = pd.DataFrame({'project_id_new': ['a', 'b', 'c', 'd'],
+                          'sum_of_amount_5_new': [101, 102, 100, 100],
+                          'record_count_5_new': [1, 1, 1, 2]})
+
+    differ = find_variances(left, right, comparison)
+    assert differ['project_id_new'].tolist() == ['b', 'c', 'd']
+    assert differ['amount_variance'].tolist() == [2, MISSING_CENTS, 0]
+    assert differ['count_variance'].tolist() == [0, 0, 1]
+
+
+def test_find_variances_of_numbers():
+    comparison = Comparison(measures=['count'], tolerances={'count': 0.5})
+    left = pd.DataFrame({'project_id_new': ['a', 'b', 'c'], 'record_count_5_new': [3.0, 3.0, np.nan]})
+    right = pd.DataFrame({'project_id_new': ['a', 'b', 'c'], 'record_count_5_new': [3.5, 4.0, 1.0]})
+
+    # numbers are compared in their own unit, not in cents
+    differ = find_variances(left, right, comparison)
+    assert differ['project_id_new'].tolist() == ['b', 'c']
+    assert differ['variance'].tolist()[0] == 1.0 and np.isnan(differ['variance'].tolist()[1])
+
+
+def test_find_variances_keeps_the_last_duplicate():
+    left = pd.DataFrame({'project_id_new': ['a'], 'sum_of_amount_5_new': [100]})
+    right = pd.DataFrame({'project_id_new': ['a', 'a'], 'sum_of_amount_5_new': [90, 80]})
+
+    differ = find_variances(left, right, Comparison())
+    assert differ.values.tolist() == [['a', 20]]
+
+
+def test_finding_keys():
+    dask = pytest.importorskip('dask')
+    import dask.dataframe as dd
+
+    comparison = Comparison(measures=['amount', 'count'])
+    left = pd.DataFrame({'project_id_new': ['a', 'b', 'c', 'd', np.nan, 'a', 'e'],
+                         'sum_of_amount_5_new': [1, 2, 3, 4, 5, 1, 6], 'record_count_5_new': 1, 'source': 'SF'})
+    right = pd.DataFrame({'project_id_new': ['b', 'a', 'c', 'f', np.nan, 'e'],
+                          'sum_of_amount_5_new': [2, 1, 9, 7, 5, 6], 'record_count_5_new': [1, 1, 1, 1, 2, 1],
+                          'source': 'RE'})
+
+    # strings stay objects with NaN as with the pinned dask, recent versions convert them to pyarrow strings
+    with dask.config.set({'dataframe.convert-string': False}):
+        found = finding_keys(dd.from_pandas(left, npartitions=3), dd.from_pandas(right, npartitions=2), comparison)
+    # d and f are missing from the other data set, c and the missing key differ
+    assert sorted(found['project_id_new'].fillna('-')) == ['-', 'c', 'd', 'f']
+
+    subsets = [df[df['project_id_new'].isin(found['project_id_new']).values] for df in (left, right)]
+    keys = comparison.key_columns
+    assert find_missing(*subsets, keys).equals(find_missing(left, right, keys))
+    assert (find_variances(*subsets, comparison).values.tolist() ==
+            find_variances(left, right, comparison).values.tolist())
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from reporter.encoding import Groups, Vocabulary, compare_values, group_codes, pair_codes, popcount, value_masks
+
+
+def test_vocabulary_round_trip():
+    vocabulary = Vocabulary()
+    first = vocabulary.encode(pd.Series(['b', 'a', np.nan, 'b']))
+    second = vocabulary.encode(np.array(['c', 'a'], dtype=object))
+
+    assert first.tolist() == [0, 1, -1, 0]
+    assert second.tolist() == [2, 1]
+    assert len(vocabulary) == 3
+    assert vocabulary.decode([2, 0, 1]).tolist() == ['c', 'b', 'a']
+
+
+def test_pair_codes():
+    assert pair_codes([0, 1, 2], [3, 0, 4], 5).tolist() == [3, 5, 14]
+
+
+@pytest.fixture
+def groups():
+    keys = Vocabulary()
+    values = Vocabulary()
+    key_codes = keys.encode(pd.Series(['g2', 'g1', 'g2', 'g1', 'g2', 'g3']))
+    value_codes = values.encode(pd.Series(['x', 'y', 'z', 'y', 'x', 'x']))
+    return keys, values, group_codes(key_codes, value_codes, len(keys), len(values))
+
+
+def test_groups_keep_first_seen_order(groups):
+    keys, values, grouped = groups
+
+    assert grouped.to_dict(keys, values) == {'g2': ['x', 'z'], 'g1': ['y'], 'g3': ['x']}
+    assert list(grouped.to_dict(keys, values)) == ['g2', 'g1', 'g3']
+    assert grouped.sizes.tolist() == [2, 1, 1]
+    assert grouped.owners().tolist() == [0, 0, 1, 2]
+
+
+def test_groups_locate_and_expand(groups):
+    _, _, grouped = groups
+    located = grouped.locate([2, 0, 7, -1])
+    assert located.tolist() == [2, 0, -1, -1]
+
+    owner, values = grouped.expand(located[:2])
+    assert owner.tolist() == [0, 1, 1]
+    assert values.tolist() == [0, 0, 2]
+
+
+def test_empty_groups():
+    grouped = Groups([], [0], [], 3)
+
+    assert len(grouped) == 0
+    assert grouped.locate([0, 1]).tolist() == [-1, -1]
+    assert len(value_masks(grouped)) == 0
+
+
+def test_value_masks_and_popcount(groups):
+    _, _, grouped = groups
+    masks = value_masks(grouped)
+
+    assert masks.tolist() == [0b101, 0b010, 0b001]
+    assert popcount(masks).tolist() == [2, 1, 1]
+    assert popcount(np.array([np.iinfo(np.uint64).max], dtype=np.uint64)).tolist() == [64]
+
+
+@pytest.mark.parametrize('width', [3, 100])
+def test_compare_values(width):
+    # key 0 misses value 2, key 1 matches, key 2 is not in right
+    left = group_codes(np.array([0, 0, 1, 2]), np.array([1, 2, 1, 0]), 3, width)
+    right = group_codes(np.array([0, 1, 1]), np.array([1, 1, 0]), 3, width)
+    left_counts, right_counts, difference = compare_values(left, right, width)
+
+    assert left_counts.tolist() == [1, 0, -1]
+    # right key 1 has value 0 which left key 1 does not
+    assert right_counts.tolist() == [0, 1]
+    assert difference.tolist() == pair_codes([0, 1, 2], [2, 0, 0], width).tolist()
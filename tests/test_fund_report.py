@@ -0,0 +1,39 @@
+import pytest
+from benchmarks import bench_build_dict
+from benchmarks.bench_first_pass import legacy_first_pass
+from reporter.services.fund_report import build_dict, first_pass, reduce_data, second_pass
+
+
+def analyze(data):
+    build = build_dict.run(data)
+    return second_pass.run(build, first_pass.run(build))
+
+
+@pytest.mark.parametrize('funds', [10, 80], ids=['masks', 'pair_codes'])
+def test_first_pass_compares_both_ways(funds):
+    build = build_dict.run(bench_build_dict.make_data(5000, funds=funds))
+    gifts, funds = build['vocabulary']['gifts'], build['vocabulary']['funds']
+    payments = build['payment_groups'].to_dict(gifts, funds)
+    pledges = build['pledge_groups'].to_dict(gifts, funds)
+    legacy = legacy_first_pass(pledges, payments)
+
+    results = first_pass.run(build)
+
+    for key, legacy_key in (('unmatched', 'payment_results'), ('not_exist', 'not_exist_'),
+                            ('pledge_unmatched', 'pledge_results'), ('pledge_not_exist', 'not_exist')):
+        assert gifts.decode(results[key]).tolist() == legacy[legacy_key]
+    difference = set(zip(gifts.decode(results['difference_gifts']), funds.decode(results['difference_funds'])))
+    pairs = [{(gift, fund) for gift, values in x.items() for fund in values} for x in (payments, pledges)]
+    assert len(difference) == len(results['difference_gifts']) and difference == pairs[0] ^ pairs[1]
+
+
+def test_dask_reduction_reports_the_same():
+    dd = pytest.importorskip('dask.dataframe')
+    data = bench_build_dict.make_data(5000, funds=10)
+    partitioned = {name: dd.from_pandas(df, npartitions=4) for name, df in data.items()}
+
+    reduced = reduce_data.run(partitioned, {'engine': 'dask'})
+
+    assert len(reduced['payments']) < len(data['payments'])
+    findings = analyze(reduced)
+    assert len(findings) and findings.equals(analyze(data))
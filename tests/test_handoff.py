@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import prefect
+from reporter.encoding import Vocabulary, group_codes
+from reporter.handoff import ArrayHandle, FrameHandle, handoff, handoff_context, resolve, store
+
+
+def test_round_trip(tmp_path):
+    vocabulary = Vocabulary()
+    codes = vocabulary.encode(pd.Series(['a', 'b', 'a']))
+    groups = group_codes(codes, np.array([1, 0, 1]), len(vocabulary), 2)
+    df = pd.DataFrame({'key': ['a', 'b'], 'value': [1.5, np.nan]}, index=[3, 4])
+    result = {'frame': df, 'codes': codes, 'groups': groups, 'vocabulary': vocabulary, 'pair': (df, 'name'), 'n': 3}
+
+    stored = store(result, tmp_path)
+    assert isinstance(stored['frame'], FrameHandle) and isinstance(stored['codes'], ArrayHandle)
+    assert stored['pair'][1] == 'name' and stored['n'] == 3
+
+    loaded = resolve(stored)
+    pd.testing.assert_frame_equal(loaded['frame'], df.reset_index(drop=True))
+    assert loaded['codes'].tolist() == codes.tolist()
+    assert loaded['groups'].to_dict(loaded['vocabulary'], vocabulary) == groups.to_dict(vocabulary, vocabulary)
+    assert loaded['vocabulary'].decode([1, 0]).tolist() == ['b', 'a']
+
+
+def test_loaded_inputs_are_not_written_again(tmp_path):
+    stored = store({'frame': pd.DataFrame({'value': [1]})}, tmp_path)
+    loaded = {}
+    frame = resolve(stored, loaded)['frame']
+
+    assert store(frame, tmp_path, loaded) is stored['frame']
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_handoff_decorator(tmp_path):
+    @handoff
+    def double(df):
+        return df * 2
+
+    df = pd.DataFrame({'value': [1, 2]})
+    assert double(df)['value'].tolist() == [2, 4]
+
+    with handoff_context({'handoff': 'mmap', 'handoff_dir': str(tmp_path)}) as context:
+        with prefect.context(**context):
+            handle = double(df)
+            assert isinstance(handle, FrameHandle)
+            assert double(handle).load()['value'].tolist() == [4, 8]
+    assert not list(tmp_path.iterdir())
+
+
+def test_handoff_context_in_memory():
+    with handoff_context({'handoff': 'memory'}) as context:
+        assert context == {}
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from reporter.ingest import (LAYOUTS, SCHEMAS, concat_frames, fill_missing, read_frames, read_header,
+                             restore_categories, validate_file, validate_files)
+
+PAYMENTS = ('UserGiftID Pledge,PaymentID,Fund,Amount,Amount\n'
+            '0012,p1,General,1,2\n'
+            '0013,p2,,3,4\n'
+            '0012,p3,Library,5,6\n')
+
+
+@pytest.fixture
+def payments(tmp_path):
+    path = tmp_path / 'payments.csv'
+    path.write_text(PAYMENTS)
+    return path
+
+
+def test_read_header(payments):
+    assert read_header(payments) == ['UserGiftID Pledge', 'PaymentID', 'Fund', 'Amount', 'Amount.1']
+
+
+def test_validate_file(tmp_path, payments):
+    assert validate_file(payments, LAYOUTS['fund_analysis'])[:3] == ['usergiftid_pledge', 'paymentid', 'fund']
+
+    other = tmp_path / 'projects.csv'
+    other.write_text('Project ID,Total\n')
+    empty = tmp_path / 'empty.csv'
+    empty.write_text('')
+    for path, message in ((other, 'missing required columns'), (empty, 'is empty'),
+                          (tmp_path / 'absent.csv', 'does not exist'), (tmp_path / 'export.txt', 'not a .csv')):
+        with pytest.raises(Exception, match=message):
+            validate_file(path, LAYOUTS['fund_analysis'])
+
+    with pytest.raises(Exception, match='missing required columns'):
+        validate_files([payments, other], LAYOUTS['fund_analysis'])
+
+
+@pytest.mark.parametrize('reader', ['pandas', 'pyarrow'])
+def test_read_frames(payments, reader):
+    df, = read_frames(payments, SCHEMAS['fund_analysis'], reader=reader)
+
+    assert list(df.columns) == ['usergiftid_pledge', 'paymentid', 'fund']
+    # IDs keep their leading zeros, funds are categories
+    assert df['usergiftid_pledge'].tolist() == ['0012', '0013', '0012']
+    assert df['fund'].dtype.name == 'category'
+    assert df['fund'].isna().tolist() == [False, True, False]
+
+
+def test_read_frames_in_chunks(payments):
+    chunks = list(read_frames(payments, SCHEMAS['fund_analysis'], chunksize=2))
+
+    assert [len(x) for x in chunks] == [2, 1]
+    df = concat_frames(chunks)
+    assert df['paymentid'].tolist() == ['p1', 'p2', 'p3']
+    assert df['fund'].dtype.name == 'category'
+
+
+def test_read_frames_without_schema(payments):
+    df, = read_frames(payments)
+
+    assert list(df.columns) == ['usergiftid_pledge', 'paymentid', 'fund', 'amount', 'amount.1']
+    assert df['amount.1'].tolist() == ['2', '4', '6']
+
+
+def test_concat_without_frames():
+    assert list(concat_frames([], columns=['a']).columns) == ['a']
+
+
+def test_fill_missing_and_restore_categories():
+    df = pd.DataFrame({'fund': pd.Categorical(['x', None]), 'id': ['a', None], 'plain': ['b', 'c']})
+    df = fill_missing(df)
+
+    assert df['fund'].tolist() == ['x', 'nan'] and df['id'].tolist() == ['a', 'nan']
+    df['fund'] = df['fund'].astype(object)
+    assert restore_categories(df, {'fund': 'category'})['fund'].dtype.name == 'category'
@@ -0,0 +1,52 @@
+"""
+Equivalence of the vectorized cleaning and fund analysis with the original row by row implementations kept in the
+benchmarks.
+"""
+import pytest
+from benchmarks import bench_build_dict, bench_normalize
+from benchmarks.bench_first_pass import first_pass, legacy_first_pass
+from reporter.money import to_currency
+from reporter.services.fund_report import build_dict
+
+
+@pytest.fixture(scope='module', params=[10, 80], ids=['masks', 'pair_codes'])
+def build(request):
+    data = bench_build_dict.make_data(5000, funds=request.param)
+    return data, build_dict.run(data)
+
+
+def test_build_dict(build):
+    data, grouped = build
+    legacy = bench_build_dict.legacy_build_dict(data)
+    vocabulary = grouped['vocabulary']
+
+    for key, groups in (('payment_dict', 'payment_groups'), ('pledge_dict', 'pledge_groups')):
+        decoded = grouped[groups].to_dict(vocabulary['gifts'], vocabulary['funds'])
+        assert decoded == legacy[key]
+        assert list(decoded) == list(legacy[key])
+
+
+def test_first_pass(build):
+    _, grouped = build
+    gifts, funds = grouped['vocabulary']['gifts'], grouped['vocabulary']['funds']
+    legacy = legacy_first_pass(grouped['pledge_groups'].to_dict(gifts, funds),
+                               grouped['payment_groups'].to_dict(gifts, funds))
+
+    for key, codes in first_pass(grouped).items():
+        assert gifts.decode(codes).tolist() == legacy[key]
+
+
+def test_normalize():
+    df = bench_normalize.make_data(5000, 1000)
+    legacy = bench_normalize.legacy_normalize(df.copy())
+    vector = bench_normalize.normalize(df.copy())
+
+    vector['sum_of_amount_new'] = to_currency(vector['sum_of_amount_new'].values)
+    for col in ('project_id_new', 'sum_of_amount_new'):
+        assert vector[col].equals(legacy[col])
+
+
+def test_normalize_is_faster():
+    legacy_time, vector_time = bench_normalize.compare(50000, 10000, repeat=3)
+
+    assert vector_time < legacy_time, 'vectorized {:.3f}s, legacy {:.3f}s'.format(vector_time, legacy_time)
@@ -0,0 +1,62 @@
+"""
+Memory of the chunked and sharded modes, measured on synthetic exports in subprocesses, see benchmarks/bench_memory.py.
+The peaks are compared to the in-memory runs of the same exports rather than to a number of megabytes, so the checks do
+not depend on the RSS of the libraries of the environment.
+"""
+import pytest
+from benchmarks.bench_memory import measure, reset_peak, write_exports
+
+SIZES = [50000, 200000]
+
+CHUNKSIZE = 20000
+
+# share of the in-memory peak, and of its growth from the smaller to the 4 times larger exports, allowed to a chunked
+# standard comparison, which holds the cleaned columns only and measures about half of both
+CHUNKED_SHARE = 0.75
+
+# rows per shard, the shard count grows with the exports
+SHARD_ROWS = 20000
+
+# share of the in-memory growth from the smaller to the larger exports allowed to a sharded run, which holds one shard
+# of the same size at a time. The fund analysis also indexes the payment keys of every row and grows by up to half of
+# its in-memory growth, the comparison grows by a few MB against about 150
+SHARDED_SHARE = {'fund_analysis': 0.75, 'standard_comparison': 0.25}
+
+pytestmark = pytest.mark.skipif(not reset_peak(), reason='the peak RSS of a process cannot be reset on this platform')
+
+
+@pytest.fixture(scope='module', params=['fund_analysis', 'standard_comparison'])
+def exports(request, tmp_path_factory):
+    return request.param, {rows: write_exports(tmp_path_factory.mktemp('{}_{}'.format(request.param, rows)),
+                                               request.param, rows) for rows in SIZES}
+
+
+@pytest.fixture(scope='module')
+def in_memory(exports):
+    report, files = exports
+    return {rows: measure(report, files[rows]) for rows in SIZES}
+
+
+def test_chunked_comparison_holds_cleaned_columns_only(exports, in_memory):
+    report, files = exports
+    if report != 'standard_comparison':
+        pytest.skip('the fund analysis loads its key columns only, chunks do not lower its peak')
+
+    chunked = {rows: measure(report, files[rows], CHUNKSIZE) for rows in SIZES}
+    small, large = SIZES
+
+    assert chunked[large]['digest'] == in_memory[large]['digest']
+    assert chunked[large]['peak_mb'] <= CHUNKED_SHARE * in_memory[large]['peak_mb']
+    # chunks do not bound the peak, it still grows with the rows, only slower than the in-memory one
+    assert (chunked[large]['peak_mb'] - chunked[small]['peak_mb'] <=
+            CHUNKED_SHARE * (in_memory[large]['peak_mb'] - in_memory[small]['peak_mb']))
+
+
+def test_sharded_peak_does_not_grow_with_the_rows(exports, in_memory):
+    report, files = exports
+    sharded = {rows: measure(report, files[rows], CHUNKSIZE, rows // SHARD_ROWS) for rows in SIZES}
+    small, large = SIZES
+
+    assert sharded[large]['digest'] == in_memory[large]['digest']
+    assert (sharded[large]['peak_mb'] - sharded[small]['peak_mb'] <=
+            SHARDED_SHARE[report] * (in_memory[large]['peak_mb'] - in_memory[small]['peak_mb']))
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from reporter.money import MISSING_CENTS, parse_cents, to_currency, total_cents, tolerance_cents
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('12', 1200),
+    ('+12', 1200),
+    ('-12.5', -1250),
+    ('$-4.00', -400),
+    ('-$4.00', -400),
+    ('(12.00)', -1200),
+    ('($1,000.00 USD)', -100000),
+    ('$(12.00)', -1200),
+    ('$ (12)', -1200),
+    ('USD -5', -500),
+])
+def test_signs(value, cents):
+    assert parse_cents([value]).tolist() == [cents]
+
+
+@pytest.mark.parametrize('value, cents', [
+    (' $1,234.50 USD', 123450),
+    ('1,234,567.89', 123456789),
+    ('$ 12', 1200),
+    ('12 USD', 1200),
+    ('\t12.00\xa0', 1200),
+    ('.5', 50),
+    ('12.', 1200),
+    ('007', 700),
+    ('USD 1,234.50', 123450),
+    ('USD1,234.50', 123450),
+    ('1,00', 10000),
+    ('12,34.00', 123400),
+    ('1234,567.00', 123456700),
+    ('1,234,56', 12345600),
+    ('1,,2', 1200),
+    (',5', 500),
+    ('5,', 500),
+])
+def test_separators(value, cents):
+    assert parse_cents([value]).tolist() == [cents]
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('0.125', 13),
+    ('0.124', 12),
+    ('-0.125', -13),
+    ('0.12499999', 12),
+    ('0.1250001', 13),
+    ('2.675', 268),
+    ('1.2E3', 120000),
+    ('-1e-2', -1),
+])
+def test_rounding(value, cents):
+    assert parse_cents([value]).tolist() == [cents]
+
+
+def test_largest_amount():
+    assert parse_cents(['9,999,999,999,999,999.99']).tolist() == [999999999999999999]
+    assert parse_cents(['00000000000000000000012.5']).tolist() == [1250]
+
+
+@pytest.mark.parametrize('value', ['12345678901234567', '123456789012345678', '999999999999999999999999999999999.99',
+                                   '1e30', '-1e17'])
+def test_overflow(value):
+    with pytest.raises(ValueError, match='integer digits'):
+        parse_cents(['1', value])
+
+
+@pytest.mark.parametrize('value', ['1 2 3', '12USD34', 'USD', 'USD USD 1', ',', '1.2.3', '.', '-', '$', '()', '(12',
+                                   '12)', '(-12)', '-(12)', '--1', '-$-1', '$(-12)', 'EUR 12', 'usd 1', 'abc', 'inf',
+                                   'nan'])
+def test_invalid(value):
+    with pytest.raises(ValueError, match='not currency amounts'):
+        parse_cents(['1', value])
+
+
+def test_blank_and_empty():
+    assert parse_cents(['', '  ', '1']).tolist() == [MISSING_CENTS, MISSING_CENTS, 100]
+    assert parse_cents([]).dtype == np.int64
+    assert len(parse_cents([])) == 0
+
+
+def test_currency_and_totals():
+    cents = np.array([123450, MISSING_CENTS, -5], dtype=np.int64)
+    currency = to_currency(cents)
+    assert currency[0] == 1234.5 and np.isnan(currency[1]) and currency[2] == -0.05
+    assert total_cents(cents) == 123445
+
+
+@pytest.mark.parametrize('tolerance, cents', [(0, 0), (0.01, 1), (0.29, 29), (1.005, 100)])
+def test_tolerance_cents(tolerance, cents):
+    assert tolerance_cents(tolerance) == cents
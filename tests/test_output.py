@@ -0,0 +1,76 @@
+import gzip
+import json
+import pandas as pd
+import pytest
+from reporter import output
+from reporter.money import MISSING_CENTS
+from reporter.output import OUTPUT_FORMATS, ReportWriter, report_path, write_manifest, write_report
+
+FINDINGS = pd.DataFrame({'project_id': ['a', 'b', 'c'], 'count': [1, 2, 3], 'variance': [150, -5, MISSING_CENTS]})
+
+
+def read_report(path, output_format):
+    if output_format == 'parquet':
+        return pd.read_parquet(str(path))
+    if output_format == 'jsonl':
+        return pd.read_json(str(path), lines=True, dtype={'project_id': str})
+    if output_format == 'zstd':
+        import pyarrow as pa
+        return pd.read_csv(pa.CompressedInputStream(pa.OSFile(str(path)), 'zstd'))
+
+    return pd.read_csv(str(path), compression='gzip' if output_format == 'gzip' else None)
+
+
+@pytest.mark.parametrize('output_format', OUTPUT_FORMATS)
+def test_formats(tmp_path, monkeypatch, output_format):
+    # several slices per report
+    monkeypatch.setattr(output, 'WRITE_CHUNKSIZE', 2)
+    writer = write_report(tmp_path, 'report', FINDINGS, output_format, cents=['variance'])
+
+    assert writer.path == report_path(tmp_path, 'report', output_format)
+    df = read_report(writer.path, output_format)
+    assert df[['project_id', 'count']].values.tolist() == [['a', 1], ['b', 2], ['c', 3]]
+    assert df['variance'].tolist()[:2] == [1.5, -0.05] and pd.isna(df['variance'].tolist()[2])
+
+
+def test_iterable_frames(tmp_path):
+    writer = write_report(tmp_path, 'report', (FINDINGS.iloc[i:i + 1] for i in range(3)), cents=['variance'])
+
+    assert writer.rows == 3
+    assert writer.path.read_text() == write_report(tmp_path, 'whole', FINDINGS, cents=['variance']).path.read_text()
+
+
+def test_jsonl_has_no_blank_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(output, 'WRITE_CHUNKSIZE', 1)
+    writer = write_report(tmp_path, 'report', FINDINGS, 'jsonl')
+
+    assert writer.path.read_text().count('\n') == 3
+    assert '\n\n' not in writer.path.read_text()
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'gzip'])
+def test_header_without_rows(tmp_path, output_format):
+    writer = write_report(tmp_path, 'report', FINDINGS.iloc[:0], output_format)
+
+    opener = gzip.open if output_format == 'gzip' else open
+    with opener(str(writer.path), 'rt') as f:
+        assert f.read().strip() == 'project_id,count,variance'
+
+
+def test_manifest(tmp_path):
+    writers = {'differ': write_report(tmp_path, 'differ', [FINDINGS, FINDINGS], cents=['variance'])}
+    path = write_manifest(tmp_path, 'standard_comparison', 'now', writers)
+
+    with open(str(path)) as f:
+        manifest = json.load(f)
+    entry = manifest['outputs']['differ']
+    assert manifest['report'] == 'standard_comparison'
+    assert entry['rows'] == 6 and entry['columns'] == ['project_id', 'count', 'variance']
+    # cents are totalled exactly and skip missing amounts
+    assert entry['totals'] == {'count': 12, 'variance': 2.9}
+    assert entry['bytes'] == writers['differ'].path.stat().st_size
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match='unknown output format'):
+        ReportWriter(tmp_path / 'report.xml', 'xml')
@@ -0,0 +1,106 @@
+"""
+Plans picked for small exports, with the per cell estimates scaled up so the budgets of the tests pick every plan.
+"""
+import pytest
+from reporter import planner
+from reporter.planner import Plan, plan_run, sniff_rows
+
+ROWS = 2000
+
+
+@pytest.fixture(autouse=True)
+def estimates(monkeypatch):
+    monkeypatch.setattr(planner, 'PROCESS_BYTES', 0)
+    monkeypatch.setattr(planner, 'CELL_BYTES', {'fund_analysis': 5000, 'standard_comparison': 5000})
+    monkeypatch.setattr(planner, 'MIN_CHUNKSIZE', 100)
+
+
+@pytest.fixture
+def exports(tmp_path):
+    sf = tmp_path / 'sf.csv'
+    sf.write_text('Project ID,Sum of Amount.5,Other\n' + ''.join('p{0},{0}.00,x\n'.format(i) for i in range(ROWS)))
+    re_ = tmp_path / 're.csv'
+    re_.write_text('Fund ID,Total\n' + ''.join('p{0},{0}.00\n'.format(i) for i in range(ROWS)))
+    return tmp_path
+
+
+def plan(exports, memory_budget, **args):
+    return plan_run(dict({'type': 'standard_comparison', 'file1': str(exports / 'sf.csv'),
+                          'file2': str(exports / 're.csv'), 'memory_budget': memory_budget, 'cpu_budget': 2}, **args))
+
+
+def test_in_memory(exports):
+    picked = plan(exports, 1000)
+
+    assert picked.name == 'in-memory' and picked.settings == {}
+    assert 'fits the memory budget' in picked.reason
+
+
+def test_chunked(exports):
+    picked = plan(exports, 30)
+
+    assert picked.name == 'chunked'
+    assert list(picked.settings) == ['chunksize'] and 100 <= picked.settings['chunksize'] < ROWS
+
+
+def test_sharded(exports):
+    picked = plan(exports, 10)
+
+    assert picked.name == 'sharded'
+    assert picked.settings['shards'] >= 2 and 1 <= picked.settings['workers'] <= 2
+    assert plan(exports, 10, workers=1, cpu_budget=None).settings['workers'] == 1
+
+
+def test_incremental_runs_are_not_sharded(exports):
+    picked = plan(exports, 10, state_dir='state')
+
+    assert picked.name == 'chunked' and '--state-dir' in picked.reason
+
+
+def test_forced_plan(exports):
+    picked = plan(exports, 1000, plan='sharded', shards=7)
+
+    assert picked.name == 'sharded' and picked.settings['shards'] == 7
+    # settings of the other plans are cleared
+    assert plan(exports, 1000, plan='in-memory', chunksize=500).settings == {'chunksize': None}
+
+
+def test_given_settings_are_kept(exports):
+    picked = plan(exports, 10, chunksize=500)
+
+    assert picked.name == 'given' and picked.settings == {}
+    assert picked.apply({'chunksize': 500}) == {'chunksize': 500}
+
+
+def test_missing_inputs(tmp_path):
+    picked = plan(tmp_path, 10)
+
+    assert picked.name == 'given' and 'could not be sized' in picked.reason
+
+
+def test_small_inputs_keep_the_executor_and_engine(exports):
+    picked = plan(exports, 1000, engine='dask', executor='local-dask')
+
+    assert picked.settings == {}
+    assert '--engine dask and --executor local-dask kept' in picked.reason
+    assert 'kept' not in plan(exports, 1000, executor='dask', executor_address='tcp://scheduler:8786').reason
+
+
+def test_plan_batch(exports):
+    picked = plan_run({'type': 'standard_comparison', 'dir': str(exports), 'memory_budget': 1000, 'cpu_budget': 4})
+    assert picked.name == 'batch' and picked.settings == {'workers': 1}
+
+    given = plan_run({'type': 'standard_comparison', 'dir': str(exports), 'workers': 3})
+    assert given.name == 'given' and given.settings == {}
+
+
+def test_plan_describe():
+    assert Plan('chunked', {'chunksize': 10}, 'why').describe() == 'chunked plan (chunksize=10): why'
+
+
+@pytest.mark.parametrize('text, rows', [('a,b\n', 0), ('a,b\n1,2\n3,4\n', 2), ('a,b\n1,2\n3,4', 2), ('', 0)])
+def test_sniff_rows(tmp_path, text, rows):
+    path = tmp_path / 'export.csv'
+    path.write_text(text)
+
+    assert sniff_rows(str(path), len(text)) == rows
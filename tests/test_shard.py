@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from reporter.shard import ROW_COLUMN, ShardWriter, map_shards, number_rows, order_rows, read_shard, shard_ids
+
+
+def test_equal_keys_share_a_shard():
+    left = pd.DataFrame({'key': ['a', 'b', 'c', 'd'] * 5, 'other': range(20)})
+    right = pd.DataFrame({'key': ['d', 'c', 'b', 'a']})
+    ids = dict(zip(left['key'], shard_ids(left, ['key'], 4)))
+
+    assert dict(zip(right['key'], shard_ids(right, ['key'], 4))) == ids
+    assert all(0 <= x < 4 for x in ids.values())
+    assert shard_ids(left, ['key', 'other'], 4).tolist() == shard_ids(left.copy(), ['key', 'other'], 4).tolist()
+
+
+def test_writer_round_trip(tmp_path):
+    chunks = [pd.DataFrame({'key': ['a', 'b', np.nan], 'fund': pd.Categorical(['x', 'y', 'x'])}),
+              pd.DataFrame({'key': ['c', 'a'], 'fund': pd.Categorical(['z', 'z'])})]
+    schema = {'key': str, 'fund': 'category'}
+    with ShardWriter(tmp_path, 'payments', 3) as writer:
+        for chunk in number_rows(chunks):
+            writer.write(chunk, shard_ids(chunk, ['key'], 3))
+
+    shards = [read_shard(tmp_path, 'payments', i, schema, ['key', 'fund', ROW_COLUMN]) for i in range(3)]
+    assert writer.rows.sum() == 5
+    merged = pd.concat(shards).sort_values(ROW_COLUMN)
+    assert merged[ROW_COLUMN].tolist() == [0, 1, 2, 3, 4]
+    assert merged['key'].tolist()[:2] == ['a', 'b'] and np.isnan(merged['key'].tolist()[2])
+    assert merged['fund'].astype(str).tolist() == ['x', 'y', 'x', 'z', 'z']
+    assert all(df['fund'].dtype.name == 'category' for df in shards if len(df))
+    for df in shards:
+        # rows keep their order within a shard
+        assert df[ROW_COLUMN].is_monotonic_increasing
+
+
+def test_read_missing_shard(tmp_path):
+    df = read_shard(tmp_path, 'pledge', 0, {'key': str}, ['key', ROW_COLUMN])
+
+    assert len(df) == 0 and list(df.columns) == ['key', ROW_COLUMN]
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 100])
+def test_order_rows(chunksize):
+    frames = [pd.DataFrame({'side': [0, 1], 'row': [3, 0], 'value': ['d', 'e']}),
+              pd.DataFrame({'side': [0, 0, 1], 'row': [0, 5, 2], 'value': ['a', 'f', 'g']})]
+
+    slices = list(order_rows(frames, 'side', 'row', chunksize=chunksize))
+    assert all(len(x) <= chunksize for x in slices)
+    merged = pd.concat(slices, ignore_index=True)
+    assert merged.columns.tolist() == ['value']
+    assert merged['value'].tolist() == ['a', 'd', 'f', 'e', 'g']
+
+
+def test_order_rows_without_rows():
+    slices = list(order_rows([pd.DataFrame({'row': [], 'value': []})], 'row'))
+
+    assert len(slices) == 1 and list(slices[0].columns) == ['value'] and len(slices[0]) == 0
+
+
+def test_map_shards_in_process():
+    assert map_shards(abs, 3, {'workers': 1}) == [0, 1, 2]
@@ -0,0 +1,64 @@
+import json
+import pandas as pd
+from reporter.state import HASH_COLUMN, StateStore, changed_rows, first_seen, open_state, with_hashes
+
+COLUMNS = ['key', 'value']
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_store_round_trip(tmp_path):
+    store = StateStore(tmp_path / 'state')
+    saved = with_hashes(frame([['a', '1'], ['b', '2']]), COLUMNS)
+    store.save('standard_comparison', 3, {'left': saved, 'findings': frame([])})
+
+    loaded = store.load('standard_comparison', 3)
+    assert list(loaded) == ['left', 'findings']
+    pd.testing.assert_frame_equal(loaded['left'], saved)
+    assert len(loaded['findings']) == 0
+
+
+def test_store_ignores_other_states(tmp_path):
+    store = StateStore(tmp_path)
+    assert store.load('fund_analysis', 1) is None
+
+    store.save('fund_analysis', 1, {'left': frame([['a', '1']])})
+    assert store.load('fund_analysis', 2) is None
+    assert store.load('standard_comparison', 1) is None
+
+    with open(str(tmp_path / 'state.json')) as f:
+        meta = json.load(f)
+    meta['state_version'] = -1
+    with open(str(tmp_path / 'state.json'), 'w') as f:
+        json.dump(meta, f)
+    assert store.load('fund_analysis', 1) is None
+
+
+def test_open_state(tmp_path):
+    assert open_state({}) is None
+    assert isinstance(open_state({'state_dir': str(tmp_path)}), StateStore)
+
+
+def test_changed_rows():
+    previous = with_hashes(frame([['a', '1'], ['b', '2'], ['c', '3'], ['c', '3']]), COLUMNS)
+    current = with_hashes(frame([['a', '1'], ['b', '5'], ['c', '3'], ['d', '4']]), COLUMNS)
+
+    changed = changed_rows(previous, current, COLUMNS)
+    # b changed, one of the duplicated c rows was deleted and d was added
+    assert changed.values.tolist() == [['b', '2'], ['c', '3'], ['c', '3'], ['b', '5'], ['c', '3'], ['d', '4']]
+    assert sorted(changed['key'].unique()) == ['b', 'c', 'd']
+
+
+def test_unchanged_rows():
+    previous = with_hashes(frame([['a', '1'], ['b', '2']]), COLUMNS)
+    current = with_hashes(frame([['b', '2'], ['a', '1']]), COLUMNS)
+
+    assert HASH_COLUMN in current
+    assert len(changed_rows(previous, current, COLUMNS)) == 0
+
+
+def test_first_seen():
+    order = pd.Series(['b', 'a', 'b', 'c'])
+    assert first_seen(['c', 'b', 'x'], order).tolist() == [2, 0, -1]